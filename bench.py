@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Безголовые замеры отрисовки (SDL_VIDEODRIVER=dummy) с проверкой регрессий.
+
+Примеры:
+    python bench.py --save-baseline                 # замерить и сохранить bench_baseline.json
+    python bench.py --threshold 15                  # сравнить с базой, код 1 при регрессии > 15 %
+    python bench.py --scenario storm --scenario large --out bench_results.json
+    python bench.py --gc                            # сборки gen0, блоки и временная память на кадр
+
+Для каждого сценария (размер окна, уровень воды, число зданий, плотность молний)
+меряется стоимость одного вызова Water.draw, Building.draw, Drone.draw, Lightning.draw,
+Button.draw и полного кадра игры (шаг симуляции + PlayRenderer.draw + display.update),
+а при дожде — шага и отрисовки пула частиц. --quality меряет на сниженном уровне детализации.
+--backend texture выводит кадр через рендерер SDL2: размер сценария — это размер окна, а кадр
+рисуется в поверхности screen_width × screen_height по умолчанию и масштабируется на окно.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+import main  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# name, размер окна, уровень воды (доля высоты), здания, молнии, капель дождя в секунду
+SCENARIOS = (
+    ("small", (800, 600), 0.75, 14, 0, 0),
+    ("default", (1200, 700), 0.75, 14, 1, 0),
+    ("high_water", (1200, 700), 0.30, 14, 1, 0),
+    ("large", (1920, 1080), 0.75, 14, 3, 0),
+    ("many_buildings", (1200, 700), 0.60, 500, 1, 0),
+    ("storm", (1200, 700), 0.60, 14, 25, 0),
+    ("rain", (1200, 700), 0.75, 14, 1, main.CONFIG_DEFAULTS["rain_rate"]),  # как в игре по умолчанию
+    ("downpour", (1200, 700), 0.75, 14, 1, 30000),
+)
+
+
+def measure(fn, calls_per_iter=1, repeat=5, min_time=0.05):
+    """Лучшее из repeat значений времени одного вызова, мкс. Каждый замер длится не меньше min_time."""
+    fn()  # прогрев: кэши текста, градиента и т. п.
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / (number * calls_per_iter) * 1e6
+
+
+class Scene:
+    """Экран и мир для одного сценария."""
+    def __init__(self, size, water_frac, building_count, lightning_count, rain_rate=0, seed=0, quality=0,
+                 backend="surface"):
+        if backend == "texture":
+            canvas = (main.CONFIG_DEFAULTS["screen_width"], main.CONFIG_DEFAULTS["screen_height"])
+            self.display = main.TextureDisplay(canvas, main.TITLE)
+            self.display.window.size = size
+        else:
+            self.display = main.SurfaceDisplay(size, main.TITLE)
+        self.screen = self.display.canvas
+        width, height = self.screen.get_size()
+        self.left_panel = pygame.Rect(0, 0, int(width * 0.6), height)
+        self.right_panel = pygame.Rect(self.left_panel.width, 0, width - self.left_panel.width, height)
+        self.height = height
+        self.water_frac = water_frac
+        self.building_count = building_count
+        self.lightning_count = lightning_count
+        self.rain_rate = rain_rate
+        self.particles = main.ParticleSystem(rng=main.np.random.default_rng(seed)) if rain_rate else None
+        self.seed = seed
+        self.font_small = pygame.font.Font(None, 20)
+        self.font_medium = pygame.font.Font(None, 24)
+        self.font_large = pygame.font.Font(None, 34)
+        self.btn_send = main.Button(0, 0, 320, 52, "Отправить дрона", self.font_medium)
+        self.btn_recall = main.Button(0, 0, 200, 44, "Вернуться на базу", self.font_small)
+        self.renderer = main.PlayRenderer(self.font_small, self.font_medium, self.font_large)
+        self.quality = main.QUALITY_LEVELS[quality]
+        self.renderer.set_quality(self.quality)
+        if self.particles is not None:
+            self.particles.density = self.quality["effects"]
+        self.reset()
+        # Дождь успевает долететь до воды, прежде чем начнутся замеры
+        for _ in range(60 if self.particles is not None else 0):
+            self.sim.step(1.0 / 60)
+
+    def reset(self):
+        config = dict(main.CONFIG_DEFAULTS)
+        # Молнии в бенчмарке добавляются вручную, без случайного расписания
+        config["lightning_interval_min"] = config["lightning_interval_max"] = 1e9
+        config["rain_rate"] = self.rain_rate
+        self.sim = sim = main.Simulation(config, self.left_panel, self.height,
+                                         rng=random.Random(self.seed), building_count=self.building_count)
+        sim.water.level = sim.water.prev_level = self.height * self.water_frac
+        sim.water.enable_waves()
+        # Пул частиц переходит в новую симуляцию как есть: дождь уже в установившемся режиме
+        sim.particles = self.particles
+        sim.step(1.0 / 60, main.INPUT_SEND)
+        self.lightnings = [main.Lightning(self.left_panel, sim.clock, sim.rng) for _ in range(self.lightning_count)]
+        for L in self.lightnings:
+            L.active_until = float("inf")
+        sim.lightnings = list(self.lightnings)
+        self.renderer.invalidate()
+        self.renderer.layout_buttons(self.right_panel, self.btn_send, self.btn_recall)
+        self.tick = 0
+
+    def frame(self, full=False):
+        """Полный кадр игры: тик симуляции, отрисовка, вывод на экран."""
+        sim = self.sim
+        bits = (main.INPUT_RIGHT, main.INPUT_DOWN, main.INPUT_LEFT, main.INPUT_UP)[(self.tick // 30) % 4]
+        sim.step(1.0 / 60, bits)
+        self.tick += 1
+        if sim.status != "playing" or sim.water.level < self.height * (self.water_frac - 0.05):
+            self.reset()
+        if full:
+            self.renderer.invalidate()
+        dirty = self.renderer.draw(self.screen, sim, self.left_panel, self.right_panel, 0.0, self.btn_send, self.btn_recall)
+        self.display.present(dirty)
+
+
+def run_scenario(name, size, water_frac, building_count, lightning_count, rain_rate, repeat, min_time, quality=0,
+                 backend="surface"):
+    scene = Scene(size, water_frac, building_count, lightning_count, rain_rate, quality=quality, backend=backend)
+    renderer = scene.renderer
+    font = scene.font_small if renderer.labels else None
+    sim, screen = scene.sim, scene.screen
+    visible = [b for b in sim.buildings if b.rect.top < sim.water.level] or sim.buildings[:1]
+
+    def draw_buildings():
+        for b in visible:
+            b.draw(screen, sim.water.level, font)
+
+    def draw_lightnings():
+        for L in scene.lightnings:
+            L.draw(screen)
+
+    results = {
+        "water_draw": measure(lambda: sim.water.draw(screen, scene.left_panel, font, 1.0, 0, renderer.wave_stride),
+                              1, repeat, min_time),
+        "building_draw": measure(draw_buildings, len(visible), repeat, min_time),
+        "drone_draw": measure(lambda: sim.drone.draw(screen, font), 1, repeat, min_time),
+        "button_draw": measure(lambda: scene.btn_send.draw(screen), 1, repeat, min_time),
+    }
+    if scene.lightnings:
+        results["lightning_draw"] = measure(draw_lightnings, len(scene.lightnings), repeat, min_time)
+    if scene.particles is not None:
+        particles = scene.particles
+
+        def draw_particles():
+            # Как в кадре игры: стереть прошлые штрихи и нарисовать новые, с подготовкой пула
+            particles._prepared = None
+            if particles.can_overlay(screen):
+                particles.erase(screen)
+                particles.draw_over(screen)
+            else:
+                particles.draw(screen)
+
+        results["particles_draw"] = measure(draw_particles, 1, repeat, min_time)
+        results["particles_update"] = measure(lambda: sim._update_particles(1.0 / 60), 1, repeat, min_time)
+    results["frame_incremental"] = measure(scene.frame, 1, repeat, min_time)
+    results["frame_full"] = measure(lambda: scene.frame(full=True), 1, repeat, min_time)
+    return {f"{name}/{case}": round(us, 2) for case, us in results.items()}
+
+
+def gc_pressure(name, size, water_frac, building_count, lightning_count, rain_rate, frames=600, quality=0,
+                backend="surface"):
+    """Нагрузка на сборщик мусора в установившемся режиме кадров: сборок поколения 0 на 1000 кадров,
+    прирост числа блоков памяти на кадр (нетто) и пик временной памяти внутри кадра (tracemalloc).
+    Кадры, на которых сцена начинается заново (новая Simulation), не учитываются."""
+    scene = Scene(size, water_frac, building_count, lightning_count, rain_rate, quality=quality, backend=backend)
+    for _ in range(120):  # прогрев: кэши текста, спрайтов, пулы
+        scene.frame()
+    collections = [0]
+
+    def on_gc(phase, info):
+        if phase == "start" and info["generation"] == 0:
+            collections[0] += 1
+
+    gc.collect()
+    gc.callbacks.append(on_gc)
+    counted = gen0 = blocks = 0
+    for _ in range(frames):
+        sim, before, blocks0 = scene.sim, collections[0], sys.getallocatedblocks()
+        scene.frame()
+        if scene.sim is sim:
+            counted += 1
+            gen0 += collections[0] - before
+            blocks += sys.getallocatedblocks() - blocks0
+    gc.callbacks.remove(on_gc)
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(frames, 200)):
+        tracemalloc.reset_peak()
+        sim, base = scene.sim, tracemalloc.get_traced_memory()[0]
+        scene.frame()
+        if scene.sim is sim:
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    counted = max(counted, 1)
+    return {
+        f"{name}/gc_gen0_per_1000_frames": round(gen0 * 1000.0 / counted, 2),
+        f"{name}/gc_blocks_per_frame": round(blocks / counted, 2),
+        f"{name}/gc_peak_kib_per_frame": round(peak / 1024.0, 2),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий: (ключ, база, сейчас, изменение в %)."""
+    regressions = []
+    for key, now in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None or base <= 0:
+            continue
+        change = (now - base) / base * 100.0
+        if change > threshold:
+            regressions.append((key, base, now, change))
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Безголовые замеры отрисовки «Потопа» с проверкой регрессий.")
+    parser.add_argument("--scenario", action="append", choices=[s[0] for s in SCENARIOS], help="только эти сценарии")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл базовых замеров (JSON)")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты как новую базу")
+    parser.add_argument("--threshold", type=float, default=20.0, help="допустимое замедление, %%")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="минимальная длительность одного замера, сек")
+    parser.add_argument("--out", help="дополнительно сохранить результаты в JSON")
+    parser.add_argument("--quality", type=int, default=0, choices=range(len(main.QUALITY_LEVELS)),
+                        help="уровень детализации QUALITY_LEVELS (0 — полная; база обычно снимается с 0)")
+    parser.add_argument("--backend", choices=("surface", "texture"), default="surface",
+                        help="вывод кадра: окно pygame.display или рендерер SDL2 (драйвер software)")
+    parser.add_argument("--gc", action="store_true",
+                        help="вместо замеров времени — отчёт о нагрузке на сборщик мусора в установившемся кадре")
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    pygame.font.init()
+    if args.gc:
+        for name, size, water_frac, building_count, lightning_count, rain_rate in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+            for key, value in gc_pressure(name, size, water_frac, building_count, lightning_count, rain_rate,
+                                          quality=args.quality, backend=args.backend).items():
+                print(f"{key:40s} {value:12.2f}")
+        pygame.quit()
+        return 0
+    results = {}
+    for name, size, water_frac, building_count, lightning_count, rain_rate in SCENARIOS:
+        if args.scenario and name not in args.scenario:
+            continue
+        results.update(run_scenario(name, size, water_frac, building_count, lightning_count, rain_rate,
+                                    args.repeat, args.min_time, args.quality, args.backend))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "sdl": ".".join(map(str, pygame.get_sdl_version())),
+            "machine": platform.machine(),
+            "unit": "us_per_call",
+            "quality": args.quality,
+            "backend": args.backend,
+        },
+        "results": results,
+    }
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    for key, us in sorted(results.items()):
+        base = baseline.get(key)
+        delta = f"{(us - base) / base * 100.0:+7.1f} %" if base else ""
+        print(f"{key:40s} {us:12.2f} мкс {delta}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"База сохранена: {args.baseline}")
+        return 0
+    if not baseline:
+        print("Базы нет: запустите с --save-baseline, чтобы сохранить текущие замеры.")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, base, now, change in regressions:
+        print(f"РЕГРЕССИЯ {key}: {base:.2f} -> {now:.2f} мкс ({change:+.1f} % > {args.threshold:.0f} %)")
+    pygame.quit()
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -4,15 +4,39 @@
 Последний компьютер на крыше небоскреба. Дроны ищут артефакты, вода поднимается.
 """
 
+import time
+
+STARTUP_T0 = time.perf_counter()  # отсчёт времени до первого кадра — до импорта pygame
+
 import pygame
 import random
 import math
 import json
 import os
+import atexit
+import tempfile
+import stat
+import csv
+import heapq
+import queue
+import threading
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только частицам: без него игра идёт без эффектов
+    np = None
 
 # --- Константы ---
 FPS = 60
+MAX_FRAME_TIME = 0.25  # сек: после долгого кадра симуляция не пытается догнать больше этого
 TITLE = "Потоп (Flood)"
+IDLE_WAIT_MS = 500  # вне игры цикл спит в ожидании событий не дольше этого (отложенные записи на диск)
+TEXT_CACHE_SIZE = 256
+SPRITE_CACHE_SIZE = 256  # спрайтов зданий/дрона/молний; видимых одновременно — десятки
 
 # Артефакты: название, монеты за сбор, замедляет воду (сек)
 ARTIFACTS = {
@@ -21,221 +45,1002 @@ ARTIFACTS = {
     "blueprints": ("Чертежи", 25, 0),
 }
 
-def load_config():
-    path = os.path.join(os.path.dirname(__file__), "config.json")
-    defaults = {
-        "screen_width": 1200,
-        "screen_height": 700,
-        "panel_left_width": 720,
-        "water_rise_speed": 18,
-        "water_slow_duration": 10,
-        "water_slow_factor": 0.3,
-        "drone_speed": 4,
-        "wind_strength": 2.0,
-        "lightning_interval_min": 1.5,
-        "lightning_interval_max": 4.0,
-        "high_score": 0,
-        "coins": 0,
-        "drone_speed_bonus": 0,
-        "energy_max_bonus": 0,
-        "slow_duration_bonus": 0,
-    }
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+CONFIG_FLUSH_INTERVAL = 2.0  # сек: изменения копятся в памяти и пишутся на диск пачкой
+FONT_DIR = os.path.join(os.path.dirname(__file__), "fonts")  # необязательные шрифты при игре: <имя>.ttf
+FONT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "font_cache.json")
+RUN_LOG_PATH = os.path.join(os.path.dirname(__file__), "runs.jsonl")
+RUN_INDEX_PATH = os.path.join(os.path.dirname(__file__), "runs_index.json")
+RUN_LOG_FLUSH_INTERVAL = 5.0  # сек: записи забегов копятся в памяти и дописываются в журнал пачкой
+RUN_LOG_FSYNC_INTERVAL = 30.0  # сек: как часто журнал принудительно сбрасывается на диск
+RUN_INDEX_TOP = 20  # лучших забегов в индексе
+RUN_TIME_BUCKET = 0.1  # сек: точность перцентилей времени выживания
+
+# Параметры баланса: по ним забеги группируются в журнале, их перебирает sweep.py
+BALANCE_KEYS = (
+    "water_rise_speed",
+    "water_slow_factor",
+    "water_slow_duration",
+    "wind_strength",
+    "drone_speed",
+    "lightning_interval_min",
+    "lightning_interval_max",
+    "drone_speed_bonus",
+    "energy_max_bonus",
+    "slow_duration_bonus",
+    "endless_scroll_speed",
+)
+
+CONFIG_DEFAULTS = {
+    "screen_width": 1200,
+    "screen_height": 700,
+    "panel_left_width": 720,
+    "water_rise_speed": 18,
+    "water_slow_duration": 10,
+    "water_slow_factor": 0.3,
+    "drone_speed": 4,
+    "wind_strength": 2.0,
+    "lightning_interval_min": 1.5,
+    "lightning_interval_max": 4.0,
+    "high_score": 0,
+    "coins": 0,
+    "drone_speed_bonus": 0,
+    "energy_max_bonus": 0,
+    "slow_duration_bonus": 0,
+    "tick_rate": 60,  # шагов симуляции в секунду, не зависит от частоты кадров
+    "render_fps": FPS,  # ограничение кадров в секунду; 0 — без ограничения
+    "profiler": False,  # собирать замеры фаз кадра с запуска (F3 — оверлей)
+    "profiler_dump": "",  # путь .json/.csv: сохранить трассу профилировщика при выходе
+    "world_mode": "level",  # "level" — один экран зданий; "endless" — бесконечный вертикальный скроллер
+    "world_seed": None,  # зерно генерации чанков бесконечного режима; None — случайное
+    "endless_scroll_speed": 14,  # px/с: скорость подъёма камеры в бесконечном режиме
+    "rng_seed": None,  # зерно генератора игры; None — новое случайное зерно в каждой игре
+    "record_replay": "",  # путь .rec: записывать ввод каждой игры для replay.py
+    "particles": True,  # дождь, брызги, искры молний, след дрона (нужен NumPy)
+    "particle_capacity": 40000,  # размер пула частиц
+    "rain_rate": 900,  # капель дождя в секунду
+    "water_waves": True,  # волны на поверхности воды (нужен NumPy)
+    "water_wave_step": 12,  # px между узлами поверхности воды: меньше — глаже и дороже
+    "quality": "auto",  # "auto" — снижать детализацию, чтобы держать render_fps; число — фиксированный уровень QUALITY_LEVELS
+    "autopilot": False,  # дрон летает сам (F2 в игре — включить/выключить)
+    "autopilot_budget_ms": 1.0,  # время на планирование маршрута за кадр
+    "render_backend": "surface",  # "surface" — окно pygame.display; "texture" — рендерер SDL2, кадр масштабируется на окно
+    "render_driver": "software",  # драйвер рендерера SDL2 для "texture" ("software", "opengl", ...; "auto" — выбор SDL)
+}
+
+
+class ConfigStore:
+    """Настройки и прогресс в памяти: файл читается один раз, изменения пишутся отложенно
+    (запись во временный файл и атомарная замена)."""
+    def __init__(self, path, defaults, flush_interval=CONFIG_FLUSH_INTERVAL):
+        self.path = path
+        self.defaults = defaults
+        self.flush_interval = flush_interval
+        self._data = None  # только то, что лежит в файле (без значений по умолчанию)
+        self._dirty_since = None
+        self.writes = 0
+
+    def _ensure_loaded(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._data = {}
+
+    def get(self, key, default=None):
+        self._ensure_loaded()
+        if key in self._data:
+            return self._data[key]
+        return self.defaults.get(key, default)
+
+    def snapshot(self):
+        self._ensure_loaded()
+        data = dict(self.defaults)
+        data.update(self._data)
+        return data
+
+    def update(self, data_update):
+        self._ensure_loaded()
+        self._data.update(data_update)
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+
+    @property
+    def dirty(self):
+        return self._dirty_since is not None
+
+    def maybe_flush(self):
+        if self._dirty_since is not None and time.monotonic() - self._dirty_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._dirty_since is None:
+            return
+        write_json_atomic(self.path, self._data)
+        self._dirty_since = None
+        self.writes += 1
+
+
+def _read_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# umask читается один раз при импорте, пока потоков ещё нет: временная смена umask в фоновом
+# потоке (журнал забегов) дала бы файлам, создаваемым в это время в главном, права 0666
+_UMASK = _read_umask()
+
+
+def _replacement_mode(path):
+    """Права для файла, которым заменяется path: как у прежнего, а для нового — 0666 с учётом umask."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            defaults.update(data)
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
-    return defaults
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~_UMASK
 
-def save_config(data_update):
-    path = os.path.join(os.path.dirname(__file__), "config.json")
+
+def write_json_atomic(path, data, fsync=True):
+    """Записать JSON во временный файл рядом и атомарно заменить им path."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.splitext(os.path.basename(path))[0] + "-", suffix=".tmp", dir=directory)
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        data = {}
-    data.update(data_update)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        # mkstemp создаёт файл с 0600, а replace сохранил бы эти права за path
+        os.chmod(tmp_path, _replacement_mode(path))
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+CONFIG_STORE = ConfigStore(CONFIG_PATH, CONFIG_DEFAULTS)
+atexit.register(CONFIG_STORE.flush)
+
+
+def load_config():
+    return CONFIG_STORE.snapshot()
+
+def save_config(data_update):
+    CONFIG_STORE.update(data_update)
 
 def save_high_score(score):
-    save_config({"high_score": max(load_config().get("high_score", 0), int(score))})
+    save_config({"high_score": max(CONFIG_STORE.get("high_score", 0), int(score))})
+
+
+def config_key(config):
+    """Короткий ключ набора параметров баланса — для группировки забегов."""
+    params = {k: config.get(k) for k in BALANCE_KEYS}
+    params["world_mode"] = config.get("world_mode", "level")
+    return "%08x" % (zlib.crc32(json.dumps(params, sort_keys=True).encode("utf-8")) & 0xFFFFFFFF), params
+
+
+class RunLog:
+    """Журнал забегов: JSONL только на дописывание плюс индекс с готовыми ответами.
+    append() только ставит запись в очередь: индекс, запись в журнал пачкой раз в flush_interval,
+    fsync раз в fsync_interval и перезапись индекса делает фоновый поток, так что кадр игры
+    диска не ждёт. Индекс (лучшие забеги, гистограммы для перцентилей, сводка по наборам
+    параметров) помнит, до какого байта журнала он досчитан: при открытии дочитывается только хвост."""
+    def __init__(self, path=RUN_LOG_PATH, index_path=RUN_INDEX_PATH,
+                 flush_interval=RUN_LOG_FLUSH_INTERVAL, fsync_interval=RUN_LOG_FSYNC_INTERVAL):
+        self.path = path
+        self.index_path = index_path
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self._pending = []  # строки JSONL, ещё не записанные в журнал (только фоновый поток)
+        self._pending_since = None
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._unsynced = False  # в журнал писали после последнего fsync
+        self._index = None
+        self._lock = threading.Lock()  # индекс: фоновый поток дополняет, запросы читают
+        self._jobs = None  # очередь фонового потока: запись, Event (flush ждёт) или None (остановка)
+        self._thread = None
+
+    # --- Индекс ---
+    @staticmethod
+    def _empty_index():
+        return {"log_bytes": 0, "runs": 0, "top_time": [], "top_coins": [],
+                "hist_time": {}, "hist_coins": {}, "configs": {}}
+
+    def _ensure_index(self):
+        """Загрузить индекс и дочитать хвост журнала; вызывать под self._lock."""
+        if self._index is not None:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = self._empty_index()
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if index.get("log_bytes", 0) > size:
+            index = self._empty_index()  # журнал заменён или обрезан — пересчитать целиком
+        self._index = index
+        if index["log_bytes"] < size:
+            with open(self.path, "rb") as f:
+                f.seek(index["log_bytes"])
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # недописанная строка после сбоя
+                    index["log_bytes"] += len(line)
+                    try:
+                        self._add_to_index(json.loads(line))
+                    except ValueError:
+                        continue
+
+    def _add_to_index(self, record):
+        index = self._index
+        index["runs"] += 1
+        brief = {k: record[k] for k in ("time", "coins", "status", "config", "ts")}
+        for field, top in (("time", index["top_time"]), ("coins", index["top_coins"])):
+            top.append(brief)
+            top.sort(key=lambda r: -r[field])
+            del top[RUN_INDEX_TOP:]
+        # Через миллисекунды: 0.7 / 0.1 в плавающей точке дало бы корзину 6
+        bucket = str(int(round(record["time"] * 1000)) // int(round(RUN_TIME_BUCKET * 1000)))
+        index["hist_time"][bucket] = index["hist_time"].get(bucket, 0) + 1
+        coins = str(record["coins"])
+        index["hist_coins"][coins] = index["hist_coins"].get(coins, 0) + 1
+        agg = index["configs"].get(record["config"])
+        if agg is None:
+            agg = index["configs"][record["config"]] = {
+                "params": record["params"], "runs": 0, "completed": 0,
+                "time_sum": 0.0, "time_max": 0.0, "coins_sum": 0, "coins_max": 0, "drones_lost": 0,
+            }
+        agg["runs"] += 1
+        agg["completed"] += record["status"] == "level_complete"
+        agg["time_sum"] += record["time"]
+        agg["time_max"] = max(agg["time_max"], record["time"])
+        agg["coins_sum"] += record["coins"]
+        agg["coins_max"] = max(agg["coins_max"], record["coins"])
+        agg["drones_lost"] += record["drones_lost"]
+
+    # --- Запись (фоновый поток) ---
+    def append(self, record):
+        """Добавить забег. Не ждёт ни диска, ни индекса: запись уходит в очередь фонового потока."""
+        if self._thread is None:
+            self._jobs = queue.Queue()
+            self._thread = threading.Thread(target=self._worker, name="run-log", daemon=True)
+            self._thread.start()
+        self._jobs.put(record)
+
+    def _worker(self):
+        while True:
+            # Просыпаться к сроку записи пачки и, пока есть несинхронизированное, к сроку fsync
+            deadline = None
+            if self._pending_since is not None:
+                deadline = self._pending_since + self.flush_interval
+            if self._unsynced:
+                sync_at = self._last_fsync + self.fsync_interval
+                deadline = sync_at if deadline is None else min(deadline, sync_at)
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                job = self._jobs.get(timeout=timeout)
+            except queue.Empty:
+                self._write_safe(time.monotonic() - self._last_fsync >= self.fsync_interval)
+                continue
+            if isinstance(job, dict):
+                self._pending.append((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+                with self._lock:
+                    self._ensure_index()
+                    self._add_to_index(job)
+                continue
+            try:
+                self._write_safe(True)
+            finally:
+                if job is not None:
+                    job.set()
+            if job is None:
+                return
+
+    def _write_safe(self, sync):
+        try:
+            self._write(sync)
+        except OSError as e:
+            # Записи остаются в очереди на запись до следующей попытки
+            print(f"Журнал забегов не записан ({e})")
+
+    def _write(self, sync):
+        if self._pending:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+                if self._file.tell():
+                    with open(self.path, "rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self._file.write(b"\n")  # оборванная при сбое строка не склеится с новой
+            self._file.write(b"".join(self._pending))
+            self._file.flush()
+            self._pending = []
+            self._pending_since = None
+            self._unsynced = True
+            with self._lock:
+                self._index["log_bytes"] = self._file.tell()
+            self.save_index()
+        if sync and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+            self._unsynced = False
+
+    def flush(self):
+        """Дождаться записи всего добавленного в журнал и индекс (с fsync)."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._jobs.put(done)
+        done.wait()
+
+    def save_index(self):
+        # Без fsync: после сбоя индекс дочитает хвост журнала сам
+        with self._lock:
+            self._ensure_index()
+            write_json_atomic(self.index_path, self._index, fsync=False)
+
+    def close(self):
+        """Записать оставшееся и остановить фоновый поток (при выходе из игры)."""
+        if self._thread is not None:
+            self._jobs.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # --- Запросы по индексу (без чтения журнала) ---
+    # Видят записи, которые фоновый поток уже учёл; после append — сначала flush()
+    @property
+    def runs(self):
+        with self._lock:
+            self._ensure_index()
+            return self._index["runs"]
+
+    def top(self, n=10, by="time"):
+        with self._lock:
+            self._ensure_index()
+            return list(self._index["top_" + by][:n])
+
+    def percentile(self, q, by="time"):
+        """Перцентиль по ближайшему рангу из гистограммы; для времени — с точностью RUN_TIME_BUCKET."""
+        with self._lock:
+            self._ensure_index()
+            hist = dict(self._index["hist_" + by])
+        total = sum(hist.values())
+        if not total:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * total)))
+        seen = 0
+        for key in sorted(hist, key=int):
+            seen += hist[key]
+            if seen >= rank:
+                return round(int(key) * RUN_TIME_BUCKET, 3) if by == "time" else int(key)
+        return 0.0
+
+    def by_config(self):
+        """Сводка по наборам параметров: ключ -> параметры, число забегов, средние и максимумы."""
+        with self._lock:
+            self._ensure_index()
+            out = {}
+            for key, agg in self._index["configs"].items():
+                runs = agg["runs"]
+                out[key] = dict(agg, time_mean=agg["time_sum"] / runs, coins_mean=agg["coins_sum"] / runs,
+                                complete_rate=agg["completed"] / runs)
+        return out
+
+
+RUN_LOG = RunLog()
+atexit.register(RUN_LOG.close)
+
+
+def run_record(config, sim, seed):
+    """Запись журнала забегов для законченной (или прерванной) игры; config — тот, с которым создана sim."""
+    key, params = config_key(config)
+    return {
+        "ts": round(time.time(), 3),
+        "status": sim.status,
+        "time": round(sim.time, 3),
+        "coins": sim.coins_earned,
+        "artifacts": sim.artifacts_collected,
+        "drones_lost": sim.drones_lost,
+        "seed": seed,
+        "config": key,
+        "params": params,
+    }
+
+
+class TextCache:
+    """LRU-кэш отрисованного текста: ключ — (шрифт, текст, сглаживание, цвет).
+    Постоянные подписи используются каждый кадр и не вытесняются; меняющиеся строки HUD
+    (таймер, энергия) быстро устаревают и вытесняются первыми, так что память ограничена."""
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, tuple(color))
+        surf = self._items.get(key)
+        if surf is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self._items[key] = surf
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items), "max_size": self.max_size}
+
+
+TEXT_CACHE = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    """Отрисовать текст через общий кэш. Возвращаемую поверхность нельзя изменять."""
+    return TEXT_CACHE.render(font, text, antialias, color)
+
+
+_font_paths = None  # имя шрифта -> путь к файлу ("" — шрифт pygame по умолчанию)
+
+
+def resolve_font_path(name):
+    """Файл шрифта по имени без перебора системных шрифтов при каждом запуске.
+    Сначала шрифт из FONT_DIR, затем FONT_CACHE_PATH; только при промахе — pygame.font.match_font
+    (fontconfig), результат которого сохраняется в кэш. Удалите font_cache.json, чтобы найти заново."""
+    global _font_paths
+    for filename in (name + ".ttf", name.lower() + ".ttf"):
+        bundled = os.path.join(FONT_DIR, filename)
+        if os.path.isfile(bundled):
+            return bundled
+    if _font_paths is None:
+        try:
+            with open(FONT_CACHE_PATH, "r", encoding="utf-8") as f:
+                _font_paths = json.load(f)
+        except (OSError, ValueError):
+            _font_paths = {}
+    path = _font_paths.get(name)
+    if path is None or (path and not os.path.isfile(path)):
+        path = pygame.font.match_font(name) or ""
+        _font_paths[name] = path
+        try:
+            with open(FONT_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump(_font_paths, f, indent=2, ensure_ascii=False)
+        except OSError:
+            pass  # кэш не обязателен: в следующий раз шрифт найдётся заново
+    return path
+
+
+def load_font(name, size):
+    """Замена pygame.font.SysFont(name, size) с кэшем пути к файлу шрифта."""
+    return pygame.font.Font(resolve_font_path(name) or None, size)
+
+
+ARTIFACT_COLORS = {"solar_panel": (220, 180, 40), "seeds": (80, 160, 80), "blueprints": (100, 140, 200)}
+BUILDING_BODY_H = 80  # стена здания под крышей
+
+
+def _convert(surf, alpha):
+    """convert()/convert_alpha() под формат экрана, если окно уже создано."""
+    if pygame.display.get_surface() is None:
+        return surf
+    return surf.convert_alpha() if alpha else surf.convert()
+
+
+class SpriteCache:
+    """Заранее отрисованные спрайты дрона, зданий и молний; ключ — размер, тип и состояние.
+    Подписи сюда не входят: они берутся из TEXT_CACHE и накладываются отдельно.
+    LRU, как TEXT_CACHE: в бесконечном режиме размеров зданий тысячи, а видны из них десятки,
+    так что ушедшие за край спрайты вытесняются и память не растёт."""
+    def __init__(self, max_size=SPRITE_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        surf = self._items.get(key)
+        if surf is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return surf
+
+    def _put(self, key, surf):
+        self._items[key] = surf
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items), "max_size": self.max_size}
+
+    def drone(self, radius):
+        """Спрайт дрона; центр корпуса в точке (radius + 12, radius + 12)."""
+        key = ("drone", radius)
+        surf = self._get(key)
+        if surf is None:
+            r = radius
+            c = r + 12  # лучи r + 6 и пропеллеры радиусом 6
+            surf = pygame.Surface((c * 2 + 1, c * 2 + 1), pygame.SRCALPHA)
+            body_rect = pygame.Rect(c - r - 4, c - r // 2, r * 2 + 8, r)
+            pygame.draw.ellipse(surf, (220, 225, 235), body_rect)
+            pygame.draw.ellipse(surf, (100, 105, 115), body_rect, 2)
+            for angle in (0, math.pi / 2, math.pi, 3 * math.pi / 2):
+                ax = c + (r + 6) * math.cos(angle)
+                ay = c + (r + 6) * math.sin(angle)
+                pygame.draw.line(surf, (120, 125, 135), (c, c), (ax, ay), 3)
+                pygame.draw.circle(surf, (180, 185, 195), (int(ax), int(ay)), 6)
+                pygame.draw.circle(surf, (90, 95, 100), (int(ax), int(ay)), 6, 1)
+            surf = self._put(key, _convert(surf, True))
+        return surf
+
+    def building(self, width, height, artifact):
+        """Крыша с корпусом под ней; artifact=None — без ящика (пусто или уже собрано)."""
+        key = ("building", width, height, artifact)
+        surf = self._get(key)
+        if surf is None:
+            surf = pygame.Surface((width, height + BUILDING_BODY_H))
+            surf.fill((50, 55, 65))
+            roof = pygame.Rect(0, 0, width, height)
+            pygame.draw.rect(surf, (90, 95, 105), roof)
+            pygame.draw.rect(surf, (140, 145, 155), roof, 3)
+            if artifact:
+                c = ARTIFACT_COLORS.get(artifact, (200, 200, 200))
+                box = (roof.centerx - 14, roof.centery - 14, 28, 28)
+                pygame.draw.rect(surf, c, box)
+                pygame.draw.rect(surf, (255, 255, 255), box, 2)
+            surf = self._put(key, _convert(surf, False))
+        return surf
+
+    def lightning(self, width, height):
+        """Вспышка молнии вместе с белой каймой по 2px слева и справа."""
+        key = ("lightning", width, height)
+        surf = self._get(key)
+        if surf is None:
+            surf = pygame.Surface((width + 4, height))
+            surf.fill((255, 255, 255))
+            surf = self._put(key, _convert(surf, False))
+        return surf
+
+
+SPRITES = SpriteCache()
+
+
+# Биты ввода за тик: то, что читает Drone.update, плюс клики «отправить»/«вернуть»
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+INPUT_SEND = 16
+INPUT_RECALL = 32
+
+DRONE_ENERGY_COST = 15  # энергия за вылет и прибавка за собранный артефакт
+
+
+def read_input_bits(keys):
+    """Состояние клавиатуры (pygame.key.get_pressed) -> биты INPUT_*."""
+    bits = 0
+    if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        bits |= INPUT_LEFT
+    if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        bits |= INPUT_RIGHT
+    if keys[pygame.K_UP] or keys[pygame.K_w]:
+        bits |= INPUT_UP
+    if keys[pygame.K_DOWN] or keys[pygame.K_s]:
+        bits |= INPUT_DOWN
+    return bits
+
+
+class PygameClock:
+    """Реальное время по pygame.time.get_ticks(), в секундах."""
+    def now(self):
+        return pygame.time.get_ticks() / 1000.0
+
+
+class SimClock:
+    """Время симуляции в секундах: идёт только через advance(), не зависит от реального."""
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def advance(self, dt_sec):
+        self.time += dt_sec
+
+
+# Поверхность воды: цепочка узлов на пружинах (смещение от уровня, px; вниз — плюс)
+WAVE_SPEED = 160.0  # px/с: скорость бега волны вдоль поверхности
+WAVE_TENSION = 40.0  # 1/с²: пружина, возвращающая узел к уровню воды
+WAVE_DAMPING = 2.2  # 1/с: затухание
+WAVE_MAX = 12  # px: предел смещения узла (на нём держатся грязные прямоугольники отрисовки)
 
 
 class Water:
     """Уровень воды: поднимается в реальном времени, можно замедлить (солнечная панель)."""
-    def __init__(self, config, screen_height):
+    __slots__ = ("config", "clock", "screen_height", "level", "prev_level", "rise_speed", "slow_until", "slowed",
+                 "slow_factor", "_gradient_size", "_gradient_strip", "_gradient_height", "wave_step", "wave_x0", "_span_width", "_waves", "wave_h", "wave_v", "_wave_pad", "_wave_lap",
+                 "_wave_y", "_wave_px", "_wave_swell", "_rect", "_below")
+
+    def __init__(self, config, screen_height, clock=None):
         self.config = config
+        self.clock = clock or PygameClock()
         self.screen_height = screen_height
         # В Pygame Y растёт вниз: меньше Y = выше. Вода «поднимается», когда level уменьшается.
         self.level = screen_height * 0.75  # старт внизу экрана, есть запас до крыши
+        self.prev_level = self.level  # уровень на прошлом тике, для интерполяции при отрисовке
         self.rise_speed = max(10.0, float(config.get("water_rise_speed", 18)))
         self.slow_until = 0
+        self.slowed = False  # окно замедления; закрывает его событие планировщика (см. end_slow)
         self.slow_factor = config["water_slow_factor"]
+        # Кэш градиента: буфер полосы во всю панель (пересоздаётся при изменении её размера),
+        # закрашенный для последней высоты воды в пикселях — градиент растянут на всю глубину
+        self._gradient_size = None
+        self._gradient_strip = None
+        self._gradient_height = None
+        # Волны: смещения и скорости узлов в массивах NumPy, шаг — vectorized для всей поверхности.
+        # На ход игры не влияют, поэтому их включает вид (enable_waves), как частицы; None — без волн
+        # (не включены, нет NumPy или "water_waves": false): рисуется прежняя синусоида
+        self.wave_step = max(2, int(config.get("water_wave_step", 12)))
+        self.wave_x0 = 0
+        self._span_width = None
+        self._waves = False
+        self.wave_h = None
+        self.wave_v = None
+        self._wave_pad = None  # wave_h с узлом-отражением на каждом краю
+        self._wave_lap = None
+        self._wave_y = None
+        self._wave_px = None  # X узлов на экране (список — для draw.lines без преобразований)
+        self._wave_swell = None
+        # Прямоугольники кадра обновляются на месте, а не создаются заново
+        self._rect = pygame.Rect(0, 0, 0, 0)
+        self._below = pygame.Rect(0, 0, 0, 0)
+
+    def set_span(self, x, width):
+        """Горизонтальные границы поверхности; узлы пересоздаются при смене ширины."""
+        self.wave_x0 = x
+        self._span_width = width
+        if not self._waves or np is None or not self.config.get("water_waves", True):
+            return
+        n = width // self.wave_step + 2  # последний узел — за правым краем панели
+        if self.wave_h is None or len(self.wave_h) != n:
+            self._wave_pad = np.zeros(n + 2)
+            self.wave_h = self._wave_pad[1:-1]
+            self.wave_v = np.zeros(n)
+            self._wave_lap = np.empty(n)
+            self._wave_y = np.empty(n)
+        px = x + np.arange(n) * self.wave_step
+        self._wave_px = np.minimum(px, x + width).tolist()
+        # Зыбь 2·sin(0.02x + t) + 1.5·sin(0.01x + 1.3t), разложенная по синусам и косинусам фазы:
+        # на кадре остаётся одно умножение вектора на эту матрицу
+        self._wave_swell = np.array((2 * np.cos(px * 0.02), 2 * np.sin(px * 0.02),
+                                     1.5 * np.cos(px * 0.01), 1.5 * np.sin(px * 0.01)))
+
+    def enable_waves(self):
+        """Считать волны на каждом шаге. Нужны только для картинки: безголовые прогоны (sweep,
+        повтор без окна, тесты) их не включают и не тратят на них время."""
+        self._waves = True
+        if self._span_width is not None:
+            self.set_span(self.wave_x0, self._span_width)
+
+    def disturb(self, x, impulse, width=0):
+        """Толкнуть поверхность в полосе x ± width/2: impulse — скорость узлов, px/с (плюс — вниз)."""
+        if self.wave_v is None:
+            return
+        step = self.wave_step
+        i0 = max(0, int((x - width / 2 - self.wave_x0) // step))
+        i1 = min(len(self.wave_v), int((x + width / 2 - self.wave_x0) // step) + 1)
+        if i0 < i1:
+            self.wave_v[i0:i1] += impulse
+
+    def disturb_at(self, xs, impulse):
+        """disturb для массива точек (капли дождя) одним вызовом."""
+        if self.wave_v is None or not len(xs):
+            return
+        idx = np.clip(((xs - self.wave_x0) // self.wave_step).astype(np.intp), 0, len(self.wave_v) - 1)
+        np.add.at(self.wave_v, idx, impulse)
+
+    def _step_waves(self, dt_sec):
+        pad, h, v, acc = self._wave_pad, self.wave_h, self.wave_v, self._wave_lap
+        spread = (WAVE_SPEED / self.wave_step) ** 2
+        # Полунеявный Эйлер устойчив при dt·ω < 2; с запасом дробим тик на подшаги
+        omega = math.sqrt(4 * spread + WAVE_TENSION)
+        steps = max(1, math.ceil(dt_sec * omega))
+        dt = dt_sec / steps
+        for _ in range(steps):
+            # Края отражают волну: соседи крайних узлов — они сами
+            pad[0] = pad[1]
+            pad[-1] = pad[-2]
+            # v += (spread·(левый + правый − 2h) − tension·h − damping·v)·dt
+            np.add(pad[:-2], pad[2:], out=acc)
+            acc *= spread * dt
+            acc -= h * ((2 * spread + WAVE_TENSION) * dt)
+            v *= 1.0 - WAVE_DAMPING * dt
+            v += acc
+            h += v * dt
+        np.minimum(h, WAVE_MAX, out=h)
+        np.maximum(h, -WAVE_MAX, out=h)
+
+    @staticmethod
+    def _gradient_column(height, rows, surface):
+        """Столбец 1×rows верхних строк градиента для воды высотой height — те же цвета, что давал
+        прежний построчный цикл: строка i снизу — t = i / height, цвет усечён до целого."""
+        color_dark = (25, 50, 95)
+        color_surface = (40, 80, 150)
+        col = pygame.Surface((1, rows), 0, surface)
+        if np is not None:
+            t = np.arange(height - 1, height - 1 - rows, -1) / height
+            rgb = np.add(color_dark, np.subtract(color_surface, color_dark) * t[:, None]).astype(np.intp)
+            pygame.surfarray.blit_array(col, rgb.reshape(1, rows, 3))
+            return col
+        for y in range(rows):
+            t = (height - 1 - y) / height
+            col.set_at((0, y), (
+                int(color_dark[0] + (color_surface[0] - color_dark[0]) * t),
+                int(color_dark[1] + (color_surface[1] - color_dark[1]) * t),
+                int(color_dark[2] + (color_surface[2] - color_dark[2]) * t),
+            ))
+        return col
+
+    def _draw_gradient(self, surface, water_rect, left_panel_rect):
+        size = (left_panel_rect.width, left_panel_rect.height)
+        if self._gradient_size != size:
+            self._gradient_size = size
+            self._gradient_height = None
+            # +1 по ширине: draw.line рисовал и правую конечную точку
+            self._gradient_strip = pygame.Surface((size[0] + 1, max(size[1], 1)), 0, surface)
+        h = min(water_rect.height, self._gradient_strip.get_height())
+        if h <= 0:
+            return
+        if self._gradient_height != water_rect.height:
+            # Полоса перекрашивается, только когда высота воды меняется на пиксель: столбец
+            # считается векторно и растягивается по ширине без интерполяции
+            self._gradient_height = water_rect.height
+            col = self._gradient_column(water_rect.height, h, surface)
+            pygame.transform.scale(col, (size[0] + 1, h), self._gradient_strip.subsurface((0, 0, size[0] + 1, h)))
+        # Прежний цикл закрашивал строки с top + 1 по bottom включительно
+        surface.blit(self._gradient_strip, (water_rect.x, water_rect.top + 1), (0, 0, water_rect.width + 1, h))
 
     def update(self, dt_sec):
-        if pygame.time.get_ticks() / 1000.0 < self.slow_until:
+        self.prev_level = self.level
+        if self.slowed:
             speed = self.rise_speed * self.slow_factor
         else:
             speed = self.rise_speed
         # Вода поднимается: уменьшаем Y (пикселей в секунду — заметно)
         self.level -= speed * dt_sec
+        if self.wave_h is not None:
+            self._step_waves(dt_sec)
 
     def apply_solar_panel(self):
-        self.slow_until = pygame.time.get_ticks() / 1000.0 + self.config["water_slow_duration"]
-
-    def draw(self, surface, left_panel_rect, font=None):
-        # Вода — градиент от тёмно-синего к поверхности
-        water_rect = pygame.Rect(
-            left_panel_rect.x,
-            int(self.level),
-            left_panel_rect.width,
-            left_panel_rect.bottom - int(self.level),
-        )
+        """Открыть (или продлить) окно замедления. Возвращает момент его конца."""
+        self.slow_until = self.clock.now() + self.config["water_slow_duration"]
+        self.slowed = True
+        return self.slow_until
+
+    def end_slow(self, until):
+        # Окно, продлённое новой панелью, закроет уже следующее событие
+        if until == self.slow_until:
+            self.slowed = False
+
+    def render_level(self, alpha=1.0):
+        """Уровень между прошлым и текущим тиком (alpha от 0 до 1)."""
+        return self.prev_level + (self.level - self.prev_level) * alpha
+
+    def draw(self, surface, left_panel_rect, font=None, alpha=1.0, offset_y=0, stride=1):
+        # Вода — градиент от тёмно-синего к поверхности; offset_y — Y мира у верхнего края экрана.
+        # stride — рисовать каждый stride-й узел линии волны (уровень качества)
+        level = int(self.render_level(alpha) - offset_y)
+        water_rect = self._rect
+        water_rect.update(left_panel_rect.x, level, left_panel_rect.width, left_panel_rect.bottom - level)
         if water_rect.height <= 0:
             return
-        color_dark = (25, 50, 95)
-        color_surface = (40, 80, 150)
-        for i in range(water_rect.height):
-            t = i / max(water_rect.height, 1)
-            r = int(color_dark[0] + (color_surface[0] - color_dark[0]) * t)
-            g = int(color_dark[1] + (color_surface[1] - color_dark[1]) * t)
-            b = int(color_dark[2] + (color_surface[2] - color_dark[2]) * t)
-            pygame.draw.line(
-                surface,
-                (r, g, b),
-                (water_rect.x, water_rect.bottom - i),
-                (water_rect.right, water_rect.bottom - i),
-            )
-        # Линия горизонта воды — слегка волнистая, чтобы видно было подъём
         y_line = water_rect.top
-        t = pygame.time.get_ticks() / 200.0
-        pts = []
-        for px in range(water_rect.x, water_rect.right + 1, 12):
-            wave = 2 * math.sin(px * 0.02 + t) + 1.5 * math.sin(px * 0.01 + t * 1.3)
-            pts.append((px, int(y_line + wave)))
+        t = self.clock.now() * 5.0
+        if self.wave_h is not None:
+            pts = self._draw_waves(surface, water_rect, left_panel_rect, t, stride)
+        else:
+            self._draw_gradient(surface, water_rect, left_panel_rect)
+            # Линия горизонта воды — слегка волнистая, чтобы видно было подъём
+            pts = []
+            for px in range(water_rect.x, water_rect.right + 1, 12 * stride):
+                wave = 2 * math.sin(px * 0.02 + t) + 1.5 * math.sin(px * 0.01 + t * 1.3)
+                pts.append((px, int(y_line + wave)))
         if len(pts) >= 2:
             pygame.draw.lines(surface, (180, 210, 255), False, pts, 2)
             pygame.draw.lines(surface, (100, 150, 220), False, pts, 1)
         if font:
-            label = font.render("УРОВЕНЬ ВОДЫ ↑ поднимается", True, (220, 240, 255))
+            label = render_text(font, "УРОВЕНЬ ВОДЫ ↑ поднимается", (220, 240, 255))
             surface.blit(label, (water_rect.x + 12, y_line - 22))
 
+    def _draw_waves(self, surface, water_rect, left_panel_rect, t, stride=1):
+        """Градиент ниже самой глубокой впадины и один многоугольник от линии волны до него.
+        Возвращает точки линии горизонта."""
+        y_line = water_rect.top
+        # Волны от событий поверх прежней лёгкой зыби
+        ys = self._wave_y
+        np.dot((math.sin(t), math.cos(t), math.sin(t * 1.3), math.cos(t * 1.3)), self._wave_swell, out=ys)
+        ys += self.wave_h
+        ys += y_line
+        pts = list(zip(self._wave_px, ys.astype(np.intp).tolist()))
+        if stride > 1:
+            pts = pts[::stride] + ([pts[-1]] if (len(pts) - 1) % stride else [])
+        floor = y_line + WAVE_MAX + 4
+        below = self._below
+        below.update(water_rect.x, floor, water_rect.width, water_rect.bottom - floor)
+        if below.height > 0:
+            self._draw_gradient(surface, below, left_panel_rect)
+        pts.append((water_rect.right, floor + 1))
+        pts.append((water_rect.x, floor + 1))
+        pygame.draw.polygon(surface, (40, 80, 150), pts)
+        del pts[-2:]
+        return pts
+
+    def splash(self, particles, xs):
+        """Брызги на поверхности воды в точках xs (например, там, куда упали капли)."""
+        rng = particles.rng
+        xs = np.repeat(xs, 2)
+        n = len(xs)
+        particles.emit(n, xs + rng.uniform(-3, 3, n), self.level - 1, rng.uniform(-60, 60, n), rng.uniform(-170, -70, n),
+                       rng.uniform(0.25, 0.5, n), (180, 210, 255), ay=600.0, kind=PARTICLE_SPLASH)
+
     def is_game_over(self, roof_y):
         return self.level <= roof_y  # вода дошла до крыши (уровень поднялся)
 
 
 class Building:
     """Крыша соседнего здания — цель для дрона, может содержать артефакт."""
+    __slots__ = ("rect", "has_artifact", "collected", "_area")
+
     def __init__(self, x, y, width, height, has_artifact="solar_panel"):
         self.rect = pygame.Rect(x, y, width, height)
         self.has_artifact = has_artifact
         self.collected = False
+        self._area = pygame.Rect(0, 0, 0, 0)  # видимая над водой часть спрайта
 
-    def draw(self, surface, water_level, font=None):
+    def draw(self, surface, water_level, font=None, offset_y=0):
         # Не рисуем, если здание полностью под водой (Y растёт вниз: вода выше = меньше Y)
         if self.rect.top >= water_level:
             return
-        visible_bottom = min(self.rect.bottom, water_level)
-        visible_rect = pygame.Rect(
-            self.rect.x, self.rect.top,
-            self.rect.width, visible_bottom - self.rect.top,
-        )
-        if visible_rect.height <= 0:
+        artifact = self.has_artifact if self.has_artifact and not self.collected else None
+        sprite = SPRITES.building(self.rect.width, self.rect.height, artifact)
+        # Над водой остаётся только верхняя часть спрайта — отсекаем её областью blit
+        visible_h = min(sprite.get_height(), int(water_level) - self.rect.top)
+        if visible_h <= 0:
             return
-        # Корпус здания под крышей (стена над водой)
-        body = pygame.Rect(self.rect.x, visible_rect.bottom, self.rect.width, 80)
-        if body.top < water_level:
-            clip = min(body.bottom, water_level) - body.top
-            if clip > 0:
-                pygame.draw.rect(surface, (50, 55, 65), (body.x, body.top, body.width, clip))
-        # Крыша — яркая платформа
-        pygame.draw.rect(surface, (90, 95, 105), visible_rect)
-        pygame.draw.rect(surface, (140, 145, 155), visible_rect, 3)
-        if self.has_artifact and not self.collected:
-            cx = self.rect.centerx
-            cy = visible_rect.centery
-            name = ARTIFACTS.get(self.has_artifact, ("?", 0, 0))[0]
-            colors = {"solar_panel": (220, 180, 40), "seeds": (80, 160, 80), "blueprints": (100, 140, 200)}
-            c = colors.get(self.has_artifact, (200, 200, 200))
-            pygame.draw.rect(surface, c, (cx - 14, cy - 14, 28, 28))
-            pygame.draw.rect(surface, (255, 255, 255), (cx - 14, cy - 14, 28, 28), 2)
-            if font:
-                art = font.render(name, True, (255, 255, 255))
-                surface.blit(art, (cx - art.get_width() // 2, cy - 32))
+        top = self.rect.top - int(offset_y)
+        area = self._area
+        area.update(0, 0, self.rect.width, visible_h)
+        surface.blit(sprite, (self.rect.x, top), area)
+        if artifact and font:
+            name = ARTIFACTS.get(artifact, ("?", 0, 0))[0]
+            art = render_text(font, name, (255, 255, 255))
+            surface.blit(art, (self.rect.centerx - art.get_width() // 2, self.rect.centery - int(offset_y) - 32))
 
 
 class Drone:
     """Дрон: управление WASD/стрелками, сносится ветром, урон от молний. При касании крыши — сбор артефакта."""
-    def __init__(self, config, start_pos, speed_bonus=0):
+    __slots__ = ("config", "rng", "pos", "prev_pos", "speed", "wind", "health", "radius", "_rect")
+
+    def __init__(self, config, start_pos, speed_bonus=0, rng=None):
         self.config = config
+        self.rng = rng or random
         self.pos = list(start_pos)
-        self.speed = (config["drone_speed"] + speed_bonus) * 60 * 0.016  # пикселей за кадр
+        self.prev_pos = list(start_pos)  # позиция на прошлом тике, для интерполяции при отрисовке
+        # Пикселей в секунду: прежние «пикселей за кадр» при 60 кадрах
+        self.speed = (config["drone_speed"] + speed_bonus) * 60 * 0.016 * 60
         self.wind = [0.0, 0.0]
         self.health = 100
         self.radius = 18
+        self._rect = pygame.Rect(0, 0, 0, 0)
 
-    def update(self, dt_sec, keys, left_panel_rect):
-        # Управление: WASD или стрелки
+    def update(self, dt_sec, inputs, left_panel_rect):
+        # Управление: биты INPUT_* (WASD или стрелки, см. read_input_bits)
+        self.prev_pos[0], self.prev_pos[1] = self.pos
         dx = dy = 0
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
+        if inputs & INPUT_LEFT:
             dx -= 1
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
+        if inputs & INPUT_RIGHT:
             dx += 1
-        if keys[pygame.K_UP] or keys[pygame.K_w]:
+        if inputs & INPUT_UP:
             dy -= 1
-        if keys[pygame.K_DOWN] or keys[pygame.K_s]:
+        if inputs & INPUT_DOWN:
             dy += 1
         if dx or dy:
             norm = math.hypot(dx, dy)
-            self.pos[0] += (dx / norm) * self.speed
-            self.pos[1] += (dy / norm) * self.speed
+            self.pos[0] += (dx / norm) * self.speed * dt_sec
+            self.pos[1] += (dy / norm) * self.speed * dt_sec
         # Ветер сносит
-        self.wind[0] += (random.uniform(-1, 1) * self.config["wind_strength"] - self.wind[0] * 0.05) * dt_sec * 25
-        self.wind[1] += (random.uniform(-1, 1) * self.config["wind_strength"] - self.wind[1] * 0.05) * dt_sec * 25
+        self.wind[0] += (self.rng.uniform(-1, 1) * self.config["wind_strength"] - self.wind[0] * 0.05) * dt_sec * 25
+        self.wind[1] += (self.rng.uniform(-1, 1) * self.config["wind_strength"] - self.wind[1] * 0.05) * dt_sec * 25
         self.pos[0] += self.wind[0] * dt_sec * 20
         self.pos[1] += self.wind[1] * dt_sec * 20
         # Границы левой панели
         self.pos[0] = max(left_panel_rect.x + self.radius, min(left_panel_rect.right - self.radius, self.pos[0]))
         self.pos[1] = max(left_panel_rect.y + self.radius, min(left_panel_rect.bottom - self.radius, self.pos[1]))
 
+    def emit_wake(self, particles, dt_sec):
+        """След дрона: струя воздуха вниз от пропеллеров, отстающая от движения."""
+        rng = particles.rng
+        n = rng.poisson(90 * dt_sec * particles.density)
+        if not n or dt_sec <= 0:
+            return
+        vx = (self.pos[0] - self.prev_pos[0]) / dt_sec
+        particles.emit(n, rng.uniform(self.pos[0] - 14, self.pos[0] + 14, n), self.pos[1] + self.radius,
+                       rng.uniform(-25, 25, n) - vx * 0.3, rng.uniform(40, 90, n), rng.uniform(0.3, 0.6, n),
+                       (200, 210, 225), drag=3.0, kind=PARTICLE_WAKE)
+
     def get_rect(self):
-        return pygame.Rect(self.pos[0] - self.radius, self.pos[1] - self.radius, self.radius * 2, self.radius * 2)
+        """Прямоугольник дрона. Один и тот же объект, обновляется на месте: не хранить между тиками."""
+        # update() отбрасывает дробную часть, как конструктор Rect (присваивание .x округляет)
+        r = self.radius
+        self._rect.update(self.pos[0] - r, self.pos[1] - r, r * 2, r * 2)
+        return self._rect
 
     def take_lightning_damage(self, amount=35):
         self.health -= amount
 
-    def draw(self, surface, font=None):
-        x, y = int(self.pos[0]), int(self.pos[1])
+    def render_pos(self, alpha=1.0):
+        """Позиция между прошлым и текущим тиком (alpha от 0 до 1)."""
+        return (self.prev_pos[0] + (self.pos[0] - self.prev_pos[0]) * alpha,
+                self.prev_pos[1] + (self.pos[1] - self.prev_pos[1]) * alpha)
+
+    def draw(self, surface, font=None, alpha=1.0, offset_y=0):
+        rx, ry = self.render_pos(alpha)
+        x, y = int(rx), int(ry - offset_y)
         r = self.radius
-        # Корпус дрона — горизонтальный «тело» (овал)
-        body_rect = pygame.Rect(x - r - 4, y - r // 2, r * 2 + 8, r)
-        pygame.draw.ellipse(surface, (220, 225, 235), body_rect)
-        pygame.draw.ellipse(surface, (100, 105, 115), body_rect, 2)
-        # Четыре «луча» к пропеллерам
-        for angle in [0, math.pi / 2, math.pi, 3 * math.pi / 2]:
-            ax = x + (r + 6) * math.cos(angle)
-            ay = y + (r + 6) * math.sin(angle)
-            pygame.draw.line(surface, (120, 125, 135), (x, y), (ax, ay), 3)
-            pygame.draw.circle(surface, (180, 185, 195), (int(ax), int(ay)), 6)
-            pygame.draw.circle(surface, (90, 95, 100), (int(ax), int(ay)), 6, 1)
+        # Корпус, лучи и пропеллеры — готовый спрайт
+        surface.blit(SPRITES.drone(r), (x - r - 12, y - r - 12))
         # Подпись «Дрон»
         if font:
-            lbl = font.render("Дрон", True, (255, 255, 255))
+            lbl = render_text(font, "Дрон", (255, 255, 255))
             surface.blit(lbl, (x - lbl.get_width() // 2, y - r - 22))
 
 
 class Lightning:
-    """Молния: вспышка в случайной позиции, наносит урон дрону при пересечении."""
-    def __init__(self, left_panel_rect):
-        self.rect = pygame.Rect(
-            left_panel_rect.x + random.randint(50, left_panel_rect.width - 50),
-            left_panel_rect.y + random.randint(50, left_panel_rect.height - 50),
+    """Молния: вспышка в случайной позиции, наносит урон дрону при пересечении.
+    Отгоревшую молнию симуляция не выбрасывает, а перезапускает через reset (см. Simulation._lightning_pool)."""
+    __slots__ = ("clock", "rect", "active_until", "damage_applied", "slot")
+
+    def __init__(self, left_panel_rect, clock=None, rng=None):
+        self.clock = clock or PygameClock()
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.slot = 0  # индекс в Simulation.lightnings
+        self.reset(left_panel_rect, rng)
+
+    def reset(self, left_panel_rect, rng=None):
+        """Новая вспышка на месте старой. Вызовы rng те же, что при создании, — повторы записей не расходятся."""
+        rng = rng or random
+        self.rect.update(
+            left_panel_rect.x + rng.randint(50, left_panel_rect.width - 50),
+            left_panel_rect.y + rng.randint(50, left_panel_rect.height - 50),
             8,
-            random.randint(80, 180),
+            rng.randint(80, 180),
         )
-        self.active_until = pygame.time.get_ticks() + 150
+        self.active_until = self.clock.now() + 0.15
         self.damage_applied = False
 
     def update(self, drone):
@@ -245,17 +1050,28 @@ class Lightning:
                 drone.take_lightning_damage()
                 self.damage_applied = True
 
+    def emit_sparks(self, particles, n=48):
+        """Искры в точке удара (нижний конец молнии)."""
+        rng = particles.rng
+        n = int(n * particles.density)
+        angle = rng.uniform(math.pi, 2 * math.pi, n)
+        speed = rng.uniform(80, 280, n)
+        colors = np.where(rng.random((n, 1)) < 0.5, (255, 240, 150), (255, 255, 255)).astype(np.uint8)
+        particles.emit(n, self.rect.centerx, self.rect.bottom, np.cos(angle) * speed, np.sin(angle) * speed,
+                       rng.uniform(0.2, 0.5, n), colors, ay=500.0, drag=1.5, kind=PARTICLE_SPARK)
+
     def is_done(self):
-        return pygame.time.get_ticks() > self.active_until
+        return self.clock.now() > self.active_until
 
-    def draw(self, surface):
-        if pygame.time.get_ticks() < self.active_until:
-            pygame.draw.rect(surface, (200, 220, 255), self.rect)
-            pygame.draw.rect(surface, (255, 255, 255), self.rect.inflate(4, 0))
+    def draw(self, surface, offset_y=0):
+        if self.clock.now() < self.active_until:
+            surface.blit(SPRITES.lightning(self.rect.width, self.rect.height), (self.rect.x - 2, self.rect.y - int(offset_y)))
 
 
 class Button:
     """Простая кнопка, отрисованная через Pygame."""
+    __slots__ = ("rect", "text", "font", "hover")
+
     def __init__(self, x, y, w, h, text, font):
         self.rect = pygame.Rect(x, y, w, h)
         self.text = text
@@ -269,7 +1085,7 @@ class Button:
         color = (70, 100, 140) if self.hover else (50, 75, 110)
         pygame.draw.rect(surface, color, self.rect)
         pygame.draw.rect(surface, (100, 140, 180), self.rect, 2)
-        text_surf = self.font.render(self.text, True, (220, 230, 240))
+        text_surf = render_text(self.font, self.text, (220, 230, 240))
         tr = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, tr)
 
@@ -277,313 +1093,2144 @@ class Button:
         return self.rect.collidepoint(pos)
 
 
-def generate_buildings(left_panel_rect, height, count=14):
+def generate_buildings(left_panel_rect, height, count=14, rng=None):
     """Генерирует здания с разными артефактами (солнечные панели, семена, чертежи)."""
+    rng = rng or random
     types = ["solar_panel", "seeds", "blueprints"]
     buildings = []
     for i in range(count):
-        x = left_panel_rect.x + 40 + (i % 5) * (left_panel_rect.width // 5) + random.randint(-20, 30)
-        y = height * (0.2 + (i // 5) * 0.18) + random.randint(-30, 40)
-        w = 70 + random.randint(0, 50)
-        h = 40 + random.randint(0, 25)
-        art = types[i % 3] if i < 12 else types[random.randint(0, 2)]
+        x = left_panel_rect.x + 40 + (i % 5) * (left_panel_rect.width // 5) + rng.randint(-20, 30)
+        y = height * (0.2 + (i // 5) * 0.18) + rng.randint(-30, 40)
+        w = 70 + rng.randint(0, 50)
+        h = 40 + rng.randint(0, 25)
+        art = types[i % 3] if i < 12 else types[rng.randint(0, 2)]
         buildings.append(Building(x, y, w, h, art))
     return buildings
 
 
+# --- Частицы ---
+PARTICLE_CAPACITY = 40000
+PARTICLE_RAIN, PARTICLE_SPLASH, PARTICLE_SPARK, PARTICLE_WAKE = range(4)
+
+
+class ParticleSystem:
+    """Частицы в заранее выделенных массивах NumPy (структура массивов): координаты, скорости,
+    ускорение, сопротивление, время жизни, цвет. Свободные слоты лежат в стеке индексов, так что
+    выпуск и гибель частиц не выделяют память. Обновление и отрисовка — векторно, всем пулом сразу.
+    Частицы только для вида: собственный генератор, на симуляцию не влияют."""
+    def __init__(self, capacity=PARTICLE_CAPACITY, rng=None):
+        self.capacity = capacity
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.ay = np.zeros(capacity, np.float32)
+        self.drag = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.float32)
+        self.color = np.zeros((capacity, 3), np.uint8)
+        self.kind = np.zeros(capacity, np.uint8)
+        self.alive = np.zeros(capacity, bool)
+        self._free = np.arange(capacity - 1, -1, -1, dtype=np.int32)
+        self._free_top = capacity
+        self.rng = rng or np.random.default_rng()
+        self.density = 1.0  # доля эффектов от полной (уровень качества); 0 — новых частиц нет
+        # Рабочие буферы update/draw: промежуточные массивы кадра пишутся сюда через out=
+        self._f1 = np.empty(capacity, np.float32)
+        self._f2 = np.empty(capacity, np.float32)
+        self._b1 = np.empty(capacity, bool)
+        self._b2 = np.empty(capacity, bool)
+        self._xi = np.empty(capacity, np.intp)  # intp: индексы пикселей без преобразования внутри NumPy
+        self._yi = np.empty(capacity, np.intp)
+        self._u1 = np.empty(capacity, np.uint32)
+        # Подготовленные к отрисовке живые частицы (см. _prepare); _version меняется с каждым изменением пула
+        self._xs = np.empty(capacity, np.intp)
+        self._ys = np.empty(capacity, np.intp)
+        self._rgb = np.empty((capacity, 3), np.uint8)
+        self._mapped = np.empty(capacity, np.uint32)
+        self._version = 0
+        self._prepared = None
+        # Пиксели под частицами, нарисованными draw_over: erase возвращает их без перерисовки фона
+        self._sx = np.empty(capacity, np.intp)
+        self._sy = np.empty(capacity, np.intp)
+        self._under0 = np.empty(capacity, np.uint32)
+        self._under1 = np.empty(capacity, np.uint32)
+        self._saved = None  # (поверхность, число частиц) последнего draw_over
+
+    @property
+    def count(self):
+        return self.capacity - self._free_top
+
+    def clear(self):
+        self.alive[:] = False
+        self._free[:] = np.arange(self.capacity - 1, -1, -1, dtype=np.int32)
+        self._free_top = self.capacity
+        self._version += 1
+
+    def emit(self, n, x, y, vx, vy, life, color, ay=0.0, drag=0.0, kind=PARTICLE_SPLASH):
+        """Выпустить n частиц; параметры — числа или массивы длины n. При пустом пуле лишние отбрасываются."""
+        n = min(int(n), self._free_top)
+        if n <= 0:
+            return
+        idx = self._free[self._free_top - n:self._free_top].copy()
+        self._free_top -= n
+
+        def fit(v):
+            return v[:n] if np.ndim(v) else v
+
+        self.x[idx] = fit(x)
+        self.y[idx] = fit(y)
+        self.vx[idx] = fit(vx)
+        self.vy[idx] = fit(vy)
+        self.ay[idx] = fit(ay)
+        self.drag[idx] = fit(drag)
+        self.life[idx] = fit(life)
+        self.color[idx] = color[:n] if np.ndim(color) == 2 else color
+        self.kind[idx] = kind
+        self.alive[idx] = True
+        self._version += 1
+
+    def rain(self, rect, n):
+        """Капли у верхнего края rect (координаты мира)."""
+        rng = self.rng
+        self.emit(n, rng.uniform(rect.x, rect.right, n), rng.uniform(rect.top - 24, rect.top, n),
+                  rng.uniform(-40, -20, n), rng.uniform(520, 680, n), 3.0, (150, 170, 210), kind=PARTICLE_RAIN)
+
+    def update(self, dt, water_level):
+        """Шаг всех частиц. Возвращает X капель дождя, упавших в воду (для брызг), или None."""
+        if not self.count:
+            return None
+        self._version += 1
+        alive = self.alive
+        tmp, damp = self._f1, self._f2
+        np.multiply(self.ay, dt, out=tmp)
+        self.vy += tmp
+        # damp = max(0, 1 - drag·dt)
+        np.multiply(self.drag, -dt, out=damp)
+        damp += 1.0
+        np.maximum(damp, 0.0, out=damp)
+        self.vx *= damp
+        self.vy *= damp
+        np.multiply(self.vx, dt, out=tmp)
+        self.x += tmp
+        np.multiply(self.vy, dt, out=tmp)
+        self.y += tmp
+        self.life -= dt
+        hits, mask = self._b1, self._b2
+        np.greater_equal(self.y, water_level, out=hits)
+        hits &= alive
+        np.equal(self.kind, PARTICLE_RAIN, out=mask)
+        hits &= mask
+        hit_x = self.x[hits]
+        self.life[hits] = 0.0
+        np.less_equal(self.life, 0.0, out=mask)
+        mask &= alive
+        dead = np.flatnonzero(mask)
+        if len(dead):
+            alive[dead] = False
+            # Мёртвые слоты стоят на месте, чтобы числа в них не росли бесконечно
+            self.vx[dead] = self.vy[dead] = self.ay[dead] = 0.0
+            self._free[self._free_top:self._free_top + len(dead)] = dead
+            self._free_top += len(dead)
+        return hit_x if len(hit_x) else None
+
+    def bounds(self, offset_y=0):
+        """Прямоугольник экрана, занятый живыми частицами, или None."""
+        if not self.count:
+            return None
+        # Свёртки с where= считают только живые слоты и не копируют их в отдельный массив
+        alive = self.alive
+        x0, x1 = int(self.x.min(where=alive, initial=np.inf)), int(self.x.max(where=alive, initial=-np.inf))
+        y = np.subtract(self.y, offset_y, out=self._f1)
+        y0, y1 = int(y.min(where=alive, initial=np.inf)), int(y.max(where=alive, initial=-np.inf))
+        return pygame.Rect(x0, y0, x1 - x0 + 1, y1 - y0 + 2)
+
+    def _prepare(self, surface, offset_y):
+        """Живые частицы в пикселях экрана и их цвета в формате поверхности. Считается раз на кадр:
+        draw вызывается для каждой перерисовываемой области, а пул между этими вызовами не меняется."""
+        n = self.count
+        fmt = (surface.get_bytesize(), surface.get_shifts(), surface.get_losses(), surface.get_masks()[3])
+        key = (self._version, offset_y, fmt)
+        if key == self._prepared:
+            return n
+        self._prepared = key
+        idx = np.flatnonzero(self.alive)
+        f = self._f1[:n]
+        np.take(self.x, idx, out=f)
+        np.copyto(self._xs[:n], f, casting="unsafe")
+        np.take(self.y, idx, out=f)
+        f -= offset_y
+        np.copyto(self._ys[:n], f, casting="unsafe")
+        rgb = np.take(self.color, idx, axis=0, out=self._rgb[:n])
+        if fmt[0] in (2, 4):
+            (rs, gs, bs, _), (rl, gl, bl, _) = fmt[1], fmt[2]
+            mapped, channel = self._mapped[:n], self._u1[:n]
+            mapped.fill(fmt[3])
+            for c, loss, shift in ((0, rl, rs), (1, gl, gs), (2, bl, bs)):
+                np.right_shift(rgb[:, c], loss, out=channel)
+                channel <<= shift
+                mapped |= channel
+        return n
+
+    def _visible(self, surface, offset_y):
+        """Частицы в пределах clip поверхности: (X, Y, цвета в формате поверхности, номера среди
+        подготовленных или None — если видны все) либо None, если видимых нет."""
+        n = self._prepare(surface, offset_y)
+        clip = surface.get_clip()
+        xi, yi = self._xs[:n], self._ys[:n]
+        keep, mask = self._b1[:n], self._b2[:n]
+        np.greater_equal(xi, clip.x, out=keep)
+        np.less(xi, clip.right, out=mask)
+        keep &= mask
+        np.greater_equal(yi, clip.y, out=mask)
+        keep &= mask
+        np.less(yi, clip.bottom - 1, out=mask)
+        keep &= mask
+        mapped, sel = self._mapped[:n], None
+        if not keep.all():
+            # Номера видимых частиц — единственный новый массив; выборка собирается в буферы
+            sel = np.flatnonzero(keep)
+            k = len(sel)
+            if not k:
+                return None
+            xi = np.take(xi, sel, out=self._xi[:k])
+            yi = np.take(yi, sel, out=self._yi[:k])
+            mapped = np.take(mapped, sel, out=self._u1[:k])
+        return xi, yi, mapped, sel
+
+    def draw(self, surface, offset_y=0):
+        """Все частицы штрихами 1×2 px прямо в пиксели поверхности, в пределах её clip."""
+        if not self.count:
+            return
+        visible = self._visible(surface, offset_y)
+        if visible is None:
+            return
+        xi, yi, mapped, sel = visible
+        if surface.get_bytesize() not in (2, 4):
+            rgb = self._rgb[:len(xi)] if sel is None else self._rgb[sel]
+            for px, py, c in zip(xi.tolist(), yi.tolist(), rgb.tolist()):
+                surface.fill(c, (px, py, 1, 2))
+            return
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[xi, yi] = mapped
+        pixels[xi, np.add(yi, 1, out=self._yi[:len(yi)])] = mapped
+        del pixels
+
+    @staticmethod
+    def can_overlay(surface):
+        """Поддерживает ли поверхность draw_over/erase (16 и 32 бит на пиксель)."""
+        return surface.get_bytesize() in (2, 4)
+
+    def draw_over(self, surface, offset_y=0):
+        """Как draw, но сначала запоминает пиксели под штрихами. Следующий erase вернёт их,
+        так что фон под частицами не нужно перерисовывать: кадр стоит O(частиц), а не O(площади).
+        Возвращает прямоугольник нарисованных штрихов или None."""
+        self._saved = None
+        if not self.count:
+            return None
+        visible = self._visible(surface, offset_y)
+        if visible is None:
+            return None
+        xi, yi, mapped, _ = visible
+        k = len(xi)
+        x0, x1, y0, y1 = int(xi.min()), int(xi.max()), int(yi.min()), int(yi.max())
+        area = pygame.Rect(x0, y0, x1 - x0 + 1, y1 - y0 + 2)
+        sx, sy = self._sx[:k], self._sy[:k]
+        np.copyto(sx, xi)
+        np.copyto(sy, yi)
+        # yi может быть видом _yi: он уже скопирован в sy
+        y1 = np.add(sy, 1, out=self._yi[:k])
+        pixels = pygame.surfarray.pixels2d(surface)
+        self._under0[:k] = pixels[sx, sy]
+        self._under1[:k] = pixels[sx, y1]
+        pixels[sx, sy] = mapped
+        pixels[sx, y1] = mapped
+        del pixels
+        self._saved = (surface, k)
+        return area
+
+    def erase(self, surface):
+        """Стереть частицы последнего draw_over, вернув пиксели под ними. Годится, только если
+        поверх них с тех пор ничего не рисовалось (иначе — forget и перерисовка области)."""
+        saved, self._saved = self._saved, None
+        if saved is None or saved[0] is not surface:
+            return
+        k = saved[1]
+        sx, sy = self._sx[:k], self._sy[:k]
+        pixels = pygame.surfarray.pixels2d(surface)
+        # Всё под штрихами сохранено до первой записи, поэтому порядок возврата не важен
+        pixels[sx, np.add(sy, 1, out=self._yi[:k])] = self._under1[:k]
+        pixels[sx, sy] = self._under0[:k]
+        del pixels
+
+    def forget(self):
+        """Забыть сохранённые пиксели: область под частицами перерисована заново."""
+        self._saved = None
+
+
+CHUNK_HEIGHT = 400  # высота чанка бесконечного режима, px мира
+CHUNK_LOOKAHEAD = 2  # столько чанков выше камеры всегда загружено
+CHUNK_PREFETCH = 2  # и ещё столько фоновый поток готовит заранее
+
+
+def generate_chunk(seed, index, left_panel_rect, base_y):
+    """Здания чанка index бесконечного режима. Зависит только от (seed, index) и ширины панели,
+    поэтому чанк можно сгенерировать в любом потоке и в любой момент — результат тот же.
+    Чанк index занимает по Y мира промежуток [base_y - (index + 1) * CHUNK_HEIGHT, base_y - index * CHUNK_HEIGHT)."""
+    rng = random.Random(seed * 1000003 + index)
+    types = ["solar_panel", "seeds", "blueprints"]
+    bottom = base_y - index * CHUNK_HEIGHT
+    columns = 5
+    col_w = left_panel_rect.width // columns
+    buildings = []
+    # Два ряда крыш на чанк, в каждом — 2–4 случайные колонки из пяти
+    for row in range(2):
+        y_base = bottom - CHUNK_HEIGHT + row * (CHUNK_HEIGHT // 2) + 30
+        for col in sorted(rng.sample(range(columns), rng.randint(2, 4))):
+            x = left_panel_rect.x + 40 + col * col_w + rng.randint(-20, 30)
+            y = y_base + rng.randint(-20, 60)
+            w = 70 + rng.randint(0, 50)
+            h = 40 + rng.randint(0, 25)
+            buildings.append(Building(x, y, w, h, types[rng.randint(0, 2)]))
+    return buildings
+
+
+class ChunkStreamer:
+    """Поставщик чанков: фоновый поток генерирует чанки впереди камеры, take() забирает готовый
+    или, если поток не успел, генерирует на месте. Момент появления чанка в мире определяет
+    только симуляция, поэтому результат не зависит от того, кто его сгенерировал."""
+    def __init__(self, seed, threaded=True):
+        self.seed = seed
+        self._ready = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._requests = None
+        self._thread = None
+        if threaded:
+            self._requests = queue.Queue()
+            self._thread = threading.Thread(target=self._worker, name="chunk-streamer", daemon=True)
+            self._thread.start()
+
+    def _worker(self):
+        while True:
+            job = self._requests.get()
+            if job is None:
+                return
+            index, left_panel_rect, base_y = job
+            buildings = generate_chunk(self.seed, index, left_panel_rect, base_y)
+            with self._lock:
+                if index in self._pending:
+                    self._pending.discard(index)
+                    self._ready[index] = buildings
+
+    def prefetch(self, index, left_panel_rect, base_y):
+        if self._requests is None:
+            return
+        with self._lock:
+            if index in self._pending or index in self._ready:
+                return
+            self._pending.add(index)
+        self._requests.put((index, pygame.Rect(left_panel_rect), base_y))
+
+    def take(self, index, left_panel_rect, base_y):
+        with self._lock:
+            buildings = self._ready.pop(index, None)
+            self._pending.discard(index)
+        if buildings is None:
+            buildings = generate_chunk(self.seed, index, left_panel_rect, base_y)
+        return buildings
+
+    def close(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread = None
+
+
+class Scheduler:
+    """Очередь событий по времени на куче: schedule() и срабатывание — O(log n). События
+    с одинаковым временем срабатывают в порядке добавления. Отмена помечает событие, и
+    куча выбрасывает его при извлечении."""
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, at, callback, *args):
+        """Вызвать callback(*args) при первом run(now) с now >= at. Возвращает событие для cancel()."""
+        event = [at, self._seq, callback, args]
+        self._seq += 1
+        heapq.heappush(self._heap, event)
+        return event
+
+    @staticmethod
+    def cancel(event):
+        event[2] = None
+
+    def run(self, now):
+        """Выполнить все наступившие события; возвращает их число."""
+        heap = self._heap
+        fired = 0
+        while heap and heap[0][0] <= now:
+            _, _, callback, args = heapq.heappop(heap)
+            if callback is not None:
+                callback(*args)
+                fired += 1
+        return fired
+
+
+class SpatialGrid:
+    """Равномерная сетка для грубой фазы столкновений: объект лежит во всех ячейках,
+    которые задевает его прямоугольник. Вставка и удаление — по месту, без перестройки."""
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._item_cells = {}
+        self._found = {}  # буфер результата query
+
+    def _cell_range(self, rect):
+        cs = self.cell_size
+        x0, y0 = int(rect[0]) // cs, int(rect[1]) // cs
+        x1, y1 = (int(rect[0]) + max(int(rect[2]), 1) - 1) // cs, (int(rect[1]) + max(int(rect[3]), 1) - 1) // cs
+        return x0, y0, x1, y1
+
+    def _cell_keys(self, rect):
+        x0, y0, x1, y1 = self._cell_range(rect)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item, rect):
+        keys = self._cell_keys(rect)
+        self._item_cells[item] = keys
+        for key in keys:
+            self._cells.setdefault(key, []).append(item)
+
+    def remove(self, item):
+        keys = self._item_cells.pop(item, None)
+        if keys is None:
+            return False
+        for key in keys:
+            cell = self._cells[key]
+            cell.remove(item)
+            if not cell:
+                del self._cells[key]
+        return True
+
+    def query(self, rect):
+        """Кандидаты, чьи ячейки пересекаются с rect (без точной проверки), в стабильном порядке.
+        Результат — общий для сетки буфер (словарь, перебор даёт объекты): он действителен до
+        следующего query, вставка и удаление его не трогают. Так запрос каждого тика не выделяет память."""
+        found = self._found
+        found.clear()
+        cells = self._cells
+        x0, y0, x1, y1 = self._cell_range(rect)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    for item in cell:
+                        found[item] = None
+        return found
+
+    def __contains__(self, item):
+        return item in self._item_cells
+
+    def __len__(self):
+        return len(self._item_cells)
+
+
+class Simulation:
+    """Игровой мир без отрисовки: вода, здания, дрон, молнии, энергия и монеты.
+    Время и случайность внешние (clock, rng), поэтому сессию можно прогнать быстрее реального
+    времени. Цикл pygame только рисует состояние и передаёт ввод в step()."""
+    def __init__(self, config, left_panel_rect, height, clock=None, rng=None, building_count=14):
+        self.config = dict(config)
+        # Купленные в магазине бонусы
+        self.config["water_slow_duration"] = config.get("water_slow_duration", 10) + config.get("slow_duration_bonus", 0) * 5
+        self.clock = clock or SimClock()
+        self.rng = rng or random.Random()
+        self.left_panel = pygame.Rect(left_panel_rect)
+        self.height = height
+        self.start_time = self.clock.now()
+        self.water = Water(self.config, height, self.clock)
+        self.water.set_span(self.left_panel.x, self.left_panel.width)
+        # Камера: Y мира у верхнего края панели. В режиме уровня всегда 0
+        self.endless = self.config.get("world_mode") == "endless"
+        self.camera_y = self.prev_camera_y = 0.0
+        self.player_roof_y = height * 0.15
+        # Грубая фаза столкновений: несобранные крыши над водой и активные молнии
+        self.building_grid = SpatialGrid()
+        # Крыши в порядке затопления (снизу вверх): куча по -top, вода снимает их с сетки по одной
+        self._flood_heap = []
+        self._flood_seq = 0
+        if self.endless:
+            seed = self.config.get("world_seed")
+            self.world_seed = self.rng.getrandbits(32) if seed is None else int(seed)
+            self.chunk_base_y = height
+            self.chunks = OrderedDict()  # индекс -> здания чанка; от нижнего к верхнему
+            self._next_chunk = 0
+            self._streamer = ChunkStreamer(self.world_seed)
+            self.buildings = []
+            self.buildings_left = 0
+            self._stream_chunks()
+        else:
+            self.chunks = None
+            self._streamer = None
+            self.buildings = generate_buildings(self.left_panel, height, building_count, self.rng)
+            self.buildings_left = len(self.buildings)
+            self._add_buildings(self.buildings)
+        self.hazard_grid = SpatialGrid()
+        self.drone = None
+        self.lightnings = []  # порядок не важен: удаление подстановкой последнего
+        self._lightning_pool = []  # отгоревшие молнии для повторного использования
+        # Всё, что происходит по времени (конец замедления воды, молнии), — события планировщика
+        self.scheduler = Scheduler()
+        self.next_lightning = self.start_time + 2.0
+        self._lightning_due = False
+        self.scheduler.schedule(self.next_lightning, self._on_lightning_due)
+        self.energy_max = 100 + config.get("energy_max_bonus", 0) * 20
+        self.energy = self.energy_max
+        self.coins_earned = 0
+        self.artifacts_collected = 0
+        self.drones_lost = 0
+        self.status = "playing"  # "playing", "game_over", "level_complete"
+        # Растёт при изменениях, влияющих на статичный слой отрисовки (сбор артефакта, размер)
+        self.world_version = 0
+        self.profiler = None  # FrameProfiler: замеры фаз water_update / drone / lightning / particles
+        self.particles = None  # ParticleSystem для эффектов; подключается снаружи, на ход игры не влияет
+
+    @property
+    def time(self):
+        """Время выживания в секундах."""
+        return self.clock.now() - self.start_time
+
+    def resize(self, left_panel_rect, height):
+        if self.left_panel != left_panel_rect:
+            self.left_panel = pygame.Rect(left_panel_rect)
+            self.water.set_span(self.left_panel.x, self.left_panel.width)
+            self.world_version += 1
+        if self.height != height:
+            self.height = height
+            self.water.screen_height = height
+            self.player_roof_y = self.camera_y + height * 0.15
+            self.world_version += 1
+
+    def view_rect(self):
+        """Видимая часть левой панели в координатах мира."""
+        return pygame.Rect(self.left_panel.x, int(self.camera_y), self.left_panel.width, self.left_panel.height)
+
+    def render_camera_y(self, alpha=1.0):
+        return self.prev_camera_y + (self.camera_y - self.prev_camera_y) * alpha
+
+    def close(self):
+        """Остановить фоновую генерацию чанков (бесконечный режим)."""
+        if self._streamer is not None:
+            self._streamer.close()
+
+    def _add_buildings(self, buildings):
+        level = self.water.level
+        for b in buildings:
+            if b.rect.top < level:
+                self.building_grid.insert(b, b.rect)
+                heapq.heappush(self._flood_heap, (-b.rect.top, self._flood_seq, b))
+                self._flood_seq += 1
+
+    def _stream_chunks(self):
+        """Подгрузить чанки до CHUNK_LOOKAHEAD выше камеры и выгрузить ушедшие под воду."""
+        base = self.chunk_base_y
+        need_top = self.camera_y - CHUNK_LOOKAHEAD * CHUNK_HEIGHT
+        while base - self._next_chunk * CHUNK_HEIGHT > need_top:
+            index = self._next_chunk
+            buildings = self._streamer.take(index, self.left_panel, base)
+            self.chunks[index] = buildings
+            self.buildings_left += len(buildings)
+            self._add_buildings(buildings)
+            self._next_chunk += 1
+        for index in range(self._next_chunk, self._next_chunk + CHUNK_PREFETCH):
+            self._streamer.prefetch(index, self.left_panel, base)
+        # Чанк целиком под водой или ниже камеры больше не нужен: камера только поднимается
+        drop_y = min(self.water.level, self.camera_y + self.left_panel.height)
+        while self.chunks:
+            index = next(iter(self.chunks))
+            if base - (index + 1) * CHUNK_HEIGHT < drop_y:
+                break
+            for b in self.chunks.pop(index):
+                if not b.collected:
+                    self.buildings_left -= 1
+                self.building_grid.remove(b)
+
+    def visible_buildings(self):
+        """Здания, которые могут попасть в кадр: все (уровень) или загруженных чанков (бесконечный режим)."""
+        if not self.endless:
+            return self.buildings
+        top = self.camera_y - BUILDING_BODY_H
+        bottom = self.camera_y + self.left_panel.height
+        base = self.chunk_base_y
+        return [b for index, chunk in self.chunks.items()
+                if base - (index + 1) * CHUNK_HEIGHT < bottom and base - index * CHUNK_HEIGHT > top
+                for b in chunk]
+
+    def can_send_drone(self):
+        return self.drone is None and self.energy >= DRONE_ENERGY_COST
+
+    def water_margin(self):
+        """Запас до крыши игрока: 1 — вода на старте, 0 — вода у крыши."""
+        total_range = max((self.camera_y + self.height * 0.75 - self.player_roof_y), 1)
+        return max(0, min(1, (self.water.level - self.player_roof_y) / total_range))
+
+    def _next_lightning_delay(self):
+        lo = int(self.config.get("lightning_interval_min", 1.5) * 1000)
+        hi = int(self.config.get("lightning_interval_max", 4.0) * 1000)
+        return self.rng.randint(lo, max(lo, hi)) / 1000.0
+
+    def _flood_buildings(self):
+        heap = self._flood_heap
+        level = self.water.level
+        grid = self.building_grid
+        # Собранные и выгруженные крыши уже сняты с сетки — их тоже убираем из головы кучи
+        while heap and (-heap[0][0] >= level or heap[0][2] not in grid):
+            b = heapq.heappop(heap)[2]
+            if b in grid:
+                # Крыша ушла под воду: вода над ней вспучивается
+                self.water.disturb(b.rect.centerx, -90.0, b.rect.width)
+                grid.remove(b)
+
+    def _collect(self, b):
+        b.collected = True
+        self.buildings_left -= 1
+        self.building_grid.remove(b)
+        name, coin_reward, slow_sec = ARTIFACTS.get(b.has_artifact, ("?", 0, 0))
+        self.coins_earned += coin_reward
+        self.artifacts_collected += 1
+        if slow_sec > 0:
+            until = self.water.apply_solar_panel()
+            self.scheduler.schedule(until, self.water.end_slow, until)
+        self.energy = min(self.energy_max, self.energy + DRONE_ENERGY_COST)
+        self.world_version += 1
+
+    def _on_lightning_due(self):
+        # Молния бьёт только по летящему дрону: флаг ждёт, пока дрон появится
+        self._lightning_due = True
+
+    def _spawn_lightning(self, now):
+        area = self.view_rect() if self.endless else self.left_panel
+        if self._lightning_pool:
+            L = self._lightning_pool.pop()
+            L.reset(area, self.rng)
+        else:
+            L = Lightning(area, self.clock, self.rng)
+        L.slot = len(self.lightnings)
+        self.lightnings.append(L)
+        self.hazard_grid.insert(L, L.rect)
+        if self.particles is not None:
+            L.emit_sparks(self.particles)
+        if L.rect.bottom >= self.water.level - 60:
+            self.water.disturb(L.rect.centerx, 260.0, 24)
+        # Молния опасна, пока is_done() ложно, то есть до момента строго после active_until
+        self.scheduler.schedule(math.nextafter(L.active_until, math.inf), self._expire_lightning, L)
+        self._lightning_due = False
+        self.next_lightning = now + self._next_lightning_delay()
+        self.scheduler.schedule(self.next_lightning, self._on_lightning_due)
+
+    def _expire_lightning(self, L):
+        self.hazard_grid.remove(L)
+        last = self.lightnings.pop()
+        if last is not L:
+            self.lightnings[L.slot] = last
+            last.slot = L.slot
+        self._lightning_pool.append(L)
+
+    def _update_particles(self, dt_sec):
+        ps = self.particles
+        view = self.view_rect() if self.endless else self.left_panel
+        ps.rain(view, ps.rng.poisson(self.config.get("rain_rate", 900) * dt_sec * ps.density))
+        if self.drone:
+            self.drone.emit_wake(ps, dt_sec)
+        hits = ps.update(dt_sec, self.water.level)
+        if hits is not None:
+            self.water.splash(ps, hits)
+            self.water.disturb_at(hits, 1.5)
+
+    def step(self, dt_sec, inputs=0):
+        """Продвинуть мир на dt_sec секунд; inputs — биты INPUT_*. Возвращает status."""
+        if self.status != "playing":
+            return self.status
+        self.clock.advance(dt_sec)
+        # События, чьё время наступило: O(log n) на событие, без опроса таймеров каждый тик
+        self.scheduler.run(self.clock.now())
+        if inputs & INPUT_SEND and self.can_send_drone():
+            start = (self.left_panel.centerx, int(self.player_roof_y - 35))
+            self.drone = Drone(self.config, start, self.config.get("drone_speed_bonus", 0), self.rng)
+            self.energy -= DRONE_ENERGY_COST
+        elif inputs & INPUT_RECALL and self.drone:
+            self.drone = None
+
+        prof = self.profiler
+        timed = prof is not None and prof.enabled
+        if timed:
+            t0 = time.perf_counter()
+        self.water.update(dt_sec)
+        if self.endless:
+            # Камера поднимается с постоянной скоростью, крыша игрока едет вместе с ней
+            self.prev_camera_y = self.camera_y
+            self.camera_y -= self.config.get("endless_scroll_speed", 14) * dt_sec
+            self.player_roof_y = self.camera_y + self.height * 0.15
+            self._stream_chunks()
+        if self.water.is_game_over(self.player_roof_y):
+            self.status = "game_over"
+            return self.status
+
+        self._flood_buildings()
+        if timed:
+            t1 = time.perf_counter()
+            prof.add("water_update", t1 - t0)
+            t0 = t1
+
+        drone = self.drone
+        if drone:
+            drone.update(dt_sec, inputs, self.view_rect() if self.endless else self.left_panel)
+            drone_rect = drone.get_rect()
+            for b in self.building_grid.query(drone_rect):
+                if drone_rect.colliderect(b.rect):
+                    self._collect(b)
+            if timed:
+                t1 = time.perf_counter()
+                prof.add("drone", t1 - t0)
+                t0 = t1
+            if drone.pos[1] + drone.radius > self.water.level:
+                # Дрон чиркает по воде: поверхность продавливается под ним
+                self.water.disturb(drone.pos[0], 600.0 * dt_sec, drone.radius * 2)
+            if drone.health <= 0:
+                self.drone = None
+                self.drones_lost += 1
+            else:
+                if self._lightning_due:
+                    self._spawn_lightning(self.clock.now())
+                # Зона поражения молнии лежит внутри её прямоугольника, расширенного на радиус + 15
+                reach = drone.radius + 15
+                for L in self.hazard_grid.query((drone.pos[0] - reach, drone.pos[1] - reach, reach * 2, reach * 2)):
+                    L.update(drone)
+        if timed:
+            t1 = time.perf_counter()
+            prof.add("lightning", t1 - t0)
+            t0 = t1
+        if self.particles is not None:
+            self._update_particles(dt_sec)
+            if timed:
+                prof.add("particles", time.perf_counter() - t0)
+
+        if self.buildings_left == 0 and not self.endless:
+            self.status = "level_complete"
+        return self.status
+
+
+class Autopilot:
+    """Автопилот дрона: вместо клавиатуры выдаёт биты INPUT_* для Simulation.step.
+    Маршрут облёта несобранных крыш строится по частям в пределах бюджета времени на кадр:
+    сначала цепочка «ближайший сосед» от конца маршрута, затем улучшения 2-opt. Расстояния
+    между крышами кэшируются. Собранные, затопленные и выгруженные крыши выпадают из маршрута,
+    очереди и кэша на ближайшем кадре; новые чанки бесконечного режима дописываются в очередь
+    на планирование. Когда вода близко к крыше игрока, первой целью становится ближайшая
+    солнечная панель. От активных молний дрон уходит в сторону.
+    budget_ms=None — планировать без ограничения (детерминированно, для sweep.py)."""
+    SCAN_STEP = 64  # кандидатов между проверками дедлайна
+    DIST_CACHE_LIMIT = 200000
+
+    def __init__(self, budget_ms=1.0, urgency=0.35):
+        self.budget = None if budget_ms is None else budget_ms / 1000.0
+        self.urgency = urgency  # запас воды (water_margin), ниже которого важнее всего панели
+        self.reset()
+
+    def reset(self):
+        self.route = []
+        self._pending = []
+        self._seeded = False
+        self._seen_chunks = set()
+        self._dist = {}
+        self._scan = 0
+        self._best = None
+        self._best_d = None
+        self._opt_i = 1
+        self._opt_j = 2
+        self._opt_dirty = False
+        self._solar = None
+
+    # --- Планирование ---
+    def _d(self, a, b):
+        key = (a, b) if id(a) < id(b) else (b, a)
+        d = self._dist.get(key)
+        if d is None:
+            if len(self._dist) >= self.DIST_CACHE_LIMIT:
+                self._dist.clear()
+            d = self._dist[key] = math.hypot(a.rect.centerx - b.rect.centerx, a.rect.centery - b.rect.centery)
+        return d
+
+    @staticmethod
+    def _valid(sim, b):
+        # В сетке лежат ровно несобранные крыши над водой из загруженных чанков
+        return b in sim.building_grid
+
+    def _collect_new(self, sim):
+        """Поставить в очередь крыши новых чанков; True, если какие-то чанки уже выгружены."""
+        evicted = False
+        if sim.endless:
+            for index, chunk in sim.chunks.items():
+                if index not in self._seen_chunks:
+                    self._seen_chunks.add(index)
+                    self._pending.extend(chunk)
+            stale = self._seen_chunks.difference(sim.chunks)
+            if stale:
+                self._seen_chunks -= stale
+                evicted = True
+        elif not self._seeded:
+            self._pending.extend(sim.buildings)
+        self._seeded = True
+        return evicted
+
+    def _prune(self, sim, evicted):
+        """Убрать собранные, затопленные и выгруженные крыши из любого места маршрута. Кэш
+        расстояний и очередь чистятся, только когда что-то выпало, — иначе они держали бы
+        живыми здания давно выгруженных чанков."""
+        valid = self._valid
+        route = [b for b in self.route if valid(sim, b)]
+        if len(route) == len(self.route) and not evicted:
+            return
+        self.route = route
+        self._opt_dirty = True
+        self._opt_i, self._opt_j = 1, 2
+        self._pending = [b for b in self._pending if valid(sim, b)]
+        self._scan = 0
+        self._best = self._best_d = None
+        if self._solar is not None and not valid(sim, self._solar):
+            self._solar = None
+        self._dist = {key: d for key, d in self._dist.items() if valid(sim, key[0]) and valid(sim, key[1])}
+
+    def _extend(self, sim, deadline):
+        """Дописать в маршрут ближайшую к его концу крышу; просмотр продолжается с прошлого кадра."""
+        pending = self._pending
+        tail = self.route[-1] if self.route else None
+        if tail is None:
+            ox, oy = sim.drone.pos if sim.drone else (sim.left_panel.centerx, sim.player_roof_y)
+        while self._scan < len(pending):
+            end = min(len(pending), self._scan + self.SCAN_STEP)
+            i = self._scan
+            while i < end:
+                b = pending[i]
+                if not self._valid(sim, b):
+                    pending[i] = pending[-1]
+                    pending.pop()
+                    end = min(end, len(pending))
+                    if self._best is b:
+                        self._best = None
+                    continue
+                d = self._d(tail, b) if tail is not None else math.hypot(b.rect.centerx - ox, b.rect.centery - oy)
+                if self._best_d is None or d < self._best_d:
+                    self._best, self._best_d = b, d
+                i += 1
+            self._scan = i
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+        best = self._best
+        self._scan = 0
+        self._best = self._best_d = None
+        if best is not None and self._valid(sim, best):
+            pending.remove(best)
+            self.route.append(best)
+            self._opt_dirty = True
+        return True
+
+    def _two_opt(self, sim, deadline):
+        """Один проход 2-opt по частям; возвращает False, если не уложился в дедлайн."""
+        route = self.route
+        n = len(route)
+        d = self._d
+        checks = 0
+        while self._opt_i < n - 1:
+            i = self._opt_i
+            while self._opt_j < n:
+                j = self._opt_j
+                a, b, c = route[i - 1], route[i], route[j]
+                # Разворот route[i..j]: рёбра (a, b) и (c, e) меняются на (a, c) и (b, e)
+                delta = d(a, c) - d(a, b)
+                if j + 1 < n:
+                    e = route[j + 1]
+                    delta += d(b, e) - d(c, e)
+                if delta < -1e-6:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                self._opt_j += 1
+                checks += 1
+                if checks >= self.SCAN_STEP:
+                    checks = 0
+                    if deadline is not None and time.perf_counter() >= deadline:
+                        return False
+            self._opt_i += 1
+            self._opt_j = self._opt_i + 1
+        self._opt_i, self._opt_j = 1, 2
+        return True
+
+    def plan(self, sim, budget=None):
+        """Поработать над маршрутом не дольше budget секунд (None — self.budget)."""
+        budget = self.budget if budget is None else budget
+        deadline = None if budget is None else time.perf_counter() + budget
+        self._prune(sim, self._collect_new(sim))
+        route = self.route
+        while self._pending:
+            if not self._extend(sim, deadline):
+                return
+        if self._opt_dirty and len(route) > 3:
+            if self._two_opt(sim, deadline):
+                self._opt_dirty = False
+
+    # --- Управление ---
+    def target(self, sim):
+        if sim.water_margin() < self.urgency:
+            if self._solar is None or not self._valid(sim, self._solar):
+                x, y = sim.drone.pos
+                solar = [b for b in self.route if b.has_artifact == "solar_panel" and self._valid(sim, b)]
+                self._solar = min(solar, key=lambda b: math.hypot(b.rect.centerx - x, b.rect.centery - y), default=None)
+            if self._solar is not None:
+                return self._solar
+        for b in self.route:
+            if self._valid(sim, b):
+                return b
+        return None
+
+    def steer(self, sim):
+        """Биты ввода на ближайший тик: отправить дрона или вести его к цели, обходя молнии."""
+        drone = sim.drone
+        if drone is None:
+            return INPUT_SEND if sim.can_send_drone() else 0
+        goal = self.target(sim)
+        if goal is None:
+            return 0
+        x, y = drone.pos
+        dx = goal.rect.centerx - x
+        dy = goal.rect.centery - y
+        bits = 0
+        if dx < -4:
+            bits |= INPUT_LEFT
+        elif dx > 4:
+            bits |= INPUT_RIGHT
+        if dy < -4:
+            bits |= INPUT_UP
+        elif dy > 4:
+            bits |= INPUT_DOWN
+        # Молния бьёт в зоне rect ± (радиус + 15); с запасом уходим от неё по горизонтали
+        reach = drone.radius + 25
+        ahead = drone.speed * 0.1
+        nx = x + (ahead if bits & INPUT_RIGHT else -ahead if bits & INPUT_LEFT else 0)
+        ny = y + (ahead if bits & INPUT_DOWN else -ahead if bits & INPUT_UP else 0)
+        for L in sim.hazard_grid.query((x - reach - ahead, y - reach - ahead, (reach + ahead) * 2, (reach + ahead) * 2)):
+            if L.is_done():
+                continue
+            zone = L.rect.inflate(reach * 2, reach * 2)
+            if zone.collidepoint(x, y) or zone.collidepoint(nx, ny):
+                bits &= ~(INPUT_LEFT | INPUT_RIGHT)
+                bits |= INPUT_LEFT if x < L.rect.centerx else INPUT_RIGHT
+                break
+        return bits
+
+    def inputs(self, sim, tick=None):
+        """Спланировать в пределах бюджета и выдать биты ввода. Подходит как политика sweep.py."""
+        if sim.drone is not None:
+            self.plan(sim)
+        return self.steer(sim)
+
+
+# --- Запись ввода и повтор ---
+# Формат .rec (little-endian): заголовок REPLAY_HEADER + JSON конфигурации, затем записи
+# REPLAY_RUN (число тиков, биты INPUT_*) — одинаковый ввод подряд сжимается в одну запись.
+# Биты REPLAY_RESIZE: следом REPLAY_SIZE (новый размер окна). Запись с нулём тиков завершает
+# ввод, за ней — JSON итогов игры для проверки повтора.
+REPLAY_MAGIC = b"FLOODREC"
+REPLAY_VERSION = 1
+# Зерно — знаковое 64-битное ("rng_seed" и --seed бывают отрицательными); неотрицательные зёрна
+# кодируются так же, как прежним беззнаковым полем, поэтому версия формата не менялась
+REPLAY_HEADER = struct.Struct("<8sHqdHHH")  # magic, версия, зерно, tick_dt, ширина, высота, ширина левой панели
+REPLAY_RUN = struct.Struct("<HB")
+REPLAY_SIZE = struct.Struct("<HH")
+REPLAY_LEN = struct.Struct("<I")
+REPLAY_RESIZE = 0x80
+
+
+def replay_summary(sim, ticks):
+    """Итог игры, по которому сверяется повтор."""
+    return {
+        "ticks": ticks,
+        "status": sim.status,
+        "time": sim.time,
+        "coins_earned": sim.coins_earned,
+        "artifacts_collected": sim.artifacts_collected,
+        "drones_lost": sim.drones_lost,
+        "energy": sim.energy,
+        "water_level": sim.water.level,
+    }
+
+
+class ReplayRecorder:
+    """Пишет ввод игры в файл .rec: зерно, конфигурация, размер окна и биты ввода каждого тика."""
+    def __init__(self, path, seed, config, size, panel_left_w, tick_dt):
+        self.path = path
+        self.ticks = 0
+        self._bits = None
+        self._run = 0
+        self._size = tuple(size)
+        self._file = open(path, "wb")
+        self._file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, tick_dt, size[0], size[1], panel_left_w))
+        data = json.dumps(config, ensure_ascii=False).encode("utf-8")
+        self._file.write(REPLAY_LEN.pack(len(data)) + data)
+
+    def _flush_run(self):
+        if self._run:
+            self._file.write(REPLAY_RUN.pack(self._run, self._bits))
+            self._run = 0
+
+    def record(self, bits):
+        """Ввод очередного тика — вызывается перед каждым Simulation.step."""
+        bits &= 0x7F
+        if bits != self._bits or self._run == 0xFFFF:
+            self._flush_run()
+            self._bits = bits
+        self._run += 1
+        self.ticks += 1
+
+    def resize(self, size):
+        size = tuple(size)
+        if size != self._size:
+            self._flush_run()
+            self._size = size
+            self._file.write(REPLAY_RUN.pack(1, REPLAY_RESIZE) + REPLAY_SIZE.pack(*size))
+
+    def close(self, sim):
+        """Дописать итог игры и закрыть файл. Повторный вызов ничего не делает."""
+        if self._file is None:
+            return
+        self._flush_run()
+        data = json.dumps(replay_summary(sim, self.ticks), ensure_ascii=False).encode("utf-8")
+        self._file.write(REPLAY_RUN.pack(0, 0) + REPLAY_LEN.pack(len(data)) + data)
+        self._file.close()
+        self._file = None
+
+
+class Replay:
+    """Содержимое файла .rec."""
+    def __init__(self, seed, tick_dt, size, panel_left_w, config, events, summary):
+        self.seed = seed
+        self.tick_dt = tick_dt
+        self.size = size
+        self.panel_left_w = panel_left_w
+        self.config = config
+        self.events = events  # [(число тиков, биты)] и (0, REPLAY_RESIZE, (ширина, высота))
+        self.summary = summary  # None, если запись оборвалась
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, tick_dt, width, height, panel_w = REPLAY_HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path}: не файл записи или неизвестная версия")
+        offset = REPLAY_HEADER.size
+        (n,) = REPLAY_LEN.unpack_from(data, offset)
+        offset += REPLAY_LEN.size
+        config = json.loads(data[offset:offset + n].decode("utf-8"))
+        offset += n
+        events = []
+        summary = None
+        while offset + REPLAY_RUN.size <= len(data):
+            run, bits = REPLAY_RUN.unpack_from(data, offset)
+            offset += REPLAY_RUN.size
+            if run == 0:
+                (n,) = REPLAY_LEN.unpack_from(data, offset)
+                offset += REPLAY_LEN.size
+                summary = json.loads(data[offset:offset + n].decode("utf-8"))
+                break
+            if bits == REPLAY_RESIZE:
+                events.append((0, REPLAY_RESIZE, REPLAY_SIZE.unpack_from(data, offset)))
+                offset += REPLAY_SIZE.size
+            else:
+                events.append((run, bits))
+        return cls(seed, tick_dt, (width, height), panel_w, config, events, summary)
+
+    def panels(self, size):
+        """Левая и правая панели для размера окна size, как в run_game."""
+        width, height = size
+        return (pygame.Rect(0, 0, self.panel_left_w, height),
+                pygame.Rect(self.panel_left_w, 0, width - self.panel_left_w, height))
+
+    def simulation(self):
+        left_panel, _ = self.panels(self.size)
+        return Simulation(self.config, left_panel, self.size[1], rng=random.Random(self.seed))
+
+    def inputs(self):
+        """Биты ввода по тикам; смена размера окна приходит как кортеж (ширина, высота)."""
+        for event in self.events:
+            if event[1] == REPLAY_RESIZE:
+                yield event[2]
+            else:
+                run, bits = event
+                for _ in range(run):
+                    yield bits
+
+
+class PlayRenderer:
+    """Игровой экран слоями. Статичный слой (небо, крыша игрока, здания) и рамка правой панели
+    собираются заранее и перестраиваются только при изменениях мира или размера окна.
+    draw() перерисовывает лишь изменившиеся области и возвращает их для вывода (present, см. create_display)."""
+    SKY_COLOR = (50, 60, 85)
+    PANEL_COLOR = (38, 48, 65)
+    ROOF_H = 28
+
+    def __init__(self, font_small, font_medium, font_large, panel_margin=20):
+        self.font_small = font_small
+        self.font_medium = font_medium
+        self.font_large = font_large
+        self.panel_margin = panel_margin
+        self._static = None
+        self._static_key = None
+        self._chrome = None
+        self._chrome_key = None
+        self._hud_key = None
+        self._layout_key = None
+        self._water_key = None
+        self._prev_dynamic = []
+        self._prev_particles = None  # область частиц прошлого кадра: её тоже надо вывести
+        self._particles_over = False  # частицы рисуются поверх кадра с сохранением фона (ParticleSystem.draw_over)
+        self._full = True
+        self._alpha = 1.0
+        self._extra_dirty = []
+        self.profiler = None  # FrameProfiler: замеры фаз water_draw / buildings / hud
+        # Детализация (см. QUALITY_LEVELS): подписи, шаг линии волны, период HUD
+        self.labels = True
+        self.wave_stride = 1
+        self.hud_interval = 0.0
+
+    def set_quality(self, settings):
+        """Применить уровень из QUALITY_LEVELS; подписи зданий лежат в статичном слое — он пересобирается."""
+        if settings["labels"] != self.labels:
+            self.invalidate()
+        self.labels = settings["labels"]
+        self.wave_stride = settings["wave_stride"]
+        self.hud_interval = settings["hud_interval"]
+
+    def invalidate(self):
+        """Следующий кадр перерисовать целиком (новая игра, смена экрана, изменение окна)."""
+        self._full = True
+        self._static_key = None
+        self._layout_key = None
+        self._hud_key = None
+
+    # --- Статичные слои ---
+    def _build_static(self, screen, sim, left_panel):
+        surf = pygame.Surface((left_panel.right, left_panel.bottom), 0, screen)
+        surf.fill(self.SKY_COLOR, left_panel)
+        roof_h = self.ROOF_H
+        # Крыша игрока всегда на одном месте экрана: в бесконечном режиме она едет вместе с камерой
+        roof_y = int(sim.player_roof_y - sim.camera_y) + left_panel.y
+        roof_rect = pygame.Rect(left_panel.x, roof_y - roof_h, left_panel.width, roof_h)
+        pygame.draw.rect(surf, (120, 125, 135), roof_rect)
+        pygame.draw.rect(surf, (180, 185, 195), roof_rect, 3)
+        roof_label = render_text(self.font_medium, "ВАША КРЫША — сюда не должна дойти вода!", (255, 255, 255))
+        surf.blit(roof_label, (left_panel.x + 20, roof_y - roof_h - 26))
+        pygame.draw.rect(surf, (70, 75, 90), (left_panel.x, 0, left_panel.width, roof_rect.top))
+        if sim.endless:
+            return surf
+        # Здания целиком: часть под водой закрывает слой воды, который рисуется поверх
+        font = self.font_small if self.labels else None
+        for b in sim.buildings:
+            b.draw(surf, left_panel.bottom, font)
+        return surf
+
+    def _build_chrome(self, screen, right_panel):
+        surf = pygame.Surface(right_panel.size, 0, screen)
+        surf.fill(self.PANEL_COLOR)
+        px = self.panel_margin
+        surf.blit(render_text(self.font_large, "Потоп", (220, 230, 240)), (px, 10))
+        surf.blit(render_text(self.font_small, "До крыши:", (200, 210, 220)), (px, 72))
+        surf.blit(render_text(self.font_small, "Энергия:", (200, 210, 220)), (px, 220))
+        surf.blit(render_text(self.font_small, "WASD/стрелки — летать. Коснитесь крыши — собрать артефакт.", (170, 180, 190)), (px, 272))
+        return surf
+
+    def layout_buttons(self, right_panel, btn_send, btn_recall):
+        """Положение кнопок правой панели; меняется только вместе с размером панели."""
+        key = tuple(right_panel)
+        if key == self._layout_key:
+            return
+        self._layout_key = key
+        px = right_panel.x + self.panel_margin
+        py = right_panel.y + 140
+        btn_send.rect.x = px
+        btn_send.rect.y = py
+        btn_send.rect.width = min(320, right_panel.width - self.panel_margin * 2)
+        btn_recall.rect = pygame.Rect(px, py, min(220, right_panel.width - self.panel_margin * 2), 44)
+
+    # --- Кадр ---
+    def _dynamic_rects(self, sim, left_panel):
+        rects = []
+        for L in sim.lightnings:
+            if not L.is_done():
+                rects.append(L.rect.inflate(4, 0))
+        if sim.drone:
+            rx, ry = sim.drone.render_pos(self._alpha)
+            x, y = int(rx), int(ry)
+            # Корпус, лучи с пропеллерами и подпись «Дрон» над ним
+            rects.append(pygame.Rect(x - 44, y - sim.drone.radius - 24, 88, sim.drone.radius * 2 + 40))
+        if sim.particles is not None and not self._particles_over:
+            area = sim.particles.bounds(sim.render_camera_y(self._alpha) if sim.endless else 0)
+            if area is not None:
+                rects.append(area)
+        return [r.clip(left_panel) for r in rects]
+
+    def add_dirty(self, rect):
+        """Перерисовать область в следующем кадре (например, под оверлеем профилировщика)."""
+        self._extra_dirty.append(pygame.Rect(rect))
+
+    def _draw_left(self, screen, sim, left_panel, rect):
+        prof = self.profiler
+        timed = prof is not None and prof.enabled
+        # Бесконечный режим: мир сдвинут на интерполированное положение камеры
+        offset = sim.render_camera_y(self._alpha) - left_panel.y if sim.endless else 0
+        font = self.font_small if self.labels else None
+        screen.set_clip(rect)
+        if timed:
+            t0 = time.perf_counter()
+        screen.blit(self._static, rect.topleft, rect)
+        if sim.endless:
+            for b in sim.visible_buildings():
+                b.draw(screen, sim.water.level, font, offset)
+        if timed:
+            t1 = time.perf_counter()
+            prof.add("buildings", t1 - t0)
+            t0 = t1
+        sim.water.draw(screen, left_panel, font, self._alpha, offset, self.wave_stride)
+        if timed:
+            prof.add("water_draw", time.perf_counter() - t0)
+        if sim.particles is not None and not self._particles_over:
+            sim.particles.draw(screen, offset)
+        for L in sim.lightnings:
+            L.draw(screen, offset)
+        if sim.drone:
+            sim.drone.draw(screen, font, self._alpha, offset)
+        screen.set_clip(None)
+
+    def _draw_hud(self, screen, sim, right_panel, high_score, btn_send, btn_recall):
+        screen.blit(self._chrome, right_panel.topleft)
+        px = right_panel.x + self.panel_margin
+        py = right_panel.y
+        survival_sec = sim.time
+        screen.blit(render_text(self.font_small, f"Время: {survival_sec:.1f} с  |  Рекорд: {high_score:.1f} с", (190, 200, 210)), (px, py + 42))
+        py += 72
+
+        # Блок «До крыши»: столбик + статус в одну строку
+        bar_x, bar_y = px + 90, py - 2
+        bar_w, bar_h = 24, 56
+        remaining = sim.water_margin()
+        pygame.draw.rect(screen, (45, 48, 58), (bar_x, bar_y, bar_w, bar_h))
+        fill_h = int(bar_h * remaining)
+        if fill_h > 0:
+            pygame.draw.rect(screen, (70, 120, 200), (bar_x + 2, bar_y + bar_h - fill_h, bar_w - 4, fill_h))
+        pygame.draw.rect(screen, (90, 95, 110), (bar_x, bar_y, bar_w, bar_h), 2)
+        status = "Опасно!" if remaining < 0.25 else "Есть запас"
+        status_color = (255, 120, 100) if remaining < 0.25 else (140, 200, 255)
+        screen.blit(render_text(self.font_small, status, status_color), (bar_x + bar_w + 10, bar_y + bar_h // 2 - 8))
+        py += 68
+
+        # Кнопка отправки дрона / Вернуться на базу
+        if sim.drone is None:
+            btn_send.draw(screen)
+            if sim.energy < DRONE_ENERGY_COST:
+                screen.blit(render_text(self.font_small, f"Нужно {DRONE_ENERGY_COST} энергии", (200, 120, 100)), (px, py + 56))
+        else:
+            btn_recall.draw(screen)
+            screen.blit(render_text(self.font_small, "WASD — управление дроном", (180, 200, 220)), (px, py + 48))
+        py += 80
+
+        # Энергия
+        ebar_y = py + 20
+        ebar_w = min(220, right_panel.width - self.panel_margin * 2 - 80)
+        pygame.draw.rect(screen, (45, 48, 58), (px, ebar_y, ebar_w, 22))
+        pygame.draw.rect(screen, (60, 130, 200), (px + 2, ebar_y + 2, max(0, int(ebar_w * sim.energy / max(sim.energy_max, 1)) - 4), 18))
+        screen.blit(render_text(self.font_small, f"{int(sim.energy)}/{sim.energy_max}", (180, 190, 200)), (px + ebar_w + 8, ebar_y - 2))
+        py += 52
+
+        screen.blit(render_text(self.font_small, f"Монет за уровень: +{sim.coins_earned}", (255, 220, 120)), (px, py + 20))
+
+    def draw(self, screen, sim, left_panel, right_panel, high_score, btn_send, btn_recall, alpha=1.0):
+        """Нарисовать кадр игры; возвращает список изменённых прямоугольников экрана.
+        alpha — доля тика, прошедшая после последнего шага симуляции (для интерполяции)."""
+        dirty = []
+        self._alpha = alpha
+        full = self._full
+        self._full = False
+
+        prof = self.profiler
+        timed = prof is not None and prof.enabled
+        static_key = (tuple(left_panel), sim.world_version, self.labels)
+        if static_key != self._static_key:
+            if timed:
+                t0 = time.perf_counter()
+            self._static = self._build_static(screen, sim, left_panel)
+            self._static_key = static_key
+            full = True
+            if timed:
+                prof.add("buildings", time.perf_counter() - t0)
+        chrome_key = tuple(right_panel)
+        if chrome_key != self._chrome_key:
+            self._chrome = self._build_chrome(screen, right_panel)
+            self._chrome_key = chrome_key
+            self._hud_key = None
+
+        # Частицы (дождь покрывает всю панель) рисуются поверх кадра с сохранением пикселей под ними:
+        # в начале следующего кадра они стираются, и перерисовывать фон под дождём не нужно
+        particles = sim.particles
+        self._particles_over = particles is not None and ParticleSystem.can_overlay(screen)
+        if self._particles_over:
+            if full or sim.endless:
+                particles.forget()  # панель перерисовывается целиком
+            else:
+                particles.erase(screen)
+
+        # Левая панель: вода меняется целиком при сдвиге уровня на пиксель, иначе — полоса волны
+        level = int(sim.water.render_level(alpha))
+        water_key = (level, tuple(left_panel))
+        # Камера бесконечного режима сдвигает весь мир: левую панель проще перерисовать целиком
+        if full or sim.endless:
+            left_rects = [pygame.Rect(left_panel)]
+        else:
+            if water_key != self._water_key:
+                top = min(level, self._water_key[0]) if self._water_key else level
+                band = pygame.Rect(left_panel.x, top - 28, left_panel.width, left_panel.bottom - top + 28)
+            else:
+                # Подпись над водой и полоса волн: зыбь ±4 px плюс смещение узлов до WAVE_MAX
+                band = pygame.Rect(left_panel.x, level - 28, left_panel.width, 36 + WAVE_MAX + 4)
+            dynamic = self._dynamic_rects(sim, left_panel)
+            left_rects = [band.clip(left_panel)] + self._prev_dynamic + dynamic
+            left_rects += [r.clip(left_panel) for r in self._extra_dirty]
+            self._prev_dynamic = dynamic
+        self._water_key = water_key
+        if full or sim.endless:
+            self._prev_dynamic = self._dynamic_rects(sim, left_panel)
+        for r in _merge_rects(left_rects):
+            if r.width > 0 and r.height > 0:
+                self._draw_left(screen, sim, left_panel, r)
+                dirty.append(r)
+        if self._particles_over:
+            offset = sim.render_camera_y(alpha) - left_panel.y if sim.endless else 0
+            screen.set_clip(left_panel)
+            area = particles.draw_over(screen, offset)
+            screen.set_clip(None)
+            # Выводится и то, где частицы были, и то, где они теперь
+            shown = [r for r in (self._prev_particles, area) if r is not None]
+            self._prev_particles = area
+            if shown:
+                dirty = _merge_rects(dirty + shown)
+
+        # Правая панель: перерисовывается только при изменении показаний
+        remaining = sim.water_margin()
+        if self.hud_interval > 0:
+            # Показания, меняющиеся каждый тик, обновляются не чаще раза в hud_interval секунд игры
+            ticking = int(sim.time / self.hud_interval)
+        else:
+            ticking = (f"{sim.time:.1f}", f"{high_score:.1f}", int(56 * remaining), int(sim.energy))
+        hud_key = (
+            ticking, remaining < 0.25, sim.drone is None, sim.energy_max, sim.coins_earned,
+            btn_send.hover, btn_recall.hover,
+        )
+        if any(r.colliderect(right_panel) for r in self._extra_dirty):
+            self._hud_key = None
+        self._extra_dirty = []
+        if full or hud_key != self._hud_key:
+            self._hud_key = hud_key
+            if timed:
+                t0 = time.perf_counter()
+            self._draw_hud(screen, sim, right_panel, high_score, btn_send, btn_recall)
+            if timed:
+                prof.add("hud", time.perf_counter() - t0)
+            dirty.append(pygame.Rect(right_panel))
+        return dirty
+
+
+def _merge_rects(rects):
+    """Объединить пересекающиеся прямоугольники, чтобы не перерисовывать область дважды."""
+    merged = []
+    for r in rects:
+        r = pygame.Rect(r)
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(r):
+                r.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(r)
+    return merged
+
+# --- Экраны вне игры ---
+# Товары магазина: название, ключ в config.json, цена, максимум покупок
+SHOP_ITEMS = (
+    ("Скорость дрона +1", "drone_speed_bonus", 50, 3),
+    ("Макс. энергия +20", "energy_max_bonus", 40, 5),
+    ("Замедление воды +5 сек", "slow_duration_bonus", 60, 3),
+)
+
+
+class BuyButton(Button):
+    """Кнопка «Купить» магазина: подсвечивается при наведении, только если покупка доступна."""
+    __slots__ = ("enabled",)
+
+    def __init__(self, x, y, w, h, font):
+        super().__init__(x, y, w, h, "Купить", font)
+        self.enabled = False
+
+    def draw(self, surface):
+        color = (80, 140, 80) if self.hover and self.enabled else (60, 70, 90)
+        pygame.draw.rect(surface, color, self.rect)
+        surface.blit(render_text(self.font, self.text, (220, 220, 220)), (self.rect.x + 18, self.rect.y + 6))
+
+
+class Screen:
+    """Статичный экран (меню, магазин, итог игры). Фон с надписями рендерится в кэш один раз
+    на размер окна и данные экрана; дальше на кадре перерисовываются только кнопки, у которых
+    сменилось наведение. draw возвращает прямоугольники для вывода (present, см. create_display)."""
+    background = (35, 45, 65)
+
+    def __init__(self, font_small, font_medium, font_large):
+        self.font_small = font_small
+        self.font_medium = font_medium
+        self.font_large = font_large
+        self.buttons = {}  # действие -> Button
+        self._cache = None
+        self._key = None
+
+    def invalidate(self):
+        """Перерисовать экран целиком на ближайшем draw (смена экрана, окно перекрыто)."""
+        self._key = None
+
+    def layout(self, size, data):
+        """Расставить кнопки под размер окна и данные."""
+
+    def render_static(self, surface, size, data):
+        """Надписи, которые меняются только вместе с размером окна или данными."""
+
+    def draw(self, screen, mouse_pos, data=()):
+        size = screen.get_size()
+        key = (size, data)
+        if key != self._key:
+            self._key = key
+            self.layout(size, data)
+            if self._cache is None or self._cache.get_size() != size:
+                self._cache = pygame.Surface(size, 0, screen)
+            self._cache.fill(self.background)
+            self.render_static(self._cache, size, data)
+            screen.blit(self._cache, (0, 0))
+            for button in self.buttons.values():
+                button.update_hover(mouse_pos)
+                button.draw(screen)
+            return [screen.get_rect()]
+        dirty = []
+        for button in self.buttons.values():
+            hover = button.rect.collidepoint(mouse_pos)
+            if hover != button.hover:
+                button.hover = hover
+                screen.blit(self._cache, button.rect, button.rect)
+                button.draw(screen)
+                dirty.append(button.rect)
+        return dirty
+
+    def click(self, pos):
+        """Действие нажатой кнопки или None."""
+        for action, button in self.buttons.items():
+            if button.is_clicked(pos):
+                return action
+        return None
+
+
+class MenuScreen(Screen):
+    """Главное меню; данные — (монеты,)."""
+    def __init__(self, font_small, font_medium, font_large):
+        super().__init__(font_small, font_medium, font_large)
+        self.buttons = {
+            "play": Button(0, 0, 220, 50, "Играть", font_large),
+            "shop": Button(0, 0, 220, 50, "Магазин", font_large),
+            "exit": Button(0, 0, 220, 50, "Выход", font_medium),
+        }
+
+    def layout(self, size, data):
+        cx, cy = size[0] // 2, size[1] // 2
+        self.buttons["play"].rect.topleft = (cx - 110, cy - 80)
+        self.buttons["shop"].rect.topleft = (cx - 110, cy - 20)
+        self.buttons["exit"].rect.topleft = (cx - 110, cy + 40)
+
+    def render_static(self, surface, size, data):
+        width, height = size
+        title = render_text(self.font_large, "Потоп (Flood)", (220, 230, 250))
+        surface.blit(title, (width // 2 - title.get_width() // 2, height // 4 - 30))
+        sub = render_text(self.font_small, "Собирайте артефакты. Управляйте дроном — WASD или стрелки.", (180, 190, 210))
+        surface.blit(sub, (width // 2 - sub.get_width() // 2, height // 4 + 20))
+        coins_text = render_text(self.font_small, f"Монеты: {data[0]}", (255, 220, 100))
+        surface.blit(coins_text, (width - coins_text.get_width() - 20, 15))
+
+
+class ShopScreen(Screen):
+    """Магазин; данные — (монеты, куплено по каждому товару SHOP_ITEMS).
+    click возвращает "back" или ключ товара из config.json."""
+    def __init__(self, font_small, font_medium, font_large):
+        super().__init__(font_small, font_medium, font_large)
+        self.buttons = {key: BuyButton(0, 0, 80, 28, font_small) for _, key, _, _ in SHOP_ITEMS}
+        self.buttons["back"] = Button(0, 0, 180, 44, "Назад", font_medium)
+
+    def layout(self, size, data):
+        width, height = size
+        coins, bought = data
+        by = 130
+        for (_, key, price, max_buy), current in zip(SHOP_ITEMS, bought):
+            button = self.buttons[key]
+            button.rect.topleft = (width // 2 + 120, by - 4)
+            button.enabled = current < max_buy and coins >= price
+            by += 42
+        self.buttons["back"].rect.topleft = (width // 2 - 90, height - 80)
+
+    def render_static(self, surface, size, data):
+        width = size[0]
+        coins, bought = data
+        surface.blit(render_text(self.font_large, "Магазин", (220, 230, 240)), (width // 2 - 50, 30))
+        surface.blit(render_text(self.font_medium, f"Монеты: {coins}", (255, 220, 100)), (width // 2 - 60, 75))
+        by = 130
+        for (name, _, price, max_buy), current in zip(SHOP_ITEMS, bought):
+            color = (200, 200, 200) if current < max_buy and coins >= price else (120, 120, 120)
+            surface.blit(render_text(self.font_small, f"{name} — {price} монет ({current}/{max_buy})", color), (width // 2 - 180, by))
+            by += 42
+
+
+class GameOverScreen(Screen):
+    """Итог проигрыша; данные — (время игры, рекорд)."""
+    background = (30, 30, 40)
+
+    def __init__(self, font_small, font_medium, font_large):
+        super().__init__(font_small, font_medium, font_large)
+        self.buttons = {"menu": Button(0, 0, 200, 48, "В меню", font_medium)}
+
+    def layout(self, size, data):
+        self.buttons["menu"].rect.topleft = (size[0] // 2 - 100, size[1] // 2 + 30)
+
+    def render_static(self, surface, size, data):
+        width, height = size
+        surface.blit(render_text(self.font_large, "Вода достигла крыши. Игра окончена.", (220, 100, 100)), (width // 2 - 220, height // 2 - 60))
+        surface.blit(render_text(self.font_medium, f"Время: {data[0]:.1f} с. Рекорд: {data[1]:.1f} с.", (200, 200, 200)), (width // 2 - 150, height // 2 - 15))
+
+
+class LevelCompleteScreen(Screen):
+    """Уровень пройден; данные — (заработано монет,)."""
+    background = (30, 50, 40)
+
+    def __init__(self, font_small, font_medium, font_large):
+        super().__init__(font_small, font_medium, font_large)
+        self.buttons = {"menu": Button(0, 0, 200, 48, "В меню", font_medium)}
+
+    def layout(self, size, data):
+        self.buttons["menu"].rect.topleft = (size[0] // 2 - 100, size[1] // 2 + 50)
+
+    def render_static(self, surface, size, data):
+        width, height = size
+        surface.blit(render_text(self.font_large, "Уровень пройден!", (120, 255, 150)), (width // 2 - 120, height // 2 - 80))
+        surface.blit(render_text(self.font_medium, "Все артефакты собраны. Миссия выполнена.", (200, 220, 200)), (width // 2 - 180, height // 2 - 40))
+        surface.blit(render_text(self.font_medium, f"+{data[0]} монет", (255, 220, 100)), (width // 2 - 60, height // 2))
+
+
+SCREENS = {"menu": MenuScreen, "shop": ShopScreen, "game_over": GameOverScreen, "level_complete": LevelCompleteScreen}
+
+
+
+PROFILER_PHASES = ("events", "autopilot", "water_update", "drone", "lightning", "particles", "water_draw", "buildings", "hud", "flip")
+PROFILER_HISTORY = 300  # кадров в кольцевых буферах
+PROFILER_COLORS = {
+    "events": (200, 200, 120), "autopilot": (200, 140, 230), "water_update": (90, 160, 255), "drone": (230, 230, 240), "lightning": (255, 255, 140),
+    "particles": (180, 200, 230), "water_draw": (60, 110, 220), "buildings": (160, 160, 170), "hud": (120, 220, 140), "flip": (240, 130, 110),
+}
+
+
+def frame_budget_ms(render_fps, tick_rate):
+    """Бюджет кадра, мс: по render_fps, а при 0 (без ограничения) — по частоте тиков симуляции."""
+    return 1000.0 / max(1, render_fps or tick_rate)
+
+
+class FrameProfiler:
+    """Замеры фаз кадра в кольцевых буферах фиксированного размера.
+    Выключенный профилировщик сводится к одной проверке enabled на фазу."""
+    def __init__(self, size=PROFILER_HISTORY, enabled=False, budget_ms=1000.0 / FPS):
+        self.enabled = enabled
+        self.size = size
+        self.budget_ms = budget_ms  # бюджет кадра: полная полоса фазы в оверлее
+        self.frame_times = array("d", bytes(8 * size))
+        self.phase_times = {p: array("d", bytes(8 * size)) for p in PROFILER_PHASES}
+        self._current = dict.fromkeys(PROFILER_PHASES, 0.0)
+        self._index = 0
+        self.count = 0
+        self.startup = None  # замеры запуска (run_game), попадают в JSON-трассу
+        self.quality = None  # смены уровня качества (QualityGovernor.changes), тоже в JSON-трассу
+        self._frame_start = None
+        self._overlay = None
+        self._overlay_built = 0.0
+
+    def begin_frame(self):
+        """Закрыть предыдущий кадр и начать новый (вызывать в начале каждого кадра)."""
+        if not self.enabled:
+            self._frame_start = None
+            return
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            i = self._index
+            self.frame_times[i] = now - self._frame_start
+            current = self._current
+            for p in PROFILER_PHASES:
+                self.phase_times[p][i] = current[p]
+                current[p] = 0.0
+            self._index = (i + 1) % self.size
+            self.count += 1
+        self._frame_start = now
+
+    def add(self, phase, seconds):
+        self._current[phase] += seconds
+
+    def _ordered(self, buf):
+        n = min(self.count, self.size)
+        if self.count <= self.size:
+            return list(buf[:n])
+        return list(buf[self._index:]) + list(buf[:self._index])
+
+    def frame_samples(self):
+        return self._ordered(self.frame_times)
+
+    def phase_samples(self, phase):
+        return self._ordered(self.phase_times[phase])
+
+    def summary(self):
+        """Время кадра (мс): среднее и перцентили; средние по фазам (мс)."""
+        frames = sorted(self.frame_samples())
+        if not frames:
+            return None
+        pick = lambda q: frames[min(len(frames) - 1, int(q * len(frames)))] * 1000.0
+        n = len(frames)
+        return {
+            "frames": n,
+            "mean": sum(frames) / n * 1000.0,
+            "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "phases": {p: sum(self.phase_samples(p)) / n * 1000.0 for p in PROFILER_PHASES},
+        }
+
+    def dump(self, path):
+        """Сохранить трассу (последние кадры) в JSON или CSV — по расширению файла."""
+        frames = self.frame_samples()
+        phases = {p: self.phase_samples(p) for p in PROFILER_PHASES}
+        if path.lower().endswith(".csv"):
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(("frame_ms",) + tuple(p + "_ms" for p in PROFILER_PHASES))
+                for i, ft in enumerate(frames):
+                    writer.writerow([round(ft * 1000.0, 4)] + [round(phases[p][i] * 1000.0, 4) for p in PROFILER_PHASES])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "summary": self.summary(),
+                    "startup_ms": self.startup,
+                    "quality_changes": self.quality,
+                    "frame_ms": [round(t * 1000.0, 4) for t in frames],
+                    "phases_ms": {p: [round(t * 1000.0, 4) for t in v] for p, v in phases.items()},
+                }, f, ensure_ascii=False)
+
+    def draw_overlay(self, surface, font, pos=(8, 8)):
+        """Оверлей: время кадра, перцентили и полосы фаз. Пересобирается 4 раза в секунду.
+        Возвращает занятый прямоугольник."""
+        now = time.perf_counter()
+        if self._overlay is None or now - self._overlay_built >= 0.25:
+            self._overlay_built = now
+            self._overlay = self._build_overlay(surface, font)
+        return surface.blit(self._overlay, pos)
+
+    def _build_overlay(self, surface, font):
+        line_h = font.get_linesize()
+        width = 250
+        surf = pygame.Surface((width, line_h * (len(PROFILER_PHASES) + 2) + 8), 0, surface)
+        surf.fill((15, 18, 24))
+        s = self.summary()
+        if s is None:
+            surf.blit(font.render("профилировщик: нет данных", True, (220, 220, 220)), (6, 4))
+            return surf
+        budget_ms = self.budget_ms
+        surf.blit(font.render(f"кадр {s['mean']:.1f} мс  (~{1000.0 / max(s['mean'], 0.001):.0f} FPS)", True, (230, 230, 230)), (6, 4))
+        surf.blit(font.render(f"p50 {s['p50']:.1f}  p95 {s['p95']:.1f}  p99 {s['p99']:.1f} мс", True, (200, 200, 200)), (6, 4 + line_h))
+        y = 4 + line_h * 2
+        for p in PROFILER_PHASES:
+            ms = s["phases"][p]
+            bar_w = int(min(1.0, ms / budget_ms) * 90)
+            pygame.draw.rect(surf, PROFILER_COLORS[p], (150, y + 3, max(bar_w, 1), line_h - 6))
+            surf.blit(font.render(f"{p} {ms:.2f}", True, (200, 200, 200)), (6, y))
+            y += line_h
+        return surf
+
+# Уровни детализации, от полной к минимальной: шаг узлов линии воды, подписи зданий/дрона/воды,
+# доля эффектов частиц, период обновления HUD (с). Градиент воды — уже готовая полоса из кэша,
+# дешевле её не нарисовать, поэтому он здесь не участвует
+QUALITY_LEVELS = (
+    {"name": "высокое", "wave_stride": 1, "labels": True, "effects": 1.0, "hud_interval": 0.0},
+    {"name": "среднее", "wave_stride": 1, "labels": True, "effects": 0.5, "hud_interval": 0.25},
+    {"name": "низкое", "wave_stride": 2, "labels": False, "effects": 0.25, "hud_interval": 0.5},
+    {"name": "минимальное", "wave_stride": 4, "labels": False, "effects": 0.0, "hud_interval": 1.0},
+)
+
+
+def parse_quality(value):
+    """Значение "quality" из config.json: None — "auto", иначе номер уровня QUALITY_LEVELS.
+    Неизвестное значение печатается и заменяется на "auto", чтобы игра всё равно запустилась."""
+    if value == "auto":
+        return None
+    try:
+        level = int(value)
+    except (TypeError, ValueError):
+        print(f'Неизвестное значение "quality": {value!r} — используется "auto" (или число 0–{len(QUALITY_LEVELS) - 1})')
+        return None
+    return max(0, min(len(QUALITY_LEVELS) - 1, level))
+
+
+class QualityGovernor:
+    """Держит кадр в бюджете 1/target_fps, переключая QUALITY_LEVELS.
+    Смотрит на рабочее время кадра (clock.get_rawtime — без ожидания в clock.tick) окнами по window
+    кадров. p90 окна выше slow·бюджета — детализация сразу ниже; ниже fast·бюджета recover окон подряд —
+    на уровень выше. Гистерезис: между порогами уровень не меняется, а возврат на уровень, с которого
+    уже пришлось уйти, требует вдвое больше хороших окон, чем в прошлый раз."""
+    MAX_RECOVER = 64
+
+    def __init__(self, target_fps, level=0, window=30, slow=0.9, fast=0.5, recover=4, log=print):
+        self.budget_ms = 1000.0 / max(1, target_fps)
+        self.level = level
+        self.slow = slow
+        self.fast = fast
+        self.recover = recover
+        self.log = log
+        self._samples = array("d", bytes(8 * window))
+        self._count = 0
+        self._skip = 0
+        self._good = 0
+        self._needed = {}  # уровень -> хороших окон подряд для возврата на него
+        self.changes = []  # [время с запуска, с; уровень; причина]
+
+    @property
+    def settings(self):
+        return QUALITY_LEVELS[self.level]
+
+    def restart(self):
+        """Начать окно заново (новая игра): кадр с её созданием не показателен."""
+        self._count = 0
+        self._good = 0
+        self._skip = 2
+
+    def frame(self, work_ms):
+        """Учесть рабочее время кадра, мс. Возвращает True, если уровень сменился."""
+        if self._skip:
+            self._skip -= 1
+            return False
+        samples = self._samples
+        samples[self._count] = work_ms
+        self._count += 1
+        if self._count < len(samples):
+            return False
+        self._count = 0
+        p90 = sorted(samples)[int(len(samples) * 0.9)]
+        if p90 > self.budget_ms * self.slow:
+            self._good = 0
+            if self.level + 1 < len(QUALITY_LEVELS):
+                self._needed[self.level] = min(self.MAX_RECOVER, self._needed.get(self.level, self.recover // 2) * 2)
+                return self._set(self.level + 1, f"p90 кадра {p90:.1f} мс > {self.budget_ms * self.slow:.1f} мс")
+            return False
+        if p90 < self.budget_ms * self.fast and self.level > 0:
+            self._good += 1
+            needed = self._needed.get(self.level - 1, self.recover)
+            if self._good >= needed:
+                self._good = 0
+                return self._set(self.level - 1, f"p90 кадра {p90:.1f} мс < {self.budget_ms * self.fast:.1f} мс, "
+                                                  f"окон подряд: {needed}")
+        else:
+            self._good = 0
+        return False
+
+    def _set(self, level, reason):
+        self.level = level
+        self.changes.append([round(time.perf_counter() - STARTUP_T0, 3), level, reason])
+        if self.log:
+            self.log(f"Качество: {QUALITY_LEVELS[level]['name']} (уровень {level}) — {reason}")
+        return True
+
+
+class SurfaceDisplay:
+    """Вывод в окно pygame.display: кадр рисуется прямо в поверхность окна, её размер — размер окна,
+    на экран уходят только изменённые области."""
+    name = "surface"
+
+    def __init__(self, size, title):
+        self.canvas = pygame.display.set_mode(size, pygame.RESIZABLE)
+        pygame.display.set_caption(title)
+
+    def resize(self, size):
+        """Окно изменило размер. True — поверхность кадра стала другой и раскладку нужно пересчитать."""
+        self.canvas = pygame.display.set_mode(size, pygame.RESIZABLE)
+        return True
+
+    def to_canvas(self, pos):
+        """Координаты мыши в окне -> координаты на поверхности кадра."""
+        return pos
+
+    def expose(self):
+        """Окно перекрывалось или изменилось: следующий present показывает кадр целиком."""
+
+    def present(self, dirty):
+        if dirty:
+            pygame.display.update(dirty)
+
+
+class TextureDisplay:
+    """Вывод через pygame._sdl2.video (Window / Renderer / Texture). Кадр собирается в программной
+    поверхности постоянного размера (screen_width × screen_height), изменённые области загружаются
+    в потоковую текстуру, и рендерер одним копированием масштабирует её на окно с сохранением пропорций.
+    Размер окна поэтому не влияет ни на раскладку, ни на объём отрисовки. Драйвер "software" работает
+    без видеокарты."""
+    name = "texture"
+
+    def __init__(self, size, title, driver="software"):
+        from pygame._sdl2 import video
+        self.window = video.Window(title, size, resizable=True)
+        index = -1
+        if driver != "auto":
+            names = [info.name for info in video.get_drivers()]
+            if driver not in names:
+                self.window.destroy()
+                raise pygame.error(f"нет драйвера рендерера {driver!r} (есть: {', '.join(names)})")
+            index = names.index(driver)
+        try:
+            self.renderer = video.Renderer(self.window, index=index, vsync=False)
+        except pygame.error:
+            self.window.destroy()
+            raise
+        self.renderer.draw_color = (0, 0, 0, 255)  # поля по краям при других пропорциях окна
+        self.canvas = pygame.Surface(size, 0, 32)
+        self.texture = video.Texture(self.renderer, size, streaming=True)
+        self._bounds = self.canvas.get_rect()
+        self._window_size = None
+        self._viewport = self._bounds
+
+    def resize(self, size):
+        # Кадр того же размера, меняется только масштаб (см. present)
+        self._window_size = None
+        return False
+
+    def _fit(self, window_size):
+        cw, ch = self.canvas.get_size()
+        ww, wh = window_size
+        scale = min(ww / cw, wh / ch)
+        w, h = max(1, round(cw * scale)), max(1, round(ch * scale))
+        return pygame.Rect((ww - w) // 2, (wh - h) // 2, w, h)
+
+    def to_canvas(self, pos):
+        vp = self._viewport
+        return ((pos[0] - vp.x) * self._bounds.width // vp.width, (pos[1] - vp.y) * self._bounds.height // vp.height)
+
+    def expose(self):
+        self._window_size = None
+
+    def present(self, dirty):
+        size = self.window.size
+        changed = size != self._window_size
+        if changed:
+            self._window_size = size
+            self._viewport = self._fit(size)
+        if not dirty and not changed:
+            return
+        for rect in dirty:
+            rect = rect.clip(self._bounds)
+            if rect.width and rect.height:
+                self.texture.update(self.canvas.subsurface(rect), rect)
+        if self._viewport.size != size:
+            self.renderer.clear()  # поля вокруг кадра; когда кадр во всё окно, заливка лишняя
+        self.texture.draw(dstrect=self._viewport)
+        self.renderer.present()
+
+
+def create_display(config, size, title=TITLE):
+    """Вывод кадра по "render_backend" из config.json; если рендерер SDL2 недоступен — прежнее окно pygame."""
+    if config.get("render_backend") == "texture":
+        try:
+            return TextureDisplay(size, title, config.get("render_driver", "software"))
+        except (ImportError, pygame.error) as e:
+            print(f"Рендерер SDL2 недоступен ({e}), вывод через pygame.display")
+    return SurfaceDisplay(size, title)
+
+
+def report_startup(startup):
+    """Дописать в startup время до первого кадра (от импорта main) и напечатать отчёт."""
+    startup["first_frame_ms"] = (time.perf_counter() - STARTUP_T0) * 1000.0
+    print("Первый кадр через {first_frame_ms:.0f} мс (импорт {import_ms:.0f}, инициализация {init_ms:.0f}, "
+          "шрифты {fonts_ms:.0f})".format(**startup))
+    return startup
+
+
 def run_game():
-    pygame.init()
+    startup = {"import_ms": (time.perf_counter() - STARTUP_T0) * 1000.0}
+    t0 = time.perf_counter()
+    # Только нужные подсистемы: звук и джойстики игре не нужны
+    pygame.display.init()
+    pygame.font.init()
     config = load_config()
     width = config["screen_width"]
     height = config["screen_height"]
     panel_left_w = config["panel_left_width"]
-    screen = pygame.display.set_mode((width, height), pygame.RESIZABLE)
-    pygame.display.set_caption(TITLE)
+    display = create_display(config, (width, height))
+    screen = display.canvas
     left_panel = pygame.Rect(0, 0, panel_left_w, height)
     right_panel = pygame.Rect(panel_left_w, 0, width - panel_left_w, height)
-    font_large = pygame.font.SysFont("Arial", 28)
-    font_medium = pygame.font.SysFont("Arial", 20)
-    font_small = pygame.font.SysFont("Arial", 16)
+    t1 = time.perf_counter()
+    startup["init_ms"] = (t1 - t0) * 1000.0
+    font_large = load_font("Arial", 28)
+    font_medium = load_font("Arial", 20)
+    font_small = load_font("Arial", 16)
+    startup["fonts_ms"] = (time.perf_counter() - t1) * 1000.0
     panel_margin = 20
     clock = pygame.time.Clock()
+    tick_dt = 1.0 / max(1, config["tick_rate"])
+    render_fps = config["render_fps"]
+    accumulator = 0.0
+    clicks = 0  # INPUT_SEND/INPUT_RECALL, ждущие ближайшего тика
+    profile_always = bool(config["profiler"])  # замеры и без оверлея
+    # Полосы оверлея — доля бюджета кадра; без ограничения кадров — доля шага симуляции
+    profiler = FrameProfiler(enabled=False, budget_ms=frame_budget_ms(render_fps, config["tick_rate"]))
+    profiler.startup = startup
+    show_profiler = False
+    fixed_quality = parse_quality(config["quality"])
+    if fixed_quality is None:
+        governor = QualityGovernor(render_fps or FPS)
+        profiler.quality = governor.changes
+        quality = governor.settings
+    else:
+        governor = None
+        quality = QUALITY_LEVELS[fixed_quality]
+    # Отрисовщик игры, её кнопки и пул частиц создаются при первом запуске игры, экраны
+    # магазина и итогов — при первом переходе туда: меню появляется без них
+    renderer = None
+    particles = None  # один пул на все игры: между играми только очищается
+    btn_recall = None
+    screens = {"menu": MenuScreen(font_small, font_medium, font_large)}  # состояние -> Screen
+    shown = None  # экран, нарисованный на прошлом кадре (None — шла игра)
+    autopilot = Autopilot(config["autopilot_budget_ms"]) if config["autopilot"] else None
+
+    def shutdown():
+        if recorder is not None:
+            recorder.close(sim)
+        if sim is not None:
+            if sim.status == "playing":
+                RUN_LOG.append(run_record(run_config, sim, seed))  # забег прерван закрытием окна
+            sim.close()
+        CONFIG_STORE.flush()
+        RUN_LOG.close()
+        if config["profiler_dump"]:
+            profiler.dump(config["profiler_dump"])
+        pygame.quit()
 
     # Состояния: "menu", "shop", "playing", "game_over", "level_complete"
     state = "menu"
     coins = config.get("coins", 0)
-    energy_max = 100 + config.get("energy_max_bonus", 0) * 20
-    slow_duration_extra = config.get("slow_duration_bonus", 0) * 5
-
-    # Меню: кнопки
-    btn_play = Button(0, 0, 220, 50, "Играть", font_large)
-    btn_shop = Button(0, 0, 220, 50, "Магазин", font_large)
-    btn_exit = Button(0, 0, 220, 50, "Выход", font_medium)
-    btn_back = Button(0, 0, 180, 44, "Назад", font_medium)
-    btn_menu_from_end = Button(0, 0, 200, 48, "В меню", font_medium)
-    btn_recall = Button(0, 0, 200, 44, "Вернуться на базу", font_small)
+    sim = None
+    recorder = None  # ReplayRecorder текущей игры, если включена запись
 
     while True:
-        dt = clock.tick(FPS) / 1000.0
-        mouse_pos = pygame.mouse.get_pos()
+        if state != "playing" and shown is not None and shown is screens.get(state):
+            # Экран уже нарисован и сам не меняется: цикл спит до события вместо кадров по 60 в секунду
+            event = pygame.event.wait(IDLE_WAIT_MS)
+            events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+            clock.tick()
+            dt = 0.0
+        else:
+            dt = clock.tick(render_fps) / 1000.0
+            events = pygame.event.get()
+        # Замеряются только кадры игры: меню и ожидание событий не смешиваются с ними
+        profiler.enabled = (profile_always or show_profiler) and state == "playing"
+        profiler.begin_frame()
+        t_events = time.perf_counter() if profiler.enabled else 0.0
+        mouse_pos = display.to_canvas(pygame.mouse.get_pos())
         keys = pygame.key.get_pressed()
+        inputs = read_input_bits(keys)
+        CONFIG_STORE.maybe_flush()
 
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
-                pygame.quit()
+                shutdown()
                 return
-            if event.type == pygame.VIDEORESIZE:
-                width, height = event.w, event.h
-                screen = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # Включение замеров подхватит начало следующего кадра
+                show_profiler = not show_profiler
+                if renderer is not None:
+                    renderer.invalidate()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                autopilot = None if autopilot is not None else Autopilot(config["autopilot_budget_ms"])
+            if event.type == pygame.VIDEORESIZE and display.resize((event.w, event.h)):
+                screen = display.canvas
+                width, height = screen.get_size()
                 left_panel = pygame.Rect(0, 0, panel_left_w, height)
                 right_panel = pygame.Rect(panel_left_w, 0, width - panel_left_w, height)
+                if renderer is not None:
+                    renderer.invalidate()
+            if event.type in (pygame.VIDEORESIZE, pygame.WINDOWSIZECHANGED, pygame.WINDOWEXPOSED):
+                display.expose()
+            if event.type in (pygame.VIDEORESIZE, pygame.WINDOWEXPOSED) and shown is not None:
+                shown.invalidate()
 
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                action = screens[state].click(mouse_pos) if state in screens else None
                 if state == "menu":
-                    cx, cy = width // 2, height // 2
-                    if btn_play.is_clicked(mouse_pos):
+                    if action == "play":
                         state = "playing"
+                        if renderer is None:
+                            renderer = PlayRenderer(font_small, font_medium, font_large, panel_margin)
+                            renderer.profiler = profiler
+                            btn_recall = Button(0, 0, 200, 44, "Вернуться на базу", font_small)
+                            if config["particles"] and np is not None:
+                                particles = ParticleSystem(config["particle_capacity"])
+                            renderer.set_quality(quality)
+                            if particles is not None:
+                                particles.density = quality["effects"]
                         cfg = load_config()
-                        energy_max = 100 + cfg.get("energy_max_bonus", 0) * 20
-                        play_config = dict(cfg)
-                        play_config["water_slow_duration"] = cfg.get("water_slow_duration", 10) + slow_duration_extra
-                        config = play_config
-                        water = Water(config, height)
-                        water.screen_height = height
-                        player_roof_y = height * 0.15
-                        buildings = generate_buildings(left_panel, height)
-                        drone = None
-                        lightnings = []
-                        next_lightning = pygame.time.get_ticks() + 2000
-                        energy = energy_max
-                        survival_start = pygame.time.get_ticks()
+                        if recorder is not None:
+                            recorder.close(sim)
+                            recorder = None
+                        if sim is not None:
+                            sim.close()
+                        # Зерно известно заранее, чтобы игру можно было записать и повторить
+                        seed = cfg["rng_seed"] if cfg["rng_seed"] is not None else random.getrandbits(32)
+                        sim = Simulation(cfg, left_panel, height, rng=random.Random(seed))
+                        run_config = cfg
+                        sim.water.enable_waves()
+                        if particles is not None:
+                            particles.clear()
+                            sim.particles = particles
+                        if cfg["record_replay"]:
+                            recorder = ReplayRecorder(cfg["record_replay"], seed, cfg, (width, height), panel_left_w, tick_dt)
+                        sim.profiler = profiler
                         high_score = cfg.get("high_score", 0)
-                        level_coins_earned = 0
+                        accumulator = 0.0
+                        clicks = 0
+                        if autopilot is not None:
+                            autopilot.reset()
+                        if governor is not None:
+                            governor.restart()
+                        renderer.invalidate()
                         btn_send = Button(right_panel.x + panel_margin, right_panel.y + 200, 320, 52, "Отправить дрона", font_medium)
-                    elif btn_shop.is_clicked(mouse_pos):
+                    elif action == "shop":
                         state = "shop"
-                    elif btn_exit.is_clicked(mouse_pos):
-                        pygame.quit()
+                    elif action == "exit":
+                        shutdown()
                         return
                 elif state == "shop":
-                    if btn_back.is_clicked(mouse_pos):
+                    if action == "back":
                         state = "menu"
-                    else:
+                    elif action is not None:
                         cfg = load_config()
                         coins = cfg.get("coins", 0)
-                        by = 130
-                        for name, key, price, current, max_buy in [
-                            ("Скорость дрона +1", "drone_speed_bonus", 50, cfg.get("drone_speed_bonus", 0), 3),
-                            ("Макс. энергия +20", "energy_max_bonus", 40, cfg.get("energy_max_bonus", 0), 5),
-                            ("Замедление воды +5 сек", "slow_duration_bonus", 60, cfg.get("slow_duration_bonus", 0), 3),
-                        ]:
-                            buy_rect = pygame.Rect(width // 2 + 120, by - 4, 80, 28)
-                            if current < max_buy and coins >= price and buy_rect.collidepoint(mouse_pos):
+                        for name, key, price, max_buy in SHOP_ITEMS:
+                            current = cfg.get(key, 0)
+                            if key == action and current < max_buy and coins >= price:
                                 save_config({"coins": coins - price, key: current + 1})
                                 break
-                            by += 42
                 elif state == "level_complete":
-                    if btn_menu_from_end.is_clicked(mouse_pos):
+                    if action == "menu":
                         state = "menu"
                         config = load_config()
                         coins = config.get("coins", 0)
                 elif state == "game_over":
-                    if btn_menu_from_end.is_clicked(mouse_pos):
+                    if action == "menu":
                         state = "menu"
                 elif state == "playing":
-                    if drone is None and btn_send.is_clicked(mouse_pos) and energy >= 15:
-                        start = (left_panel.centerx, int(player_roof_y - 35))
-                        drone = Drone(config, start, config.get("drone_speed_bonus", 0))
-                        energy -= 15
-                    elif drone and btn_recall.is_clicked(mouse_pos):
-                        drone = None
-
-        # ---------- Отрисовка меню ----------
-        if state == "menu":
-            coins = load_config().get("coins", 0)
-            screen.fill((35, 45, 65))
-            title = font_large.render("Потоп (Flood)", True, (220, 230, 250))
-            screen.blit(title, (width // 2 - title.get_width() // 2, height // 4 - 30))
-            sub = font_small.render("Собирайте артефакты. Управляйте дроном — WASD или стрелки.", True, (180, 190, 210))
-            screen.blit(sub, (width // 2 - sub.get_width() // 2, height // 4 + 20))
-            cx, cy = width // 2, height // 2
-            btn_play.rect = pygame.Rect(cx - 110, cy - 80, 220, 50)
-            btn_shop.rect = pygame.Rect(cx - 110, cy - 20, 220, 50)
-            btn_exit.rect = pygame.Rect(cx - 110, cy + 40, 220, 50)
-            btn_play.update_hover(mouse_pos)
-            btn_shop.update_hover(mouse_pos)
-            btn_exit.update_hover(mouse_pos)
-            btn_play.draw(screen)
-            btn_shop.draw(screen)
-            btn_exit.draw(screen)
-            coins_text = font_small.render(f"Монеты: {coins}", True, (255, 220, 100))
-            screen.blit(coins_text, (width - coins_text.get_width() - 20, 15))
-            pygame.display.flip()
-            continue
+                    if sim.drone is None and btn_send.is_clicked(mouse_pos):
+                        clicks |= INPUT_SEND
+                    elif sim.drone and btn_recall.is_clicked(mouse_pos):
+                        clicks |= INPUT_RECALL
+
+        if t_events and profiler.enabled:
+            profiler.add("events", time.perf_counter() - t_events)
 
-        # ---------- Магазин ----------
-        if state == "shop":
-            config = load_config()
-            coins = config.get("coins", 0)
-            screen.fill((35, 45, 65))
-            screen.blit(font_large.render("Магазин", True, (220, 230, 240)), (width // 2 - 50, 30))
-            screen.blit(font_medium.render(f"Монеты: {coins}", True, (255, 220, 100)), (width // 2 - 60, 75))
-            by = 130
-            shop_items = [
-                ("Скорость дрона +1", "drone_speed_bonus", 50, config.get("drone_speed_bonus", 0), 3),
-                ("Макс. энергия +20", "energy_max_bonus", 40, config.get("energy_max_bonus", 0), 5),
-                ("Замедление воды +5 сек", "slow_duration_bonus", 60, config.get("slow_duration_bonus", 0), 3),
-            ]
-            for name, key, price, current, max_buy in shop_items:
-                color = (200, 200, 200) if current < max_buy and coins >= price else (120, 120, 120)
-                screen.blit(font_small.render(f"{name} — {price} монет ({current}/{max_buy})", True, color), (width // 2 - 180, by))
-                buy_rect = pygame.Rect(width // 2 + 120, by - 4, 80, 28)
-                if current < max_buy and coins >= price and buy_rect.collidepoint(mouse_pos):
-                    pygame.draw.rect(screen, (80, 140, 80), buy_rect)
-                else:
-                    pygame.draw.rect(screen, (60, 70, 90), buy_rect)
-                screen.blit(font_small.render("Купить", True, (220, 220, 220)), (buy_rect.x + 18, buy_rect.y + 6))
-                by += 42
-            btn_back.rect = pygame.Rect(width // 2 - 90, height - 80, 180, 44)
-            btn_back.update_hover(mouse_pos)
-            btn_back.draw(screen)
-            pygame.display.flip()
+        # ---------- Меню, магазин, итоги: перерисовка только изменившегося ----------
+        if state != "playing":
+            active = screens.get(state)
+            if active is None:
+                active = screens[state] = SCREENS[state](font_small, font_medium, font_large)
+            if active is not shown:
+                active.invalidate()
+                shown = active
+            coins = CONFIG_STORE.get("coins", 0)
+            if state == "menu":
+                data = (coins,)
+            elif state == "shop":
+                data = (coins, tuple(CONFIG_STORE.get(key, 0) for _, key, _, _ in SHOP_ITEMS))
+            elif state == "game_over":
+                data = (sim.time, high_score)
+            else:
+                data = (sim.coins_earned,)
+            display.present(active.draw(screen, mouse_pos, data))
+            if "first_frame_ms" not in startup:
+                report_startup(startup)
             continue
 
+        shown = None
         if state == "playing":
-            if water.screen_height != height:
-                water.screen_height = height
-                player_roof_y = height * 0.15
-            water.update(dt)
-            if water.is_game_over(player_roof_y):
+            # Время работы прошлого кадра без ожидания в clock.tick: по нему подбирается детализация
+            if governor is not None and governor.frame(clock.get_rawtime()):
+                quality = governor.settings
+                renderer.set_quality(quality)
+                if particles is not None:
+                    particles.density = quality["effects"]
+            if recorder is not None:
+                recorder.resize((width, height))
+            sim.resize(left_panel, height)
+            # Фиксированный шаг: симуляция идёт тиками tick_dt независимо от частоты кадров
+            accumulator += min(dt, MAX_FRAME_TIME)
+            if autopilot is not None and sim.drone is not None:
+                # Маршрут дорабатывается раз в кадр в пределах бюджета; клавиатура не нужна
+                t0 = time.perf_counter() if profiler.enabled else 0.0
+                autopilot.plan(sim)
+                if t0:
+                    profiler.add("autopilot", time.perf_counter() - t0)
+            while accumulator >= tick_dt and sim.status == "playing":
+                if autopilot is not None:
+                    inputs = autopilot.steer(sim)
+                if recorder is not None:
+                    recorder.record(inputs | clicks)
+                sim.step(tick_dt, inputs | clicks)
+                clicks = 0
+                accumulator -= tick_dt
+            if sim.status != "playing" and recorder is not None:
+                recorder.close(sim)
+                recorder = None
+            if sim.status != "playing":
+                RUN_LOG.append(run_record(run_config, sim, seed))
+            if sim.status == "game_over":
                 state = "game_over"
-                save_high_score((pygame.time.get_ticks() - survival_start) / 1000.0)
-                high_score = max(high_score, (pygame.time.get_ticks() - survival_start) / 1000.0)
+                save_high_score(sim.time)
+                high_score = max(high_score, sim.time)
                 continue
-
-            if drone:
-                drone.update(dt, keys, left_panel)
-                for b in buildings:
-                    if not b.collected and b.rect.top < water.level and drone.get_rect().colliderect(b.rect):
-                        b.collected = True
-                        name, coin_reward, slow_sec = ARTIFACTS.get(b.has_artifact, ("?", 0, 0))
-                        level_coins_earned += coin_reward
-                        if slow_sec > 0:
-                            water.apply_solar_panel()
-                        energy = min(energy_max, energy + 15)
-                if drone.health <= 0:
-                    drone = None
-                else:
-                    if pygame.time.get_ticks() >= next_lightning:
-                        lightnings.append(Lightning(left_panel))
-                        next_lightning = pygame.time.get_ticks() + random.randint(1500, 4000)
-                    for L in lightnings[:]:
-                        L.update(drone)
-                        if L.is_done():
-                            lightnings.remove(L)
-
-            all_collected = all(b.collected for b in buildings)
-            if all_collected:
+            if sim.status == "level_complete":
                 state = "level_complete"
-                save_config({"coins": load_config().get("coins", 0) + level_coins_earned})
+                save_config({"coins": CONFIG_STORE.get("coins", 0) + sim.coins_earned})
                 continue
 
-        if state == "game_over":
-            screen.fill((30, 30, 40))
-            screen.blit(font_large.render("Вода достигла крыши. Игра окончена.", True, (220, 100, 100)), (width // 2 - 220, height // 2 - 60))
-            screen.blit(font_medium.render(f"Время: {(pygame.time.get_ticks()-survival_start)/1000:.1f} с. Рекорд: {high_score:.1f} с.", True, (200, 200, 200)), (width // 2 - 150, height // 2 - 15))
-            btn_menu_from_end.rect = pygame.Rect(width // 2 - 100, height // 2 + 30, 200, 48)
-            btn_menu_from_end.update_hover(mouse_pos)
-            btn_menu_from_end.draw(screen)
-            pygame.display.flip()
-            continue
-
-        if state == "level_complete":
-            screen.fill((30, 50, 40))
-            screen.blit(font_large.render("Уровень пройден!", True, (120, 255, 150)), (width // 2 - 120, height // 2 - 80))
-            screen.blit(font_medium.render("Все артефакты собраны. Миссия выполнена.", True, (200, 220, 200)), (width // 2 - 180, height // 2 - 40))
-            screen.blit(font_medium.render(f"+{level_coins_earned} монет", True, (255, 220, 100)), (width // 2 - 60, height // 2))
-            btn_menu_from_end.rect = pygame.Rect(width // 2 - 100, height // 2 + 50, 200, 48)
-            btn_menu_from_end.update_hover(mouse_pos)
-            btn_menu_from_end.draw(screen)
-            pygame.display.flip()
-            continue
-
+        renderer.layout_buttons(right_panel, btn_send, btn_recall)
         btn_send.update_hover(mouse_pos)
-
-        # Отрисовка
-        # Левая панель — небо и вода
-        screen.fill((50, 60, 85), left_panel)  # небо
-        water.draw(screen, left_panel, font_small)
-        # Крыша игрока — явная платформа и подпись
-        roof_h = 28
-        roof_rect = pygame.Rect(left_panel.x, int(player_roof_y) - roof_h, left_panel.width, roof_h)
-        pygame.draw.rect(screen, (120, 125, 135), roof_rect)
-        pygame.draw.rect(screen, (180, 185, 195), roof_rect, 3)
-        roof_label = font_medium.render("ВАША КРЫША — сюда не должна дойти вода!", True, (255, 255, 255))
-        screen.blit(roof_label, (left_panel.x + 20, int(player_roof_y) - roof_h - 26))
-        pygame.draw.rect(screen, (70, 75, 90), (left_panel.x, 0, left_panel.width, roof_rect.top))
-        for b in buildings:
-            b.draw(screen, water.level, font_small)
-        for L in lightnings:
-            L.draw(screen)
-        if drone:
-            drone.draw(screen, font_small)
-
-        # Правая панель — UI (чёткая сетка, без наложений)
-        screen.fill((38, 48, 65), right_panel)
-        px = right_panel.x + panel_margin
-        py = right_panel.y
-        survival_sec = (pygame.time.get_ticks() - survival_start) / 1000.0
-        high_score = max(high_score, survival_sec)
-
-        screen.blit(font_large.render("Потоп", True, (220, 230, 240)), (px, py + 10))
-        screen.blit(font_small.render(f"Время: {survival_sec:.1f} с  |  Рекорд: {high_score:.1f} с", True, (190, 200, 210)), (px, py + 42))
-        py += 72
-
-        # Блок «До крыши»: подпись + столбик + статус в одну строку
-        screen.blit(font_small.render("До крыши:", True, (200, 210, 220)), (px, py))
-        bar_x, bar_y = px + 90, py - 2
-        bar_w, bar_h = 24, 56
-        total_range = max((height * 0.75 - player_roof_y), 1)
-        remaining = max(0, min(1, (water.level - player_roof_y) / total_range))
-        pygame.draw.rect(screen, (45, 48, 58), (bar_x, bar_y, bar_w, bar_h))
-        fill_h = int(bar_h * remaining)
-        if fill_h > 0:
-            pygame.draw.rect(screen, (70, 120, 200), (bar_x + 2, bar_y + bar_h - fill_h, bar_w - 4, fill_h))
-        pygame.draw.rect(screen, (90, 95, 110), (bar_x, bar_y, bar_w, bar_h), 2)
-        status = "Опасно!" if remaining < 0.25 else "Есть запас"
-        status_color = (255, 120, 100) if remaining < 0.25 else (140, 200, 255)
-        screen.blit(font_small.render(status, True, status_color), (bar_x + bar_w + 10, bar_y + bar_h // 2 - 8))
-        py += 68
-
-        # Кнопка отправки дрона / Вернуться на базу
-        btn_send.rect.x = px
-        btn_send.rect.y = py
-        btn_send.rect.width = min(320, right_panel.width - panel_margin * 2)
-        if drone is None:
-            btn_send.draw(screen)
-            if energy < 15:
-                screen.blit(font_small.render("Нужно 15 энергии", True, (200, 120, 100)), (px, py + 56))
-        else:
-            btn_recall.rect = pygame.Rect(px, py, min(220, right_panel.width - panel_margin * 2), 44)
-            btn_recall.update_hover(mouse_pos)
-            btn_recall.draw(screen)
-            screen.blit(font_small.render("WASD — управление дроном", True, (180, 200, 220)), (px, py + 48))
-        py += 80
-
-        # Энергия
-        screen.blit(font_small.render("Энергия:", True, (200, 210, 220)), (px, py))
-        ebar_y = py + 20
-        ebar_w = min(220, right_panel.width - panel_margin * 2 - 80)
-        pygame.draw.rect(screen, (45, 48, 58), (px, ebar_y, ebar_w, 22))
-        pygame.draw.rect(screen, (60, 130, 200), (px + 2, ebar_y + 2, max(0, int(ebar_w * energy / max(energy_max, 1)) - 4), 18))
-        screen.blit(font_small.render(f"{int(energy)}/{energy_max}", True, (180, 190, 200)), (px + ebar_w + 8, ebar_y - 2))
-        py += 52
-
-        # Подсказка и монеты
-        screen.blit(font_small.render("WASD/стрелки — летать. Коснитесь крыши — собрать артефакт.", True, (170, 180, 190)), (px, py))
-        screen.blit(font_small.render(f"Монет за уровень: +{level_coins_earned}", True, (255, 220, 120)), (px, py + 20))
-
-        pygame.display.flip()
+        btn_recall.update_hover(mouse_pos)
+        high_score = max(high_score, sim.time)
+        dirty = renderer.draw(screen, sim, left_panel, right_panel, high_score, btn_send, btn_recall, accumulator / tick_dt)
+        if show_profiler:
+            overlay_rect = profiler.draw_overlay(screen, font_small)
+            dirty.append(overlay_rect)
+            renderer.add_dirty(overlay_rect)
+        if profiler.enabled:
+            t_flip = time.perf_counter()
+        display.present(dirty)
+        if profiler.enabled:
+            profiler.add("flip", time.perf_counter() - t_flip)
 
     pygame.quit()
 
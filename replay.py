@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Повтор записанной игры (файл .rec, см. "record_replay" в config.json) со сверкой итога.
+
+Примеры:
+    python replay.py session.rec                     # безголово, с максимальной скоростью
+    python replay.py session.rec --render            # в окне, в реальном времени
+    python replay.py session.rec --render --speed 4 --profiler-dump trace.json
+
+Код возврата 1, если итог повтора (время, монеты, статус и т. д.) не совпал с записанным.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Без --render окно не нужно: безголовый драйвер SDL
+if "--render" not in sys.argv[1:]:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+import main  # noqa: E402
+
+
+def run_headless(replay):
+    """Все тики подряд без отрисовки. Возвращает (симуляция, тиков)."""
+    sim = replay.simulation()
+    ticks = 0
+    for bits in replay.inputs():
+        if isinstance(bits, tuple):
+            left_panel, _ = replay.panels(bits)
+            sim.resize(left_panel, bits[1])
+            continue
+        sim.step(replay.tick_dt, bits)
+        ticks += 1
+    sim.close()
+    return sim, ticks
+
+
+def run_render(replay, speed, render_fps, profiler_dump):
+    """Повтор в окне: тики идут с записанным шагом (ускоренные в speed раз), кадр интерполируется."""
+    pygame.display.init()
+    pygame.font.init()
+    size = replay.size
+    screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+    pygame.display.set_caption(main.TITLE + " — повтор")
+    left_panel, right_panel = replay.panels(size)
+    font_large = main.load_font("Arial", 28)
+    font_medium = main.load_font("Arial", 20)
+    font_small = main.load_font("Arial", 16)
+    renderer = main.PlayRenderer(font_small, font_medium, font_large)
+    profiler = main.FrameProfiler(enabled=bool(profiler_dump))
+    renderer.profiler = profiler
+    btn_send = main.Button(0, 0, 320, 52, "Отправить дрона", font_medium)
+    btn_recall = main.Button(0, 0, 200, 44, "Вернуться на базу", font_small)
+
+    sim = replay.simulation()
+    sim.profiler = profiler
+    # Волны и частицы только для вида и на итог не влияют
+    sim.water.enable_waves()
+    if replay.config.get("particles") and main.np is not None:
+        sim.particles = main.ParticleSystem(replay.config.get("particle_capacity", main.PARTICLE_CAPACITY))
+    inputs = replay.inputs()
+    clock = pygame.time.Clock()
+    accumulator = 0.0
+    ticks = 0
+    finished = False
+    while not finished:
+        dt = clock.tick(render_fps) / 1000.0
+        profiler.begin_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                finished = True
+        accumulator += min(dt, main.MAX_FRAME_TIME) * speed
+        while accumulator >= replay.tick_dt and not finished:
+            bits = next(inputs, None)
+            if bits is None:
+                finished = True
+            elif isinstance(bits, tuple):
+                size = bits
+                screen = pygame.display.set_mode(size, pygame.RESIZABLE)
+                left_panel, right_panel = replay.panels(size)
+                sim.resize(left_panel, size[1])
+                renderer.invalidate()
+            else:
+                sim.step(replay.tick_dt, bits)
+                ticks += 1
+                accumulator -= replay.tick_dt
+        renderer.layout_buttons(right_panel, btn_send, btn_recall)
+        dirty = renderer.draw(screen, sim, left_panel, right_panel, 0.0, btn_send, btn_recall,
+                              min(accumulator / replay.tick_dt, 1.0))
+        t0 = time.perf_counter()
+        if dirty:
+            pygame.display.update(dirty)
+        if profiler.enabled:
+            profiler.add("flip", time.perf_counter() - t0)
+    sim.close()
+    if profiler_dump:
+        profiler.dump(profiler_dump)
+    pygame.quit()
+    return sim, ticks
+
+
+def compare(expected, actual):
+    """Список расхождений итога: (поле, записано, получено)."""
+    return [(key, value, actual.get(key)) for key, value in expected.items() if actual.get(key) != value]
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Повтор записанной игры «Потопа» со сверкой итога.")
+    parser.add_argument("path", help="файл записи .rec")
+    parser.add_argument("--render", action="store_true", help="показывать игру в окне в реальном времени")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение повтора в окне")
+    parser.add_argument("--fps", type=int, default=main.FPS, help="частота кадров повтора в окне")
+    parser.add_argument("--profiler-dump", default="", help="сохранить трассу профилировщика (.json/.csv), только с --render")
+    args = parser.parse_args(argv)
+
+    replay = main.Replay.load(args.path)
+    t0 = time.perf_counter()
+    if args.render:
+        sim, ticks = run_render(replay, args.speed, args.fps, args.profiler_dump)
+    else:
+        sim, ticks = run_headless(replay)
+    wall = time.perf_counter() - t0
+    print(f"зерно {replay.seed}, тиков {ticks}, время игры {sim.time:.2f} с, "
+          f"повтор {wall:.2f} с ({ticks / max(wall, 1e-9):.0f} тиков/с)")
+
+    if replay.summary is None:
+        print("Итога в записи нет (игра прервана) — сверять не с чем.")
+        return 0
+    actual = main.replay_summary(sim, ticks)
+    if ticks < replay.summary["ticks"]:
+        print("Повтор остановлен до конца записи — итог не сверяется.")
+        return 0
+    mismatches = compare(replay.summary, actual)
+    for key, expected, got in mismatches:
+        print(f"РАСХОЖДЕНИЕ {key}: записано {expected!r}, получено {got!r}")
+    if not mismatches:
+        print(f"Итог совпал: {actual['status']}, монет {actual['coins_earned']}, время {actual['time']:.2f} с")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Запросы к журналу забегов (runs.jsonl) через его индекс (runs_index.json) — без чтения всей истории.
+
+Примеры:
+    python runs.py                          # число забегов, p50/p95 времени и монет, лучшие 10
+    python runs.py --top 20 --by coins
+    python runs.py --percentile 50 --percentile 99 --configs
+    python runs.py --rebuild                # пересчитать индекс по всему журналу
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import main  # noqa: E402
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Лучшие забеги, перцентили и сводка по параметрам «Потопа».")
+    parser.add_argument("--log", default=main.RUN_LOG_PATH, help="журнал забегов (JSONL)")
+    parser.add_argument("--index", default=main.RUN_INDEX_PATH, help="файл индекса")
+    parser.add_argument("--top", type=int, default=10, metavar="N", help=f"лучших забегов (не больше {main.RUN_INDEX_TOP})")
+    parser.add_argument("--by", choices=("time", "coins"), default="time")
+    parser.add_argument("--percentile", type=float, action="append", metavar="Q", help="перцентили (по умолчанию 50 и 95)")
+    parser.add_argument("--configs", action="store_true", help="сводка по наборам параметров баланса")
+    parser.add_argument("--rebuild", action="store_true", help="удалить индекс и пересчитать по журналу")
+    args = parser.parse_args(argv)
+
+    if args.rebuild and os.path.exists(args.index):
+        os.remove(args.index)
+    log = main.RunLog(args.log, args.index)
+    print(f"Забегов: {log.runs}")
+    if not log.runs:
+        return 0
+    for q in args.percentile or (50, 95):
+        print(f"p{q:g}: время {log.percentile(q, 'time'):.1f} с, монеты {log.percentile(q, 'coins')}")
+
+    print(f"\nЛучшие по {'времени' if args.by == 'time' else 'монетам'}:")
+    for i, run in enumerate(log.top(args.top, args.by), 1):
+        when = datetime.datetime.fromtimestamp(run["ts"]).strftime("%Y-%m-%d %H:%M")
+        print(f"{i:3d}. {run['time']:8.1f} с {run['coins']:6d} мон.  {run['status']:15s} {run['config']}  {when}")
+
+    if args.configs:
+        print("\nПо наборам параметров:")
+        for key, agg in sorted(log.by_config().items(), key=lambda kv: -kv[1]["runs"]):
+            params = ", ".join(f"{k}={v}" for k, v in agg["params"].items())
+            print(f"{key}: забегов {agg['runs']}, время ср. {agg['time_mean']:.1f} / макс. {agg['time_max']:.1f} с, "
+                  f"монеты ср. {agg['coins_mean']:.1f}, уровень пройден {agg['complete_rate']:.0%}\n    {params}")
+    if args.rebuild:
+        log.save_index()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
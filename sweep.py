@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Перебор параметров баланса из config.json на безголовой симуляции (main.Simulation).
+
+Примеры:
+    python sweep.py --grid water_rise_speed=12,18,24 --grid wind_strength=1,2,3 --sessions 50
+    python sweep.py --random 40 --range water_slow_factor=0.1:0.6 --range wind_strength=0.5:4 --format json
+
+Результат детерминирован для данного --seed: у каждой сессии свой генератор,
+зависящий только от seed, номера точки и номера сессии.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import sys
+from multiprocessing import Pool
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame  # noqa: E402
+import main  # noqa: E402
+
+# Параметры, которые можно перебирать
+KNOBS = main.BALANCE_KEYS
+INT_KNOBS = ("drone_speed_bonus", "energy_max_bonus", "slow_duration_bonus")
+
+
+def parse_value(key, text):
+    try:
+        return int(text) if key in INT_KNOBS else float(text)
+    except ValueError:
+        kind = "целое число" if key in INT_KNOBS else "число"
+        raise argparse.ArgumentTypeError(f"{key}: ожидается {kind}, получено {text!r}") from None
+
+
+def positive_int(text):
+    """Тип для argparse: целое >= 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается целое число: {text!r}") from None
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"ожидается целое >= 1: {text}")
+    return value
+
+
+def parse_grid(specs):
+    """["key=a,b,c", ...] -> {key: [a, b, c]}"""
+    grid = {}
+    for spec in specs:
+        key, _, values = spec.partition("=")
+        if key not in KNOBS or not values:
+            raise argparse.ArgumentTypeError(f"неизвестный параметр или пустой список: {spec}")
+        grid[key] = [parse_value(key, v) for v in values.split(",")]
+    return grid
+
+
+def parse_ranges(specs):
+    """["key=lo:hi", ...] -> {key: (lo, hi)}"""
+    ranges = {}
+    for spec in specs:
+        key, _, bounds = spec.partition("=")
+        lo, _, hi = bounds.partition(":")
+        if key not in KNOBS or not hi:
+            raise argparse.ArgumentTypeError(f"ожидается key=lo:hi: {spec}")
+        ranges[key] = (parse_value(key, lo), parse_value(key, hi))
+    return ranges
+
+
+def build_points(grid, ranges, samples, seed):
+    """Точки перебора: декартово произведение сетки и/или случайная выборка из диапазонов."""
+    points = [dict(zip(grid, combo)) for combo in itertools.product(*grid.values())] if grid else [{}]
+    if samples:
+        rng = random.Random(f"{seed}:points")
+        sampled = []
+        for base in points:
+            for _ in range(samples):
+                point = dict(base)
+                for key, (lo, hi) in ranges.items():
+                    point[key] = rng.randint(lo, hi) if key in INT_KNOBS else round(rng.uniform(lo, hi), 4)
+                sampled.append(point)
+        points = sampled
+    return points
+
+
+def scripted_policy(sim, tick):
+    """Змейка по панели: вверх-вниз и по горизонтали, без учёта целей."""
+    if sim.drone is None:
+        return main.INPUT_SEND
+    phase = (tick // 90) % 4
+    return (main.INPUT_RIGHT, main.INPUT_DOWN, main.INPUT_LEFT, main.INPUT_UP)[phase]
+
+
+def greedy_policy(sim, tick):
+    """Лететь к ближайшей несобранной крыше над водой."""
+    drone = sim.drone
+    if drone is None:
+        return main.INPUT_SEND
+    best = None
+    best_d = None
+    for b in sim.visible_buildings():
+        if b.collected or b.rect.top >= sim.water.level:
+            continue
+        d = (b.rect.centerx - drone.pos[0]) ** 2 + (b.rect.centery - drone.pos[1]) ** 2
+        if best_d is None or d < best_d:
+            best, best_d = b, d
+    if best is None:
+        return 0
+    bits = 0
+    dx = best.rect.centerx - drone.pos[0]
+    dy = best.rect.centery - drone.pos[1]
+    if dx < -4:
+        bits |= main.INPUT_LEFT
+    elif dx > 4:
+        bits |= main.INPUT_RIGHT
+    if dy < -4:
+        bits |= main.INPUT_UP
+    elif dy > 4:
+        bits |= main.INPUT_DOWN
+    return bits
+
+
+# "autopilot" — main.Autopilot без бюджета времени (маршрут строится целиком и детерминированно),
+# свой на каждую сессию
+POLICIES = {"scripted": scripted_policy, "greedy": greedy_policy, "autopilot": None}
+
+
+def run_session(args):
+    """Одна сессия до конца игры или max_time. Выполняется в процессе пула."""
+    point_index, session_index, point, base_config, policy_name, seed, dt, max_time = args
+    config = dict(base_config)
+    config.update(point)
+    rng = random.Random(f"{seed}:{point_index}:{session_index}")
+    sim = main.Simulation(
+        config,
+        pygame.Rect(0, 0, config["panel_left_width"], config["screen_height"]),
+        config["screen_height"],
+        rng=rng,
+    )
+    policy = POLICIES[policy_name] or main.Autopilot(budget_ms=None).inputs
+    tick = 0
+    while sim.status == "playing" and sim.time < max_time:
+        sim.step(dt, policy(sim, tick))
+        tick += 1
+    sim.close()
+    return point_index, sim.time, sim.coins_earned, sim.status
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по ближайшему рангу (ранг ⌈q·n/100⌉); sorted_values должен быть отсортирован."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values) / 100.0) - 1))
+    return sorted_values[k]
+
+
+def summarize(values):
+    values = sorted(values)
+    mean = sum(values) / len(values) if values else 0.0
+    return {"mean": round(mean, 3), "p50": round(percentile(values, 50), 3), "p95": round(percentile(values, 95), 3)}
+
+
+def run_sweep(points, base_config, sessions, policy, seed, dt, max_time, workers):
+    jobs = [
+        (pi, si, point, base_config, policy, seed, dt, max_time)
+        for pi, point in enumerate(points)
+        for si in range(sessions)
+    ]
+    survival = [[] for _ in points]
+    coins = [[] for _ in points]
+    completed = [0] * len(points)
+    if workers == 1:
+        results = map(run_session, jobs)
+    else:
+        pool = Pool(workers)
+        results = pool.imap_unordered(run_session, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+    for pi, survived, earned, status in results:
+        survival[pi].append(survived)
+        coins[pi].append(earned)
+        if status == "level_complete":
+            completed[pi] += 1
+    if workers != 1:
+        pool.close()
+        pool.join()
+
+    rows = []
+    for pi, point in enumerate(points):
+        s = summarize(survival[pi])
+        c = summarize(coins[pi])
+        row = dict(point)
+        row.update({
+            "sessions": sessions,
+            "survival_mean": s["mean"], "survival_p50": s["p50"], "survival_p95": s["p95"],
+            "coins_mean": c["mean"], "coins_p50": c["p50"], "coins_p95": c["p95"],
+            "complete_rate": round(completed[pi] / sessions, 3),
+        })
+        rows.append(row)
+    return rows
+
+
+def write_report(rows, fmt, out):
+    if fmt == "json":
+        json.dump(rows, out, indent=2, ensure_ascii=False)
+        out.write("\n")
+        return
+    fields = []
+    for row in rows:
+        for key in row:
+            if key not in fields:
+                fields.append(key)
+    writer = csv.DictWriter(out, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Перебор параметров баланса «Потопа» на безголовой симуляции.")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=A,B,C", help="значения параметра для сетки")
+    parser.add_argument("--range", action="append", default=[], metavar="KEY=LO:HI", help="диапазон для случайной выборки")
+    parser.add_argument("--random", type=positive_int, default=0, metavar="N", help="случайных точек на каждую точку сетки")
+    parser.add_argument("--sessions", type=positive_int, default=20, help="сессий на точку")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dt", type=float, default=1.0 / main.FPS, help="шаг симуляции, сек")
+    parser.add_argument("--max-time", type=float, default=600.0, help="ограничение длительности сессии, сек")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--from-config", action="store_true", help="брать базовые значения из config.json, а не из значений по умолчанию")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--out", default="-", help="файл отчёта (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        grid = parse_grid(args.grid)
+        ranges = parse_ranges(args.range)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.random and not ranges:
+        parser.error("--random требует хотя бы один --range")
+    if ranges and not args.random:
+        parser.error("--range действует только вместе с --random N")
+
+    base_config = main.load_config() if args.from_config else dict(main.CONFIG_DEFAULTS)
+    points = build_points(grid, ranges, args.random, args.seed)
+    rows = run_sweep(points, base_config, args.sessions, args.policy, args.seed, args.dt, args.max_time, max(1, args.workers))
+    if args.out == "-":
+        write_report(rows, args.format, sys.stdout)
+    else:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_report(rows, args.format, f)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,71 @@
+import random
+
+import pygame
+
+import main
+
+PANEL = pygame.Rect(0, 0, 720, 700)
+
+
+def make_sim(extra=0, **overrides):
+    """Уровень, в котором над водой ещё extra случайных крыш — чтобы планировщику было над чем думать."""
+    config = dict(main.CONFIG_DEFAULTS, **overrides)
+    sim = main.Simulation(config, PANEL, PANEL.height, rng=random.Random(3))
+    rng = random.Random(5)
+    roofs = [main.Building(rng.randint(0, 640), rng.randint(0, 450), 70, 40, "seeds") for _ in range(extra)]
+    sim.buildings += roofs
+    sim.buildings_left += extra
+    sim._add_buildings(roofs)
+    return sim
+
+
+def test_plan_within_zero_budget_resumes_to_the_unbounded_route():
+    full = main.Autopilot(budget_ms=None)
+    full.plan(make_sim(300))
+    total = len(full.route)
+    assert total > 300
+
+    sim = make_sim(300)
+    pilot = main.Autopilot(budget_ms=None)
+    pilot.plan(sim, budget=0.0)
+    # Дедлайн уже истёк: за вызов просматривается не больше SCAN_STEP кандидатов
+    assert len(pilot.route) <= 1 and pilot._pending
+    calls = 1
+    while pilot._pending or pilot._opt_dirty:
+        pilot.plan(sim, budget=0.0)
+        calls += 1
+    assert calls > total
+    assert [tuple(b.rect) for b in pilot.route] == [tuple(b.rect) for b in full.route]
+
+
+def test_invalid_buildings_leave_the_middle_of_the_route():
+    sim = make_sim(300)
+    pilot = main.Autopilot(budget_ms=None)
+    pilot.plan(sim)
+    total = len(pilot.route)
+    gone = pilot.route[150]
+    sim.building_grid.remove(gone)
+    pilot.plan(sim)
+    assert gone not in pilot.route and len(pilot.route) == total - 1
+    assert not any(gone in key for key in pilot._dist)
+
+
+def test_caches_stay_bounded_in_a_long_endless_run():
+    sim = make_sim(world_mode="endless", world_seed=42, water_rise_speed=10)
+    pilot = main.Autopilot(budget_ms=None)
+    sizes = []
+    tick = 0
+    try:
+        while sim.status == "playing" and sim.time < 600:
+            bits = pilot.inputs(sim)
+            if tick % 600 == 0 and sim.drone is not None:
+                sizes.append(len(pilot._dist))
+                assert pilot._seen_chunks == set(sim.chunks)
+                assert all(b in sim.building_grid for b in pilot.route)
+            sim.step(1.0 / 60, bits)
+            tick += 1
+    finally:
+        sim.close()
+    assert sim.time >= 600
+    # Выгруженные чанки не копятся в кэше расстояний: он не растёт со временем
+    assert max(sizes[len(sizes) // 2:]) <= 2 * max(sizes[:len(sizes) // 2])
@@ -0,0 +1,56 @@
+import random
+import time
+
+import pygame
+
+import main
+
+PANEL = pygame.Rect(0, 0, 720, 700)
+
+
+def layout(buildings):
+    return [(tuple(b.rect), b.has_artifact) for b in buildings]
+
+
+def test_generate_chunk_depends_only_on_seed_and_index():
+    a = layout(main.generate_chunk(7, 3, PANEL, 500))
+    assert a == layout(main.generate_chunk(7, 3, PANEL, 500))
+    assert a != layout(main.generate_chunk(8, 3, PANEL, 500))
+    assert a != layout(main.generate_chunk(7, 4, PANEL, 500))
+
+
+def test_threaded_prefetch_matches_inline():
+    threaded = main.ChunkStreamer(11, threaded=True)
+    inline = main.ChunkStreamer(11, threaded=False)
+    try:
+        for index in range(6):
+            threaded.prefetch(index, PANEL, 500)
+        time.sleep(0.05)
+        for index in range(8):  # 6 и 7 не запрошены заранее — генерируются на месте
+            assert layout(threaded.take(index, PANEL, 500)) == layout(inline.take(index, PANEL, 500))
+    finally:
+        threaded.close()
+
+
+def run_endless(threaded, seconds=120.0):
+    config = dict(main.CONFIG_DEFAULTS, world_mode="endless", world_seed=42, water_rise_speed=14.5)
+    sim = main.Simulation(config, PANEL, PANEL.height, rng=random.Random(1))
+    if not threaded:
+        sim._streamer.close()
+        sim._streamer = main.ChunkStreamer(42, threaded=False)
+    largest = 0
+    tick = 0
+    while sim.status == "playing" and sim.time < seconds:
+        bits = main.INPUT_SEND if tick % 300 == 1 else (main.INPUT_UP, main.INPUT_LEFT, main.INPUT_RIGHT)[tick // 90 % 3]
+        sim.step(1.0 / 60, bits)
+        largest = max(largest, len(sim.chunks))
+        tick += 1
+    sim.close()
+    return (round(sim.time, 6), sim.coins_earned, sim.camera_y, sim.status), largest
+
+
+def test_endless_world_is_the_same_with_and_without_thread():
+    threaded, largest = run_endless(True)
+    assert threaded == run_endless(False)[0]
+    # Ушедшие за нижний край чанки выгружаются: загружено всегда несколько штук
+    assert largest <= main.CHUNK_LOOKAHEAD + 4
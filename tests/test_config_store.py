@@ -0,0 +1,61 @@
+import json
+import os
+import stat
+
+import main
+
+DEFAULTS = {"coins": 0, "high_score": 0, "wind_strength": 2.0}
+
+
+def make_store(tmp_path, data=None, **kwargs):
+    path = tmp_path / "config.json"
+    if data is not None:
+        path.write_text(json.dumps(data), encoding="utf-8")
+    return main.ConfigStore(str(path), DEFAULTS, **kwargs), path
+
+
+def test_reads_once_and_merges_defaults(tmp_path):
+    store, path = make_store(tmp_path, {"coins": 5})
+    assert store.snapshot() == {"coins": 5, "high_score": 0, "wind_strength": 2.0}
+    path.write_text(json.dumps({"coins": 99}), encoding="utf-8")
+    assert store.get("coins") == 5  # файл читается один раз
+
+
+def test_broken_file_falls_back_to_defaults(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{not json", encoding="utf-8")
+    store = main.ConfigStore(str(path), DEFAULTS)
+    assert store.get("coins") == 0
+
+
+def test_write_behind(tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: clock[0])
+    store, path = make_store(tmp_path, {"coins": 1}, flush_interval=2.0)
+    store.update({"coins": 2})
+    store.update({"high_score": 30.5})
+    assert store.dirty and store.get("coins") == 2
+    store.maybe_flush()
+    assert json.loads(path.read_text(encoding="utf-8")) == {"coins": 1}
+    clock[0] += 2.0
+    store.maybe_flush()
+    assert json.loads(path.read_text(encoding="utf-8")) == {"coins": 2, "high_score": 30.5}
+    assert not store.dirty and store.writes == 1
+    store.flush()  # нечего писать
+    assert store.writes == 1
+
+
+def test_atomic_replace_keeps_mode_and_leaves_no_temp_files(tmp_path):
+    store, path = make_store(tmp_path, {"coins": 1})
+    os.chmod(path, 0o640)
+    store.update({"coins": 3})
+    store.flush()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["config.json"]
+
+
+def test_new_file_mode_follows_umask(tmp_path):
+    path = tmp_path / "new.json"
+    main.write_json_atomic(str(path), {"a": 1})
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~main._UMASK
+    assert json.loads(path.read_text(encoding="utf-8")) == {"a": 1}
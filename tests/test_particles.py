@@ -0,0 +1,51 @@
+import pygame
+import pytest
+
+import main
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def particles():
+    ps = main.ParticleSystem(capacity=512, rng=np.random.default_rng(3))
+    ps.rain(pygame.Rect(0, 40, 200, 100), 300)
+    ps.update(0.1, water_level=1000)
+    return ps
+
+
+@pytest.mark.parametrize("depth", [16, 32])
+def test_erase_restores_background(particles, depth):
+    surface = pygame.Surface((200, 150), 0, depth)
+    for y in range(0, 150, 10):
+        surface.fill((y, 255 - y, 80), (0, y, 200, 10))
+    before = pygame.surfarray.array2d(surface).copy()
+    surface.set_clip(pygame.Rect(10, 0, 180, 150))
+    area = particles.draw_over(surface)
+    assert area is not None
+    drawn = pygame.surfarray.array2d(surface)
+    changed = np.argwhere(drawn != before)
+    assert len(changed)
+    assert area.collidepoint(changed[:, 0].min(), changed[:, 1].min())
+    assert area.collidepoint(changed[:, 0].max(), changed[:, 1].max())
+    assert changed[:, 0].min() >= 10 and changed[:, 0].max() < 190
+    particles.erase(surface)
+    assert (pygame.surfarray.array2d(surface) == before).all()
+
+
+def test_erase_ignores_other_surface(particles):
+    surface = pygame.Surface((200, 150), 0, 32)
+    other = pygame.Surface((200, 150), 0, 32)
+    other.fill((1, 2, 3))
+    particles.draw_over(surface)
+    particles.erase(other)
+    assert (pygame.surfarray.array2d(other) == other.map_rgb((1, 2, 3))).all()
+    particles.erase(surface)  # сохранённое уже сброшено: ничего не происходит
+
+
+def test_update_frees_dead_slots(particles):
+    alive = particles.count
+    assert alive == 300
+    hits = particles.update(1.0, water_level=0)
+    assert hits is not None and len(hits) == alive
+    assert particles.count == 0
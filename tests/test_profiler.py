@@ -0,0 +1,30 @@
+import pygame
+
+import main
+
+
+def test_frame_budget():
+    assert main.frame_budget_ms(60, 60) == 1000.0 / 60
+    assert main.frame_budget_ms(30, 60) == 1000.0 / 30
+    assert main.frame_budget_ms(0, 120) == 1000.0 / 120  # без ограничения кадров — шаг симуляции
+
+
+def bar_width(profiler, font):
+    surf = profiler._build_overlay(pygame.Surface((10, 10), 0, 32), font)
+    row = 4 + font.get_linesize() * (2 + main.PROFILER_PHASES.index("water_draw")) + font.get_linesize() // 2
+    color = surf.map_rgb(main.PROFILER_COLORS["water_draw"])
+    return sum(1 for x in range(150, surf.get_width()) if surf.get_at_mapped((x, row)) == color)
+
+
+def test_overlay_bars_scale_with_budget():
+    pygame.font.init()
+    font = pygame.font.Font(None, 16)
+    widths = []
+    for budget in (1000.0 / 30, 1000.0 / 60):
+        profiler = main.FrameProfiler(size=8, enabled=True, budget_ms=budget)
+        for _ in range(4):
+            profiler.begin_frame()
+            profiler.add("water_draw", 0.008)  # 8 мс
+        widths.append(bar_width(profiler, font))
+    assert widths == [int(8 / (1000.0 / 30) * 90), int(8 / (1000.0 / 60) * 90)]
+
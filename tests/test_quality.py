@@ -0,0 +1,46 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("auto", None),
+    (0, 0),
+    (2, 2),
+    ("3", 3),
+    (99, len(main.QUALITY_LEVELS) - 1),
+    (-1, 0),
+    ("high", None),
+    (None, None),
+    ([1], None),
+])
+def test_parse_quality(value, expected, capsys):
+    assert main.parse_quality(value) == expected
+    printed = capsys.readouterr().out
+    assert bool(printed) == (expected is None and value != "auto")
+
+
+def feed(governor, ms, windows):
+    changed = []
+    for _ in range(windows * 30):
+        if governor.frame(ms):
+            changed.append(governor.level)
+    return changed
+
+
+def test_governor_steps_down_and_recovers_with_hysteresis():
+    governor = main.QualityGovernor(60, log=None)  # бюджет 16.7 мс: ниже при p90 > 15, выше при p90 < 8.3
+    assert feed(governor, 20.0, 1) == [1]
+    assert feed(governor, 12.0, 5) == []  # между порогами уровень держится
+    assert feed(governor, 5.0, 3) == []
+    assert feed(governor, 5.0, 1) == [0]  # первый возврат — после 4 хороших окон
+    assert feed(governor, 20.0, 1) == [1]
+    assert feed(governor, 5.0, 7) == []  # повторный — вдвое дольше
+    assert feed(governor, 5.0, 1) == [0]
+    assert [change[1] for change in governor.changes] == [1, 0, 1, 0]
+
+
+def test_governor_stops_at_lowest_level():
+    governor = main.QualityGovernor(60, log=None)
+    assert feed(governor, 100.0, 10) == [1, 2, 3]
+    assert governor.settings is main.QUALITY_LEVELS[-1]
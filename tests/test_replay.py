@@ -0,0 +1,47 @@
+import random
+
+import pygame
+import pytest
+
+import main
+import replay
+
+
+def record_session(path, seed, ticks=240):
+    config = dict(main.CONFIG_DEFAULTS)
+    size = (config["screen_width"], config["screen_height"])
+    left_panel = pygame.Rect(0, 0, config["panel_left_width"], size[1])
+    sim = main.Simulation(config, left_panel, size[1], rng=random.Random(seed))
+    recorder = main.ReplayRecorder(str(path), seed, config, size, config["panel_left_width"], 1.0 / config["tick_rate"])
+    for tick in range(ticks):
+        bits = main.INPUT_SEND if tick == 1 else (main.INPUT_UP if tick % 40 < 20 else main.INPUT_RIGHT)
+        recorder.record(bits)
+        sim.step(1.0 / config["tick_rate"], bits)
+    recorder.close(sim)
+    sim.close()
+    return sim
+
+
+@pytest.mark.parametrize("seed", [0, 12345, -7, 2 ** 63 - 1, -2 ** 63])
+def test_header_round_trip(tmp_path, seed):
+    path = tmp_path / "session.rec"
+    record_session(path, seed, ticks=3)
+    loaded = main.Replay.load(str(path))
+    assert loaded.seed == seed
+    assert loaded.size == (main.CONFIG_DEFAULTS["screen_width"], main.CONFIG_DEFAULTS["screen_height"])
+    assert loaded.panel_left_w == main.CONFIG_DEFAULTS["panel_left_width"]
+
+
+def test_replay_reproduces_summary(tmp_path):
+    path = tmp_path / "session.rec"
+    record_session(path, -42)
+    loaded = main.Replay.load(str(path))
+    sim, ticks = replay.run_headless(loaded)
+    assert main.replay_summary(sim, ticks) == loaded.summary
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / "other.rec"
+    path.write_bytes(b"NOTAREC!" + bytes(64))
+    with pytest.raises(ValueError):
+        main.Replay.load(str(path))
@@ -0,0 +1,99 @@
+import json
+import time
+
+import main
+
+
+def record(time, coins, status="game_over", config="cfg-a"):
+    return {"ts": 1.0, "status": status, "time": time, "coins": coins, "artifacts": 0, "drones_lost": 1,
+            "seed": 1, "config": config, "params": {"water_rise_speed": 18}}
+
+
+def make_log(tmp_path, **kwargs):
+    kwargs.setdefault("flush_interval", 100.0)
+    return main.RunLog(str(tmp_path / "runs.jsonl"), str(tmp_path / "runs_index.json"), **kwargs)
+
+
+def test_append_writes_in_background(tmp_path):
+    log = make_log(tmp_path)
+    for i in range(5):
+        log.append(record(10.0 + i, i * 10))
+    assert not (tmp_path / "runs.jsonl").exists()  # до flush_interval — только в памяти
+    log.flush()
+    lines = (tmp_path / "runs.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["coins"] for line in lines] == [0, 10, 20, 30, 40]
+    index = json.loads((tmp_path / "runs_index.json").read_text(encoding="utf-8"))
+    assert index["runs"] == 5
+    assert index["log_bytes"] == (tmp_path / "runs.jsonl").stat().st_size
+    log.close()
+
+
+def test_timed_flush(tmp_path):
+    log = make_log(tmp_path, flush_interval=0.05)
+    log.append(record(3.0, 7))
+    for _ in range(100):
+        if (tmp_path / "runs.jsonl").exists():
+            break
+        time.sleep(0.01)
+    assert (tmp_path / "runs.jsonl").exists()
+    log.close()
+
+
+def test_queries(tmp_path):
+    log = make_log(tmp_path)
+    for t, c in ((5.0, 10), (12.5, 40), (8.0, 20), (30.0, 5)):
+        log.append(record(t, c, config="cfg-b" if c == 5 else "cfg-a"))
+    log.flush()
+    assert log.runs == 4
+    assert [r["time"] for r in log.top(2)] == [30.0, 12.5]
+    assert [r["coins"] for r in log.top(3, "coins")] == [40, 20, 10]
+    assert log.percentile(50, "coins") == 10
+    assert log.percentile(100, "time") == 30.0
+    configs = log.by_config()
+    assert configs["cfg-a"]["runs"] == 3 and configs["cfg-b"]["runs"] == 1
+    assert configs["cfg-a"]["time_max"] == 12.5
+    log.close()
+
+
+def test_index_catches_up_with_log_tail(tmp_path):
+    log = make_log(tmp_path)
+    log.append(record(1.0, 1))
+    log.close()
+    # Журнал дописан, а индекс нет (сбой до его перезаписи), плюс оборванная строка
+    with open(tmp_path / "runs.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps(record(2.0, 2)) + "\n")
+        f.write('{"ts": 1.0, "status"')
+    log = make_log(tmp_path)
+    assert log.runs == 2
+    log.append(record(3.0, 3))
+    log.close()
+    lines = (tmp_path / "runs.jsonl").read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1])["coins"] == 3  # новая запись не склеилась с оборванной
+    assert make_log(tmp_path).runs == 3
+
+
+def test_truncated_log_rebuilds_index(tmp_path):
+    log = make_log(tmp_path)
+    for i in range(3):
+        log.append(record(float(i), i))
+    log.close()
+    first = (tmp_path / "runs.jsonl").read_text(encoding="utf-8").splitlines()[0]
+    (tmp_path / "runs.jsonl").write_text(first + "\n", encoding="utf-8")
+    assert make_log(tmp_path).runs == 1
+
+
+def test_periodic_fsync_without_new_records(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = main.os.fsync
+    monkeypatch.setattr(main.os, "fsync", lambda fd: (synced.append(time.monotonic()), real_fsync(fd)))
+    log = make_log(tmp_path, flush_interval=0.01, fsync_interval=0.1)
+    log.append(record(3.0, 7))
+    # Пачка записана без fsync (интервал ещё не вышел) — поток сам вернётся к fsync
+    for _ in range(200):
+        if synced:
+            break
+        time.sleep(0.01)
+    assert len(synced) == 1
+    time.sleep(0.25)
+    assert len(synced) == 1  # без новых записей fsync не повторяется
+    log.close()
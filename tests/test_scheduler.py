@@ -0,0 +1,39 @@
+import main
+
+
+def test_events_fire_in_time_then_insertion_order():
+    scheduler = main.Scheduler()
+    fired = []
+    scheduler.schedule(2.0, fired.append, "b")
+    scheduler.schedule(1.0, fired.append, "a")
+    scheduler.schedule(2.0, fired.append, "c")
+    scheduler.schedule(5.0, fired.append, "late")
+    assert scheduler.run(0.5) == 0
+    assert scheduler.run(2.0) == 3
+    assert fired == ["a", "b", "c"]
+    assert len(scheduler) == 1
+
+
+def test_cancelled_event_does_not_fire():
+    scheduler = main.Scheduler()
+    fired = []
+    event = scheduler.schedule(1.0, fired.append, "x")
+    scheduler.schedule(1.0, fired.append, "y")
+    scheduler.cancel(event)
+    assert scheduler.run(1.0) == 1
+    assert fired == ["y"]
+    assert len(scheduler) == 0
+
+
+def test_callback_may_schedule_more_events():
+    scheduler = main.Scheduler()
+    fired = []
+
+    def tick(n):
+        fired.append(n)
+        if n < 3:
+            scheduler.schedule(n + 1.0, tick, n + 1)
+
+    scheduler.schedule(1.0, tick, 1)
+    scheduler.run(10.0)
+    assert fired == [1, 2, 3]
@@ -0,0 +1,38 @@
+import pygame
+
+import main
+
+
+def test_query_returns_items_in_touched_cells():
+    grid = main.SpatialGrid(cell_size=100)
+    grid.insert("left", pygame.Rect(10, 10, 50, 50))
+    grid.insert("wide", pygame.Rect(150, 10, 200, 20))  # ячейки x 1..3
+    grid.insert("far", pygame.Rect(900, 900, 10, 10))
+    assert list(grid.query(pygame.Rect(0, 0, 90, 90))) == ["left"]
+    assert list(grid.query(pygame.Rect(320, 0, 5, 5))) == ["wide"]
+    assert set(grid.query(pygame.Rect(0, 0, 400, 100))) == {"left", "wide"}
+    assert len(grid) == 3 and "far" in grid
+
+
+def test_item_spanning_cells_is_reported_once():
+    grid = main.SpatialGrid(cell_size=10)
+    grid.insert("big", pygame.Rect(0, 0, 95, 95))
+    assert list(grid.query(pygame.Rect(0, 0, 100, 100))) == ["big"]
+
+
+def test_remove_and_edges():
+    grid = main.SpatialGrid(cell_size=100)
+    grid.insert("a", pygame.Rect(0, 0, 100, 100))  # правый край 99: только ячейка (0, 0)
+    assert not grid.query(pygame.Rect(100, 0, 10, 10))
+    assert grid.query(pygame.Rect(-50, -50, 60, 60))
+    assert grid.remove("a")
+    assert not grid.remove("a")
+    assert not grid.query(pygame.Rect(0, 0, 100, 100))
+    assert not grid._cells  # пустые ячейки удаляются
+
+
+def test_query_reuses_its_buffer():
+    grid = main.SpatialGrid()
+    grid.insert(1, pygame.Rect(0, 0, 10, 10))
+    first = grid.query(pygame.Rect(0, 0, 10, 10))
+    assert grid.query(pygame.Rect(500, 500, 1, 1)) is first and not first
@@ -0,0 +1,47 @@
+import pytest
+
+import sweep
+
+
+@pytest.mark.parametrize("values, q, expected", [
+    (list(range(1, 21)), 95, 19),
+    (list(range(1, 21)), 50, 10),
+    (list(range(1, 21)), 100, 20),
+    ([1, 2], 50, 1),
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 11)), 95, 10),
+    ([7], 0, 7),
+    ([], 50, 0.0),
+])
+def test_percentile_nearest_rank(values, q, expected):
+    assert sweep.percentile(values, q) == expected
+
+
+def test_summarize():
+    assert sweep.summarize([3, 1, 2, 4]) == {"mean": 2.5, "p50": 2, "p95": 4}
+
+
+@pytest.mark.parametrize("argv", [
+    ["--sessions", "0"],
+    ["--sessions", "-3"],
+    ["--random", "0", "--range", "wind_strength=1:2"],
+    ["--range", "wind_strength=1:2"],
+    ["--grid", "wind_strength=1,x"],
+    ["--random", "2", "--range", "drone_speed_bonus=1:2.5"],
+    ["--grid", "no_such_knob=1"],
+])
+def test_cli_rejects_bad_arguments(argv):
+    with pytest.raises(SystemExit) as exc:
+        sweep.main_cli(argv)
+    assert exc.value.code == 2
+
+
+def test_build_points_is_deterministic():
+    grid = sweep.parse_grid(["wind_strength=1,2"])
+    ranges = sweep.parse_ranges(["water_slow_factor=0.1:0.6", "drone_speed_bonus=0:3"])
+    points = sweep.build_points(grid, ranges, 3, seed=5)
+    assert len(points) == 6
+    assert points == sweep.build_points(grid, ranges, 3, seed=5)
+    for point in points:
+        assert 0.1 <= point["water_slow_factor"] <= 0.6
+        assert isinstance(point["drone_speed_bonus"], int)
@@ -0,0 +1,38 @@
+import pygame
+import pytest
+
+import main
+
+
+@pytest.fixture(scope="module")
+def font():
+    pygame.font.init()
+    return pygame.font.Font(None, 16)
+
+
+def test_hit_returns_same_surface(font):
+    cache = main.TextCache(max_size=4)
+    first = cache.render(font, "Время", True, (255, 255, 255))
+    assert cache.render(font, "Время", True, [255, 255, 255]) is first  # цвет списком — тот же ключ
+    assert cache.render(font, "Время", True, (255, 0, 0)) is not first
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2, "max_size": 4}
+
+
+def test_evicts_least_recently_used(font):
+    cache = main.TextCache(max_size=2)
+    a = cache.render(font, "a", True, (0, 0, 0))
+    cache.render(font, "b", True, (0, 0, 0))
+    assert cache.render(font, "a", True, (0, 0, 0)) is a  # "a" теперь свежее "b"
+    cache.render(font, "c", True, (0, 0, 0))  # вытесняет "b"
+    assert cache.stats()["size"] == 2
+    assert cache.render(font, "a", True, (0, 0, 0)) is a
+    misses = cache.misses
+    cache.render(font, "b", True, (0, 0, 0))
+    assert cache.misses == misses + 1
+
+
+def test_clear(font):
+    cache = main.TextCache()
+    cache.render(font, "x", True, (1, 2, 3))
+    cache.clear()
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,54 @@
+import random
+
+import pygame
+import pytest
+
+import main
+
+
+def reference_gradient(surface, water_rect):
+    """Построчная отрисовка градиента воды, как до кэша."""
+    color_dark = (25, 50, 95)
+    color_surface = (40, 80, 150)
+    for i in range(water_rect.height):
+        t = i / max(water_rect.height, 1)
+        color = tuple(int(d + (s - d) * t) for d, s in zip(color_dark, color_surface))
+        pygame.draw.line(surface, color, (water_rect.x, water_rect.bottom - i), (water_rect.right, water_rect.bottom - i))
+
+
+@pytest.mark.parametrize("depth", [16, 32])
+@pytest.mark.parametrize("numpy", [True, False])
+def test_gradient_matches_per_row_lines(depth, numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(main, "np", None)
+    panel = pygame.Rect(0, 0, 300, 700)
+    water = main.Water(dict(main.CONFIG_DEFAULTS, water_waves=False), panel.height)
+    for level in (525, 300, 650, 100, 699, 1):
+        rect = pygame.Rect(panel.x, level, panel.width, panel.bottom - level)
+        got = pygame.Surface((panel.width + 1, panel.height), 0, depth)
+        want = pygame.Surface((panel.width + 1, panel.height), 0, depth)
+        water._draw_gradient(got, rect, panel)
+        reference_gradient(want, rect)
+        assert pygame.image.tobytes(got, "RGB") == pygame.image.tobytes(want, "RGB"), level
+
+
+def play(waves, seconds=20.0):
+    panel = pygame.Rect(0, 0, 720, 700)
+    sim = main.Simulation(dict(main.CONFIG_DEFAULTS), panel, panel.height, rng=random.Random(4))
+    if waves:
+        sim.water.enable_waves()
+    tick = 0
+    while sim.status == "playing" and sim.time < seconds:
+        sim.step(1.0 / 60, main.INPUT_SEND if tick % 200 == 0 else (main.INPUT_LEFT, main.INPUT_DOWN)[tick // 60 % 2])
+        tick += 1
+    return sim
+
+
+@pytest.mark.skipif(main.np is None, reason="волны считаются на NumPy")
+def test_waves_are_opt_in_and_do_not_change_the_game():
+    headless = play(False)
+    assert headless.water.wave_h is None  # без вида волны не считаются
+    shown = play(True)
+    assert shown.water.wave_h is not None and shown.water.wave_h.any()
+    assert (shown.time, shown.coins_earned, shown.status, shown.water.level) == \
+        (headless.time, headless.coins_earned, headless.status, headless.water.level)